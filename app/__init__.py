@@ -1,22 +1,31 @@
+import os
+
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_moment import Moment
-from .config import Config
+from .config import CONFIGS
+from .replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 moment = Moment()
 
-def create_app():
+def create_app(config_class=None):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    if config_class is None:
+        env = os.getenv("APP_ENV", "development")
+        if env not in CONFIGS:
+            raise RuntimeError(f"Unknown APP_ENV {env!r}; expected one of {', '.join(CONFIGS)}")
+        config_class = CONFIGS[env]
+    app.config.from_object(config_class)
 
     # Init extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, directory=os.path.join(app.config['PROJECT_ROOT'], 'migrations'))
     login_manager.init_app(app)
     moment.init_app(app)
 
@@ -27,29 +36,68 @@ def create_app():
     # Import models
     from app import models
 
+    # WAL, pragmas and the write lane for SQLite, before anything connects
+    from app.sqlite_mode import init_sqlite
+    init_sqlite(app)
+
+    # Reads in @read_only views go to SQLALCHEMY_REPLICA_URI when it's set
+    from app.replica import init_replica
+    init_replica(app)
+
     # User loader
-    @login_manager.user_loader
-    def load_user(user_id):
-        return models.User.query.get(int(user_id))
+    from app.user_cache import load_user
+    login_manager.user_loader(load_user)
 
     # Register blueprints
     from app.routes import main_bp, auth_bp, profile_bp, swaps_bp
     from app.admin import admin_bp  # ADD THIS LINE
+    from app.media import media_bp
+    from app.api import api_bp
+    from app.metrics import metrics_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(profile_bp)
     app.register_blueprint(swaps_bp)
     app.register_blueprint(admin_bp)  # ADD THIS LINE
+    app.register_blueprint(media_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Template helpers
+    from app.images import photo_sources, photo_pending
+    app.add_template_global(photo_sources)
+    app.add_template_global(photo_pending)
+    from app.fragments import cached_fragment
+    app.add_template_global(cached_fragment)
+
+    # Fingerprinted static URLs
+    if app.config['STATIC_FINGERPRINT']:
+        from app.assets import init_assets
+        init_assets(app)
+
+    # ETag / Last-Modified for per-user pages
+    from app.conditional import init_conditional
+    init_conditional(app)
+
+    # Prometheus metrics, merged across worker processes
+    from app.metrics import init_metrics
+    init_metrics(app)
+
+    # Sampled request/SQL profiling behind /admin/performance
+    from app.performance import init_performance
+    init_performance(app)
+
+    # CLI commands
+    from app.cli import register_commands
+    register_commands(app)
 
-    # Create database tables before first request
-    @app.before_request
-    def create_tables():
-        try:
-            db.create_all()
-        except Exception as e:
-            print(f"Database creation failed: {e}")
-            # Continue anyway - tables might already exist
+    # Schema changes happen via `flask db upgrade` / `flask init-db`. Check the
+    # revision once at startup; CLI commands other than `flask run` skip it
+    # so they can still fix the schema.
+    cli = click.get_current_context(silent=True)
+    if app.config['SCHEMA_CHECK'] and (cli is None or cli.info_name == 'run'):
+        from app.schema import verify_schema
+        verify_schema(app)
 
     return app
-app = create_app()
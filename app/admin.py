@@ -4,6 +4,9 @@ from app.models import User, Skill, SwapRequest, db
 from functools import wraps
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
+from app.pagination import paginate_request
+from app.analytics import dashboard_stats
+from app.replica import read_only
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -20,19 +23,7 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    # Calculate stats
-    stats = {
-        'total_users': User.query.count(),
-        'active_swaps': SwapRequest.query.filter_by(status='accepted').count(),
-        'total_skills': Skill.query.count(),
-        'public_users': User.query.filter_by(is_public=True).count(),
-    }
-    
-    # Get registration trends (dummy data for now)
-    stats['registration_dates'] = []
-    stats['registration_counts'] = []
-    stats['top_skills'] = {'labels': [], 'values': []}
-    
+    stats = dashboard_stats(days=30)
     recent_actions = []  # You can expand this later
     
     return render_template('admin/dashboard.html', 
@@ -40,22 +31,42 @@ def dashboard():
                          recent_actions=recent_actions)
 
 @admin_bp.route('/users')
+@read_only
 @login_required
 @admin_required
 def manage_users():
-    users = User.query.all()
+    users = paginate_request(User.query, (User.created_at, User.id))
     return render_template('admin/users.html', users=users)
 
 @admin_bp.route('/skills')
+@read_only
 @login_required
 @admin_required
 def manage_skills():
-    skills = Skill.query.all()
-    return render_template('admin/skills.html', skills=skills)
+    skills = paginate_request(Skill.query, (Skill.id,))
+    counts = Skill.role_counts([skill.id for skill in skills])
+    return render_template('admin/skills.html', skills=skills, counts=counts)
 
 @admin_bp.route('/swaps')
+@read_only
 @login_required
 @admin_required
 def manage_swaps():
-    swaps = SwapRequest.query.all()
+    query = SwapRequest.query.options(db.joinedload(SwapRequest.sender), db.joinedload(SwapRequest.receiver))
+    swaps = paginate_request(query, (SwapRequest.created_at, SwapRequest.id))
     return render_template('admin/swaps.html', swaps=swaps)
+
+@admin_bp.route('/performance')
+@login_required
+@admin_required
+def performance():
+    from app.performance import get_monitor
+
+    monitor = get_monitor()
+    requests, queries = monitor.snapshot()
+    return render_template('admin/performance.html',
+                         monitor=monitor,
+                         sampled=len(requests),
+                         endpoints=monitor.endpoint_summary(requests),
+                         repeated=monitor.repeated_statements(requests),
+                         queries=monitor.slowest_queries(queries))
@@ -0,0 +1,126 @@
+"""Admin dashboard analytics served from the ``daily_stat`` rollup.
+
+Counters are kept current on every flush (see ``_roll_up_daily_stats`` in
+``app.models``), so the dashboard reads a handful of pre-aggregated rows:
+totals are sums over days, charts read a fixed window of days, and neither
+depends on how many users or swaps exist.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models import User, Skill, UserSkill, SwapRequest, DailyStat
+
+SWAP_STATUSES = ('pending', 'accepted', 'rejected', 'completed')
+
+
+def _totals(metrics):
+    rows = db.session.query(DailyStat.metric, db.func.sum(DailyStat.value)).filter(
+        DailyStat.metric.in_(metrics)
+    ).group_by(DailyStat.metric)
+    totals = dict.fromkeys(metrics, 0)
+    totals.update((metric, int(total or 0)) for metric, total in rows)
+    return totals
+
+
+def dashboard_stats(days=30, top=10):
+    """Stat cards, the registration series and top skills for the last ``days`` days."""
+    status_metrics = [f'swaps.status.{status}' for status in SWAP_STATUSES]
+    totals = _totals(['users.registered', 'users.deleted', 'users.public', 'skills.catalog'] + status_metrics)
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    dates = [since + timedelta(days=i) for i in range(days)]
+
+    registered = dict(db.session.query(DailyStat.day, DailyStat.value).filter(
+        DailyStat.metric == 'users.registered', DailyStat.day >= since, DailyStat.key == 0))
+
+    swap_activity = Counter()
+    for metric, value in db.session.query(DailyStat.metric, DailyStat.value).filter(
+            DailyStat.metric.like('swaps.transition.%'), DailyStat.day >= since):
+        swap_activity[metric.rsplit('.', 1)[1]] += value
+    swap_activity['sent'] = sum(value for (value,) in db.session.query(DailyStat.value).filter(
+        DailyStat.metric == 'swaps.created', DailyStat.day >= since))
+
+    popularity = db.func.sum(DailyStat.value)
+    top_rows = db.session.query(DailyStat.key, popularity).filter(
+        DailyStat.metric.in_(['skills.offered', 'skills.wanted']), DailyStat.day >= since
+    ).group_by(DailyStat.key).having(popularity > 0).order_by(popularity.desc(), DailyStat.key).limit(top).all()
+    names = dict(db.session.query(Skill.id, Skill.name).filter(
+        Skill.id.in_([key for key, _ in top_rows]))) if top_rows else {}
+
+    return {
+        'total_users': totals['users.registered'] - totals['users.deleted'],
+        'public_users': totals['users.public'],
+        'total_skills': totals['skills.catalog'],
+        'active_swaps': totals['swaps.status.accepted'],
+        'swaps_by_status': {status: totals[f'swaps.status.{status}'] for status in SWAP_STATUSES},
+        'swap_activity': dict(swap_activity),
+        'days': days,
+        'registration_dates': [d.isoformat() for d in dates],
+        'registration_counts': [registered.get(d, 0) for d in dates],
+        'top_skills': {
+            'labels': [names.get(key, f'#{key}') for key, _ in top_rows],
+            'values': [int(value) for _, value in top_rows],
+        },
+    }
+
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite and a date on Postgres
+    if value is None:
+        return datetime.utcnow().date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def backfill(batch_size=5000):
+    """Rebuild every rollup row from the current tables.
+
+    Transition history isn't stored anywhere else, so existing
+    ``swaps.transition.*`` rows are kept as they are and rebuilt
+    ``swaps.status.*`` counts are attributed to each request's creation
+    day. Run it while writes are quiet: rows written during the rebuild can
+    be counted twice.
+    """
+    deltas = Counter()
+    user_day = db.func.date(User.created_at)
+    for day, count, public in db.session.query(
+            user_day, db.func.count(User.id), db.func.sum(db.case((User.is_public == True, 1), else_=0))
+    ).group_by(user_day):
+        day = _as_date(day)
+        deltas[day, 'users.registered', 0] += count
+        deltas[day, 'users.public', 0] += int(public or 0)
+
+    swap_day = db.func.date(SwapRequest.created_at)
+    for day, status, count in db.session.query(
+            swap_day, SwapRequest.status, db.func.count(SwapRequest.id)
+    ).group_by(swap_day, SwapRequest.status):
+        day = _as_date(day)
+        deltas[day, 'swaps.created', 0] += count
+        deltas[day, f'swaps.status.{status or "pending"}', 0] += count
+
+    entry_day = db.func.date(UserSkill.created_at)
+    for day, role, skill_id, count in db.session.query(
+            entry_day, UserSkill.role, UserSkill.skill_id, db.func.count(UserSkill.id)
+    ).group_by(entry_day, UserSkill.role, UserSkill.skill_id):
+        deltas[_as_date(day), f'skills.{role}', skill_id] += count
+
+    # The catalog has no timestamps; date each skill by its first use
+    first_use = db.session.query(
+        UserSkill.skill_id, db.func.min(UserSkill.created_at).label('first')
+    ).group_by(UserSkill.skill_id).subquery()
+    for first, count in db.session.query(
+            db.func.date(first_use.c.first), db.func.count(Skill.id)
+    ).outerjoin(first_use, first_use.c.skill_id == Skill.id).group_by(db.func.date(first_use.c.first)):
+        deltas[_as_date(first), 'skills.catalog', 0] += count
+
+    db.session.query(DailyStat).filter(
+        ~DailyStat.metric.like('swaps.transition.%')
+    ).delete(synchronize_session=False)
+    items = list(deltas.items())
+    connection = db.session.connection()
+    for i in range(0, len(items), batch_size):
+        DailyStat.add(connection, dict(items[i:i + batch_size]))
+    db.session.commit()
+    return len(items)
@@ -0,0 +1,442 @@
+"""JSON API, version 1.
+
+Read endpoints select only the columns a response needs (``?fields=`` picks
+a subset) and never hydrate ORM objects. Lists use the same keyset cursors
+as the HTML pages: pass ``next``/``prev`` from a response back as
+``?cursor=``. Write endpoints take a JSON body and return the changed
+resource, so a page can update in place instead of reloading.
+
+Authentication is the normal login session. Write endpoints only accept
+``application/json`` bodies, which browsers won't send cross-site without
+a CORS preflight.
+"""
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.images import photo_sources
+from app.models import User, Skill, UserSkill, SwapRequest
+from app.pagination import paginate
+from app.search import get_search
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_LIMIT = 100
+
+USER_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'location': User.location,
+    'bio': User.bio,
+    'availability': User.availability,
+    'photo': User.profile_photo,
+    'created_at': User.created_at,
+}
+USER_DEFAULT_FIELDS = ('id', 'username', 'location', 'availability', 'photo')
+
+REQUEST_FIELDS = {
+    'id': SwapRequest.id,
+    'sender_id': SwapRequest.sender_id,
+    'receiver_id': SwapRequest.receiver_id,
+    'status': SwapRequest.status,
+    'message': SwapRequest.message,
+    'created_at': SwapRequest.created_at,
+    'updated_at': SwapRequest.updated_at,
+}
+REQUEST_DEFAULT_FIELDS = ('id', 'sender_id', 'receiver_id', 'status', 'created_at')
+
+# action -> (who may do it, status it must be in, status afterwards; None deletes)
+SWAP_ACTIONS = {
+    'accept': ('receiver', 'pending', 'accepted'),
+    'reject': ('receiver', 'pending', 'rejected'),
+    'complete': ('either', 'accepted', 'completed'),
+    'cancel': ('sender', 'pending', None),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({'error': error.message}), error.status
+
+
+@api_bp.app_errorhandler(404)
+def handle_not_found(error):
+    # Unknown /api/ URLs never reach the blueprint, so this is registered app-wide
+    if request.path.startswith(api_bp.url_prefix + '/'):
+        return jsonify({'error': 'Not found'}), 404
+    return error
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError('Authentication required', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_admin_required(f):
+    @wraps(f)
+    @api_login_required
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_admin:
+            raise ApiError('Admin privileges required', 403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def json_body():
+    if not request.is_json:
+        raise ApiError('Expected a JSON body (Content-Type: application/json)', 415)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ApiError('Expected a JSON object')
+    return body
+
+
+def selected_fields(available, default):
+    """Names from ``?fields=a,b`` (validated against ``available``), else ``default``."""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    return names
+
+
+def page_limit():
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('ITEMS_PER_PAGE', 20)))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def column_page(columns, names, order_by, filters=(), extra=None):
+    """One keyset page of ``names`` selected straight from ``columns``.
+
+    The sort columns are selected too (the cursor is built from them) but
+    only ``names`` are returned, plus whatever ``extra(rows, items)`` adds.
+    """
+    wanted = {name: columns[name] for name in names}
+    for column in order_by:
+        wanted.setdefault(column.key, column)
+    query = db.session.query(*[column.label(name) for name, column in wanted.items()]).filter(*filters)
+    page = paginate(query, order_by, cursor=request.args.get('cursor'), per_page=page_limit())
+    items = [{name: getattr(row, name) for name in names} for row in page.items]
+    if extra:
+        extra(page.items, items)
+    for item in items:
+        if 'photo' in item:
+            sources = photo_sources(item['photo'], 320)
+            item['photo'] = sources.get('src') if sources else None
+        for name, value in item.items():
+            if hasattr(value, 'isoformat'):
+                item[name] = value.isoformat()
+    return jsonify({'data': items, 'next': page.next_cursor, 'prev': page.prev_cursor})
+
+
+def skills_by_user(user_ids):
+    """``{user_id: {'offered': [...], 'wanted': [...]}}`` from one column-level query."""
+    grouped = {user_id: {'offered': [], 'wanted': []} for user_id in user_ids}
+    if not grouped:
+        return grouped
+    rows = db.session.query(UserSkill.user_id, UserSkill.id, UserSkill.role, Skill.name, Skill.slug).join(
+        Skill, Skill.id == UserSkill.skill_id
+    ).filter(UserSkill.user_id.in_(grouped)).order_by(UserSkill.id)
+    for user_id, entry_id, role, name, slug in rows:
+        grouped[user_id][role].append({'id': entry_id, 'name': name, 'slug': slug})
+    return grouped
+
+
+# ======================
+# Users and skills
+# ======================
+
+@api_bp.route('/users')
+@api_login_required
+def list_users():
+    """Browse/search public users: ``?q=`` username, ``?skill=`` offered or wanted skill."""
+    names = selected_fields(list(USER_FIELDS) + ['skills'], USER_DEFAULT_FIELDS)
+    with_skills = 'skills' in names
+    names = [name for name in names if name != 'skills']
+    if with_skills and 'id' not in names:
+        names.insert(0, 'id')
+
+    filters = [User.is_public == True, User.id != current_user.id]
+    search = get_search()
+    q = request.args.get('q', '').strip()
+    if q:
+        filters.append(search.username_filter(q))
+    skill = request.args.get('skill', '').strip()
+    if skill:
+        skill_ids = [match.id for match in search.search_skills(skill, limit=50)]
+        filters.append(User.id.in_(
+            db.session.query(UserSkill.user_id).filter(UserSkill.skill_id.in_(skill_ids))))
+
+    def add_skills(rows, items):
+        grouped = skills_by_user([item['id'] for item in items])
+        for item in items:
+            item['skills'] = grouped[item['id']]
+
+    return column_page(USER_FIELDS, names, (User.created_at, User.id), filters,
+                       extra=add_skills if with_skills else None)
+
+
+def _visible_user_id(user_id):
+    row = db.session.query(User.id, User.is_public).filter(User.id == user_id).first()
+    if row is None or (not row.is_public and user_id != current_user.id and not current_user.is_admin):
+        raise ApiError('User not found', 404)
+    return row.id
+
+
+@api_bp.route('/users/<int:user_id>')
+@api_login_required
+def get_user(user_id):
+    _visible_user_id(user_id)
+    names = selected_fields(USER_FIELDS, USER_FIELDS)
+    row = db.session.query(*[USER_FIELDS[name].label(name) for name in names]).filter(User.id == user_id).one()
+    item = dict(row._mapping)
+    if 'photo' in item:
+        sources = photo_sources(item['photo'], 320)
+        item['photo'] = sources.get('src') if sources else None
+    if item.get('created_at') is not None:
+        item['created_at'] = item['created_at'].isoformat()
+    return jsonify({'data': item})
+
+
+@api_bp.route('/users/<int:user_id>/skills')
+@api_login_required
+def user_skills(user_id):
+    _visible_user_id(user_id)
+    return jsonify({'data': skills_by_user([user_id])[user_id]})
+
+
+@api_bp.route('/skills', methods=['POST'])
+@api_login_required
+def add_skill():
+    """Add a skill to your profile: ``{"name": "Python", "role": "offered"}``."""
+    body = json_body()
+    name = ' '.join(str(body.get('name') or '').split())
+    role = body.get('role')
+    if not name or len(name) > 100:
+        raise ApiError('name is required (at most 100 characters)')
+    if role not in ('offered', 'wanted'):
+        raise ApiError('role must be "offered" or "wanted"')
+    try:
+        skill = Skill.get_or_create(name)
+        entry = UserSkill.query.filter_by(user_id=current_user.id, role=role, skill_id=skill.id).first()
+        created = entry is None
+        if created:
+            entry = UserSkill(user_id=current_user.id, skill=skill, role=role)
+            db.session.add(entry)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise ApiError('That skill is already on your profile', 409)
+    return jsonify({'data': {'id': entry.id, 'name': skill.name, 'slug': skill.slug, 'role': role}}), (
+        201 if created else 200)
+
+
+@api_bp.route('/skills/<int:entry_id>', methods=['DELETE'])
+@api_login_required
+def delete_skill(entry_id):
+    entry = db.session.get(UserSkill, entry_id)
+    if entry is None or entry.user_id != current_user.id:
+        raise ApiError('Skill not found', 404)
+    db.session.delete(entry)
+    db.session.commit()
+    return '', 204
+
+
+# ======================
+# Swap requests
+# ======================
+
+@api_bp.route('/requests')
+@api_login_required
+def list_requests():
+    """Your swap requests: ``?box=received|sent|all`` and optional ``?status=``."""
+    names = selected_fields(REQUEST_FIELDS, REQUEST_DEFAULT_FIELDS)
+    box = request.args.get('box', 'all')
+    if box == 'received':
+        filters = [SwapRequest.receiver_id == current_user.id]
+    elif box == 'sent':
+        filters = [SwapRequest.sender_id == current_user.id]
+    elif box == 'all':
+        filters = [db.or_(SwapRequest.sender_id == current_user.id, SwapRequest.receiver_id == current_user.id)]
+    else:
+        raise ApiError('box must be "received", "sent" or "all"')
+    status = request.args.get('status')
+    if status:
+        filters.append(SwapRequest.status == status)
+    return column_page(REQUEST_FIELDS, names, (SwapRequest.created_at, SwapRequest.id), filters)
+
+
+def _request_json(swap):
+    return {
+        'id': swap.id,
+        'sender_id': swap.sender_id,
+        'receiver_id': swap.receiver_id,
+        'status': swap.status,
+        'message': swap.message,
+        'created_at': swap.created_at.isoformat() if swap.created_at else None,
+    }
+
+
+@api_bp.route('/requests', methods=['POST'])
+@api_login_required
+def send_request():
+    """Send a swap request: ``{"receiver_id": 7, "message": "..."}``."""
+    body = json_body()
+    receiver_id = body.get('receiver_id')
+    if not isinstance(receiver_id, int):
+        raise ApiError('receiver_id must be a user id')
+    if receiver_id == current_user.id:
+        raise ApiError('You cannot send a swap request to yourself')
+    _visible_user_id(receiver_id)
+    message = body.get('message')
+    if message is not None and (not isinstance(message, str) or len(message) > 500):
+        raise ApiError('message must be a string of at most 500 characters')
+    if SwapRequest.pending_between(current_user.id, receiver_id):
+        raise ApiError('You already have a pending request with this user', 409)
+
+    swap = SwapRequest(sender_id=current_user.id, receiver_id=receiver_id,
+                       message=message.strip() if message else None)
+    db.session.add(swap)
+    db.session.commit()
+    return jsonify({'data': _request_json(swap)}), 201
+
+
+@api_bp.route('/requests/<int:request_id>/<action>', methods=['POST'])
+@api_login_required
+def swap_action(request_id, action):
+    """Accept, reject, complete or cancel a request. The body is ``{}``, but it must be JSON."""
+    json_body()  # a cross-site <form> can't send application/json
+    if action not in SWAP_ACTIONS:
+        raise ApiError('Not found', 404)
+    who, required, new_status = SWAP_ACTIONS[action]
+    swap = db.session.get(SwapRequest, request_id)
+    if swap is None or current_user.id not in (swap.sender_id, swap.receiver_id):
+        raise ApiError('Swap request not found', 404)
+    if (who == 'receiver' and swap.receiver_id != current_user.id) or (
+            who == 'sender' and swap.sender_id != current_user.id):
+        raise ApiError(f'Only the {who} can {action} this request', 403)
+    if swap.status != required:
+        raise ApiError(f'Cannot {action} a request that is {swap.status}', 409)
+
+    data = _request_json(swap)
+    if new_status is None:
+        db.session.delete(swap)
+        data['status'] = 'cancelled'
+    else:
+        swap.status = new_status
+        data['status'] = new_status
+    db.session.commit()
+    return jsonify({'data': data})
+
+
+# ======================
+# Admin
+# ======================
+
+# JSON field -> user column it toggles
+USER_TOGGLES = {'active': 'is_public', 'public': 'is_public', 'admin': 'is_admin'}
+SWAP_STATUSES = ('pending', 'accepted', 'rejected', 'completed')
+
+
+@api_bp.route('/admin/<model>/<int:target_id>/status', methods=['PATCH'])
+@api_admin_required
+def admin_set_status(model, target_id):
+    """``{"active": false}`` hides a user; ``{"status": "rejected"}`` moves a swap."""
+    body = json_body()
+    if model == 'users':
+        changes = {USER_TOGGLES[key]: bool(value) for key, value in body.items() if key in USER_TOGGLES}
+        if not changes:
+            raise ApiError(f"Expected one of: {', '.join(USER_TOGGLES)}")
+        if target_id == current_user.id and changes.get('is_admin') is False:
+            raise ApiError('You cannot remove your own admin rights', 409)
+        obj = db.session.get(User, target_id)
+    elif model == 'swaps':
+        if body.get('status') not in SWAP_STATUSES:
+            raise ApiError(f"status must be one of {', '.join(SWAP_STATUSES)}")
+        changes = {'status': body['status']}
+        obj = db.session.get(SwapRequest, target_id)
+    else:
+        raise ApiError('Not found', 404)
+    if obj is None:
+        raise ApiError('Not found', 404)
+    for column, value in changes.items():
+        setattr(obj, column, value)
+    db.session.commit()
+    return jsonify({'success': True, 'data': {'id': obj.id, **changes}})
+
+
+BULK_ACTIONS = {
+    'users': {
+        'make_public': {'is_public': True},
+        'make_private': {'is_public': False},
+        'delete': None,
+    },
+    'swaps': {
+        'delete': None,
+        **{f'mark_{status}': {'status': status} for status in SWAP_STATUSES},
+    },
+}
+BULK_MODELS = {'users': User, 'swaps': SwapRequest}
+MAX_BULK = 1000
+
+
+@api_bp.route('/admin/bulk-action', methods=['POST'])
+@api_admin_required
+def admin_bulk_action():
+    """``{"model": "users", "action": "make_private", "ids": [1, 2]}``; model defaults to users."""
+    body = json_body()
+    model = body.get('model', 'users')
+    action = body.get('action')
+    if model not in BULK_ACTIONS or action not in BULK_ACTIONS[model]:
+        raise ApiError(f'Unknown action {action!r} for {model}')
+    try:
+        ids = sorted({int(i) for i in body.get('ids') or ()})
+    except (TypeError, ValueError):
+        raise ApiError('ids must be a list of ids')
+    if not ids or len(ids) > MAX_BULK:
+        raise ApiError(f'Select between 1 and {MAX_BULK} items')
+    if model == 'users' and action == 'delete' and current_user.id in ids:
+        raise ApiError('You cannot delete your own account here', 409)
+
+    cls = BULK_MODELS[model]
+    changes = BULK_ACTIONS[model][action]
+    try:
+        # Go through the ORM so flush listeners (rollups, versions, refcounts) see every row
+        objects = cls.query.filter(cls.id.in_(ids)).all()
+        if model == 'users' and changes is None:
+            # Their swaps go with them instead of being left pointing at nobody
+            for swap in SwapRequest.query.filter(db.or_(SwapRequest.sender_id.in_(ids),
+                                                        SwapRequest.receiver_id.in_(ids))):
+                db.session.delete(swap)
+        for obj in objects:
+            if changes is None:
+                db.session.delete(obj)
+            else:
+                for column, value in changes.items():
+                    setattr(obj, column, value)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise ApiError('Some items are still in use and cannot be deleted', 409)
+    return jsonify({'success': True, 'count': len(objects),
+                    'message': f'{action.replace("_", " ").capitalize()}: {len(objects)} {model}'})
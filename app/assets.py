@@ -0,0 +1,166 @@
+"""Fingerprinted, precompressed static assets.
+
+``build_assets`` copies every file under the static folder (except user
+uploads) to ``STATIC_BUILD_DIR`` as ``<name>.<hash><ext>``, where the hash
+is taken from the file's content, and writes ``.gz`` and ``.br`` siblings
+for text formats. A ``manifest.json`` maps each original path to its
+fingerprinted one.
+
+With ``STATIC_FINGERPRINT`` on, ``url_for('static', filename='css/style.css')``
+produces the fingerprinted URL, and those URLs are served with the best
+encoding the client accepts and cached for a year as ``immutable``: a
+changed file gets a new URL, so nothing is ever revalidated. Anything not
+in the manifest falls through to Flask's normal static handling.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml'}
+SKIP_DIRS = {'uploads'}
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def _fingerprinted(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest[:12]}{ext}'
+
+
+def _write_once(target, data):
+    # Content-addressed, so an existing file is already correct
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f'{target}.{os.getpid()}.tmp'  # workers may build at the same time
+    with open(temp, 'wb') as out:
+        out.write(data)
+    os.replace(temp, target)
+
+
+def build_assets(static_folder, build_dir):
+    """Fingerprint and precompress everything in ``static_folder``; returns the manifest."""
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
+        for filename in sorted(files):
+            if filename.startswith('.'):
+                continue
+            source = os.path.join(root, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            built = _fingerprinted(logical, hashlib.sha256(data).hexdigest())
+            target = os.path.join(build_dir, built)
+            _write_once(target, data)
+
+            encodings = []
+            if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+                # mtime=0 keeps the gzip bytes identical between builds
+                compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    compressed['br'] = brotli.compress(data, quality=11)
+                for encoding, body in compressed.items():
+                    if len(body) < len(data):
+                        _write_once(f'{target}.{"gz" if encoding == "gzip" else "br"}', body)
+                        encodings.append(encoding)
+            manifest[logical] = {'path': built, 'encodings': encodings}
+
+    os.makedirs(build_dir, exist_ok=True)
+    _write_manifest(os.path.join(build_dir, MANIFEST), manifest)
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w') as out:
+        json.dump(manifest, out, indent=1, sort_keys=True)
+    os.replace(temp, path)
+
+
+def clean_build(build_dir, manifest):
+    """Delete built files the manifest no longer mentions; returns how many."""
+    keep = {MANIFEST}
+    for entry in manifest.values():
+        keep.add(entry['path'])
+        keep.update(f"{entry['path']}.{'gz' if e == 'gzip' else 'br'}" for e in entry['encodings'])
+    removed = 0
+    for root, _, files in os.walk(build_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if os.path.relpath(path, build_dir).replace(os.sep, '/') not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+class AssetManifest:
+    def __init__(self, build_dir, manifest):
+        self.build_dir = build_dir
+        self.urls = {logical: entry['path'] for logical, entry in manifest.items()}
+        self.built = {entry['path']: entry['encodings'] for entry in manifest.values()}
+
+
+def _fingerprint_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        built = current_app.extensions['assets'].urls.get(values['filename'])
+        if built:
+            values['filename'] = built
+
+
+def init_assets(app):
+    """Build (or load) the manifest and route ``static`` through it."""
+    build_dir = app.config['STATIC_BUILD_DIR']
+    manifest_path = os.path.join(build_dir, MANIFEST)
+    if app.config['STATIC_BUILD_ON_STARTUP'] or not os.path.exists(manifest_path):
+        manifest = build_assets(app.static_folder, build_dir)
+    else:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    app.extensions['assets'] = AssetManifest(build_dir, manifest)
+    app.url_defaults(_fingerprint_url)
+
+    fallback = app.view_functions['static']
+
+    def static(filename):
+        assets = current_app.extensions['assets']
+        encodings = assets.built.get(filename)
+        if encodings is None:
+            return fallback(filename=filename)
+        path = os.path.join(assets.build_dir, filename)
+        mimetype = None
+        encoding = _negotiate(encodings)
+        if encoding:
+            # Type of the original file, not of the .gz/.br sibling
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            path = f"{path}.{'gz' if encoding == 'gzip' else 'br'}"
+        response = send_file(path, mimetype=mimetype, etag=f'{filename}-{encoding or "identity"}',
+                             max_age=ONE_YEAR)
+        if encoding:
+            response.content_encoding = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+
+def _negotiate(available):
+    accepted = request.accept_encodings
+    best = None
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding] > 0:
+            if best is None or accepted[encoding] > accepted[best]:
+                best = encoding
+    return best
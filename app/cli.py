@@ -0,0 +1,274 @@
+"""``flask`` CLI commands, grouped by area and registered in ``create_app``."""
+import json
+import os
+import time
+
+import click
+from flask.cli import AppGroup, with_appcontext
+
+swaps_cli = AppGroup('swaps', help='Swap maintenance and batch jobs.')
+stats_cli = AppGroup('stats', help='Admin dashboard rollups.')
+uploads_cli = AppGroup('uploads', help='Stored upload maintenance.')
+assets_cli = AppGroup('assets', help='Fingerprinted static assets.')
+data_cli = AppGroup('data', help='Bulk import and export of users, skills and swaps.')
+replica_cli = AppGroup('replica', help='Read replica routing.')
+counters_cli = AppGroup('counters', help='Per-user skill and swap totals.')
+
+
+@swaps_cli.command('find-cycles')
+@click.option('--max-length', type=int, default=None, help='Longest circle to search (default SWAP_CYCLE_MAX_LENGTH).')
+@click.option('--min-length', type=int, default=3, show_default=True)
+@click.option('--limit', type=int, default=1000, show_default=True, help='How many of the best circles to keep.')
+@click.option('--budget', type=int, default=20000, show_default=True, help='DFS steps allowed per start user.')
+@click.option('--processes', type=int, default=None, help='Worker processes (default: CPU count).')
+@click.option('--output', type=click.File('w'), default='-', help='JSONL destination (default stdout).')
+def find_cycles_command(max_length, min_length, limit, budget, processes, output):
+    """Search the whole want/offer graph for swap circles, best first."""
+    from flask import current_app
+    from app import db
+    from app.models import User
+    from app.cycles import CsrGraph, batch_find_cycles
+
+    max_length = max_length or current_app.config['SWAP_CYCLE_MAX_LENGTH']
+    started = time.perf_counter()
+    graph = CsrGraph.from_database()
+    click.echo(f'Graph: {len(graph)} users loaded in {time.perf_counter() - started:.1f}s', err=True)
+
+    started = time.perf_counter()
+    cycles = batch_find_cycles(graph, max_length=max_length, min_length=min_length, limit=limit,
+                               budget=budget, processes=processes)
+    click.echo(f'Found {len(cycles)} circles in {time.perf_counter() - started:.1f}s', err=True)
+
+    member_ids = {m for cycle in cycles for m in cycle.members}
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(member_ids))) if member_ids else {}
+    for cycle in cycles:
+        output.write(json.dumps({
+            'members': list(cycle.members),
+            'usernames': [names.get(m) for m in cycle.members],
+            'weights': list(cycle.weights),
+        }) + '\n')
+
+
+@swaps_cli.command('prune-changes')
+@click.option('--older-than-hours', type=float, default=None,
+              help='Keep entries younger than this (default MATCH_LOG_RETENTION_HOURS).')
+def prune_changes_command(older_than_hours):
+    """Delete old user_skill_change entries the match index has already replayed."""
+    from flask import current_app
+    from app.matching import prune_change_log
+
+    if older_than_hours is None:
+        older_than_hours = current_app.config['MATCH_LOG_RETENTION_HOURS']
+    deleted = prune_change_log(older_than_hours)
+    click.echo(f'Deleted {deleted} user_skill_change entries older than {older_than_hours:g}h')
+
+
+@stats_cli.command('backfill')
+def backfill_stats_command():
+    """Rebuild the daily_stat rollup from the users, swaps and skills tables."""
+    from app.analytics import backfill
+
+    started = time.perf_counter()
+    rows = backfill()
+    click.echo(f'Wrote {rows} daily_stat rows in {time.perf_counter() - started:.1f}s')
+
+
+@counters_cli.command('rebuild')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def rebuild_counters_command(batch_size):
+    """Recount every user's skill and swap totals and fix the ones that drifted."""
+    from app.counters import rebuild
+
+    def progress(checked, corrected):
+        click.echo(f'  checked {checked} users, corrected {corrected} so far', err=True)
+
+    started = time.perf_counter()
+    checked, corrected = rebuild(batch_size=batch_size, progress=progress)
+    click.echo(f'Checked {checked} users and corrected {corrected} in {time.perf_counter() - started:.1f}s')
+
+
+@uploads_cli.command('gc')
+@click.option('--grace-hours', type=float, default=None,
+              help='Leave files younger than this alone (default UPLOAD_GC_GRACE_HOURS).')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without touching anything.')
+@click.option('--quarantine', type=click.Path(file_okay=False), default=None,
+              help='Move files into this directory instead of deleting them.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--interval', type=float, default=None,
+              help='Keep running, collecting every INTERVAL minutes.')
+def uploads_gc_command(grace_hours, dry_run, quarantine, batch_size, interval):
+    """Remove uploaded files no user references any more."""
+    from datetime import timedelta
+    from flask import current_app
+    from app import db
+    from app.uploads import collect
+
+    if grace_hours is None:
+        grace_hours = current_app.config['UPLOAD_GC_GRACE_HOURS']
+    verb = 'Would remove' if dry_run else ('Quarantined' if quarantine else 'Removed')
+
+    def progress(report):
+        click.echo(f'  scanned {report.scanned}, {verb.lower()} {report.removed} so far', err=True)
+
+    while True:
+        started = time.perf_counter()
+        report = collect(grace=timedelta(hours=grace_hours), dry_run=dry_run, quarantine_dir=quarantine,
+                         batch_size=batch_size, progress=progress)
+        db.session.remove()
+        click.echo(
+            f'{verb} {report.removed} of {report.scanned} files '
+            f'({report.reclaimed_bytes / (1024 * 1024):.1f} MB); kept {report.kept} in use, '
+            f'{report.too_new} inside the {grace_hours:g}h grace period, {report.failed} failed '
+            f'[{time.perf_counter() - started:.1f}s]'
+        )
+        if interval is None:
+            break
+        time.sleep(interval * 60)
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Delete built files from earlier builds.')
+def build_assets_command(clean):
+    """Fingerprint and precompress the static folder into STATIC_BUILD_DIR."""
+    from flask import current_app
+    from app.assets import brotli, build_assets, clean_build
+
+    build_dir = current_app.config['STATIC_BUILD_DIR']
+    manifest = build_assets(current_app.static_folder, build_dir)
+    click.echo(f'Built {len(manifest)} assets into {build_dir}'
+               + ('' if brotli is not None else ' (gzip only: install Brotli for .br files)'))
+    if clean:
+        click.echo(f'Removed {clean_build(build_dir, manifest)} stale files')
+
+
+def _transfer_options(command):
+    from app.transfer import FORMATS, KINDS
+
+    command = click.option('--restart', is_flag=True,
+                           help='Ignore the checkpoint left by an interrupted run and start over.')(command)
+    command = click.option('--batch-size', type=int, default=1000, show_default=True)(command)
+    command = click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+                           help='File format (default: from the extension, .jsonl or .csv).')(command)
+    return click.argument('kind', type=click.Choice(KINDS))(command)
+
+
+def _run_transfer(run, kind, path, fmt, batch_size, restart, verb):
+    from app.transfer import checkpoint_path
+
+    started = time.perf_counter()
+
+    def progress(report):
+        rate = (report.records - report.resumed_from) / max(time.perf_counter() - started, 1e-6)
+        click.echo(f'  {report.records} records {verb} ({rate:.0f}/s)', err=True)
+
+    try:
+        report = run(kind, path, fmt=fmt, batch_size=batch_size, restart=restart, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    except Exception:
+        if os.path.exists(checkpoint_path(path)):
+            click.echo(f'Stopped; rerun the same command to resume from {checkpoint_path(path)}', err=True)
+        raise
+    if report.resumed_from:
+        click.echo(f'Resumed after record {report.resumed_from}', err=True)
+    for error in report.errors:
+        click.echo(f'  {error}', err=True)
+    return report, time.perf_counter() - started
+
+
+@data_cli.command('import')
+@_transfer_options
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_data_command(kind, path, fmt, batch_size, restart):
+    """Load users, skills or swaps from a JSONL/CSV file.
+
+    Import users first: skills and swaps refer to them by username or email.
+    """
+    from app.transfer import import_records
+
+    report, elapsed = _run_transfer(import_records, kind, path, fmt, batch_size, restart, 'read')
+    click.echo(f'Imported {report.inserted} {kind}; {report.skipped} already present, '
+               f'{report.rejected} rejected [{elapsed:.1f}s]')
+
+
+@data_cli.command('export')
+@_transfer_options
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_data_command(kind, path, fmt, batch_size, restart):
+    """Write users, skills or swaps to a JSONL/CSV file."""
+    from app.transfer import export_records
+
+    report, elapsed = _run_transfer(export_records, kind, path, fmt, batch_size, restart, 'written')
+    click.echo(f'Exported {report.records} {kind} to {path} [{elapsed:.1f}s]')
+
+
+@replica_cli.command('sync')
+@with_appcontext
+def replica_sync_command():
+    """Copy a SQLite primary over a SQLite replica, for trying routing locally.
+
+    Run it again whenever the replica should catch up; in between, the
+    replica lags like a real one would.
+    """
+    import sqlite3
+    from app import db
+    from app.replica import REPLICA_BIND
+
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('SQLALCHEMY_REPLICA_URI is not set.')
+    primary, replica = db.engines[None], db.engines[REPLICA_BIND]
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException('Only SQLite files can be synced; replicate other databases with their own tools.')
+
+    replica.dispose()
+    source, target = sqlite3.connect(primary.url.database), sqlite3.connect(replica.url.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    click.echo(f'Copied {primary.url.database} to {replica.url.database}')
+
+
+@replica_cli.command('status')
+@with_appcontext
+def replica_status_command():
+    """Check that the replica answers, and how far its swap requests trail the primary."""
+    from sqlalchemy.exc import DBAPIError
+    from app import db
+    from app.models import SwapRequest
+    from app.replica import REPLICA_BIND
+
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('SQLALCHEMY_REPLICA_URI is not set.')
+    latest = db.select(db.func.max(SwapRequest.id))
+    with db.engines[None].connect() as primary:
+        newest = primary.execute(latest).scalar() or 0
+    try:
+        with db.engines[REPLICA_BIND].connect() as replica:
+            seen = replica.execute(latest).scalar() or 0
+    except DBAPIError as e:
+        raise click.ClickException(f'Replica unavailable: {e.orig}')
+    click.echo(f'Replica is up; newest swap request {seen} (primary {newest}, {newest - seen} behind)')
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the schema on an empty database, or upgrade an existing one."""
+    from app.schema import init_db
+
+    result = init_db()
+    click.echo('Created all tables and stamped the migration head.' if result == 'created'
+               else 'Database upgraded to the migration head.')
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(swaps_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(data_cli)
+    app.cli.add_command(replica_cli)
+    app.cli.add_command(counters_cli)
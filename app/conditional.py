@@ -0,0 +1,129 @@
+"""Conditional GET for pages built from a handful of users' data.
+
+Every write that changes what a page shows about a user bumps
+``User.version`` and ``User.updated_at`` (see ``_bump_user_versions`` in
+``app.models``). A view reads those with one indexed query, before any of
+its real queries, and ``not_modified`` turns them into an ETag and
+Last-Modified. If the browser's copy is current it gets a 304 with no
+rendering at all; otherwise the validators are attached to the rendered
+page on the way out.
+
+The ETag also covers the URL, the templates and static build this worker
+serves, the viewer's dark-mode setting and the age of the CSRF tokens
+embedded in forms. Pages with flashed messages are never answered with a
+304.
+"""
+import hashlib
+import os
+import time
+
+from flask import Response, current_app, g, request, session
+from werkzeug.http import is_resource_modified
+
+from app import db
+from app.models import User, DailyStat
+
+
+def _page_fingerprint(app):
+    """Hash of the templates and static manifest, so a deploy changes every ETag."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(app.jinja_loader.searchpath[0]):
+        dirs.sort()
+        for filename in sorted(files):
+            with open(os.path.join(root, filename), 'rb') as f:
+                digest.update(filename.encode())
+                digest.update(f.read())
+    assets = app.extensions.get('assets')
+    if assets is not None:
+        digest.update(repr(sorted(assets.urls.items())).encode())
+    return digest.hexdigest()
+
+
+def user_state(*user_ids):
+    """``(token, last_modified)`` for the given users; one primary-key query on the primary.
+
+    The rows are loaded as ``User`` objects with ``populate_existing``, so
+    ``current_user`` and any other of these users already in the session
+    are refreshed from the same read the ETag comes from. Fragment keys,
+    counters and the navbar badge then match the validators, even if the
+    logged-in user was loaded a moment earlier (or from the user cache).
+    """
+    # Always from the primary: in @read_only views a lagging replica would
+    # overwrite current_user, whose permissions load_user read from the primary
+    users = db.session.execute(
+        db.select(User).where(User.id.in_(user_ids)).order_by(User.id)
+        .execution_options(populate_existing=True),
+        bind_arguments={'bind': db.engine},
+    ).scalars().all()
+    token = ','.join(f'{user.id}:{user.version}' for user in users)
+    return token, max((user.updated_at for user in users if user.updated_at), default=None)
+
+
+def swap_state(swaps):
+    """``(token, last_modified)`` for swaps listed with the other party's name.
+
+    Built from the rows already loaded (with ``sender`` and ``receiver``),
+    so it costs no query. Status changes move the swap's ``updated_at``;
+    renames bump the party's version.
+    """
+    parties = [party for swap in swaps for party in (swap.sender, swap.receiver) if party is not None]
+    token = ','.join(f'{swap.id}:{swap.status}:{swap.updated_at}' for swap in swaps)
+    token += '/' + ','.join(f'{party.id}:{party.version}' for party in parties)
+    modified = [row.updated_at for row in (*swaps, *parties) if row.updated_at]
+    return token, max(modified, default=None)
+
+
+def directory_state():
+    """``(token, last_modified)`` for pages listing users in general.
+
+    The newest ``updated_at`` moves on any insert or change; deletions are
+    picked up from the ``users.deleted`` rollup.
+    """
+    newest = db.session.query(db.func.max(User.updated_at)).scalar()
+    deleted = db.session.query(db.func.sum(DailyStat.value)).filter(
+        DailyStat.metric == 'users.deleted').scalar() or 0
+    return f'{newest}:{deleted}', newest
+
+
+def not_modified(*states):
+    """A 304 response if the client's copy of this page is current, else None."""
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        return None
+
+    csrf_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    parts = [
+        current_app.extensions['page_fingerprint'],
+        request.full_path,
+        str(session.get('dark_mode', False)),
+        # Re-render well before embedded CSRF tokens expire
+        str(int(time.time() // (csrf_limit / 2)) if csrf_limit else 0),
+    ]
+    parts.extend(token for token, _ in states)
+    etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    last_modified = max((modified for _, modified in states if modified), default=None)
+
+    g.page_validators = (etag, last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _with_validators(Response(status=304))
+
+
+def _with_validators(response):
+    etag, last_modified = g.page_validators
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Personalised: browsers may keep it but must check back every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def init_conditional(app):
+    app.extensions['page_fingerprint'] = _page_fingerprint(app)
+
+    @app.after_request
+    def add_page_validators(response):
+        if response.status_code == 200 and g.get('page_validators'):
+            _with_validators(response)
+        return response
@@ -0,0 +1,68 @@
+"""Per-user totals stored on ``User``.
+
+Each user row carries how many skills they offer and want, how many pending
+requests they have received and sent, and how many of their swaps were
+completed. ``_count_user_totals`` in ``app.models`` adds every flushed
+change onto them in the same transaction, and the bulk importer in
+``app.transfer`` does the same. Pages and the navigation badge can then read
+them from ``current_user`` instead of counting.
+
+Anything that changes those tables behind the ORM's back (a manual SQL fix,
+a foreign key cascade) makes them drift. ``rebuild`` recounts from the
+skill and swap tables and rewrites the users whose totals are off.
+"""
+from datetime import datetime
+
+from app import db
+from app.models import User, UserSkill, SwapRequest
+
+COUNTERS = ('offered_count', 'wanted_count', 'pending_received_count', 'pending_sent_count', 'completed_count')
+
+
+def _true_counts():
+    """``{counter column: correlated COUNT subquery}`` for the user row being updated."""
+    user = User.__table__
+    skills, swaps = UserSkill.__table__, SwapRequest.__table__
+    pending = db.func.coalesce(swaps.c.status, 'pending') == 'pending'
+
+    def count(table, *conditions):
+        return db.select(db.func.count()).select_from(table).where(*conditions).scalar_subquery()
+
+    return {
+        'offered_count': count(skills, skills.c.user_id == user.c.id, skills.c.role == 'offered'),
+        'wanted_count': count(skills, skills.c.user_id == user.c.id, skills.c.role == 'wanted'),
+        'pending_received_count': count(swaps, swaps.c.receiver_id == user.c.id, pending),
+        'pending_sent_count': count(swaps, swaps.c.sender_id == user.c.id, pending),
+        'completed_count': count(swaps, db.or_(swaps.c.sender_id == user.c.id, swaps.c.receiver_id == user.c.id),
+                                 swaps.c.status == 'completed'),
+    }
+
+
+def rebuild(batch_size=1000, progress=None):
+    """Recount every user's totals; returns ``(users checked, users corrected)``.
+
+    Users are handled ``batch_size`` ids at a time, each batch in its own
+    transaction. A request committed while its batch is being recounted can
+    still leave that user off by one, so run it while writes are quiet, or
+    run it twice.
+    """
+    table = User.__table__
+    counts = _true_counts()
+    drifted = db.or_(*(table.c[column] != counts[column] for column in COUNTERS))
+    checked = corrected = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(db.select(table.c.id).where(table.c.id > last_id)
+                                 .order_by(table.c.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        # Bump the version too: cached fragments show these numbers
+        result = db.session.execute(table.update().where(table.c.id.in_(ids), drifted).values(
+            {**counts, 'version': table.c.version + 1, 'updated_at': datetime.utcnow()}))
+        db.session.commit()
+        checked += len(ids)
+        corrected += result.rowcount
+        last_id = ids[-1]
+        if progress:
+            progress(checked, corrected)
+    return checked, corrected
@@ -0,0 +1,387 @@
+"""Multi-party swap cycles (A -> B -> C -> A) over the want/offer graph.
+
+There is an edge u -> v when v offers a skill that u wants. Rather than
+materialising user-to-user edges (popular skills would make that quadratic),
+graphs expose ``successors``/``predecessors`` through the skill layer:
+u's successors are the offerers of every skill u wants.
+
+``find_cycles`` runs a bounded-length DFS from one start user. Before the
+DFS, a reverse BFS records how many hops each nearby user is from the start.
+That lets the DFS skip any branch that cannot close the cycle within
+``max_length``. ``CsrGraph`` packs the bipartite user/skill structure into
+integer-indexed ``array`` adjacency lists for the offline batch run
+(``flask swaps find-cycles``), and ``MatchIndexGraph`` reuses the worker's
+live match index for the per-user page.
+"""
+import heapq
+import multiprocessing
+from abc import ABC, abstractmethod
+from array import array
+from collections import namedtuple
+
+from flask import current_app
+
+from app import db
+from app.models import User, Skill, UserSkill, SwapRequest
+from app.matching import get_match_index
+
+Cycle = namedtuple('Cycle', 'members weights')
+
+
+def cycle_rank_key(cycle):
+    """Fewer parties first, then the cycle whose weakest link has the most skill options."""
+    return (len(cycle.members), -min(cycle.weights), -sum(cycle.weights), cycle.members)
+
+
+class SwapGraph(ABC):
+    """User -> user edges derived from the bipartite user/skill layer.
+
+    Subclasses supply the four skill-level lookups; node ids are whatever
+    those lookups use.
+    """
+
+    @abstractmethod
+    def wanted_skills(self, user):
+        """Skills ``user`` wants to learn."""
+
+    @abstractmethod
+    def offered_skills(self, user):
+        """Skills ``user`` offers."""
+
+    @abstractmethod
+    def offerers(self, skill):
+        """Users offering ``skill``."""
+
+    @abstractmethod
+    def wanters(self, skill):
+        """Users wanting ``skill``."""
+
+    def successors(self, u):
+        """Users offering something ``u`` wants, generated lazily.
+
+        A popular skill can have thousands of offerers; yielding them as the
+        search consumes them keeps the cost within the search budget.
+        """
+        seen = {u}
+        for skill in self.wanted_skills(u):
+            for v in self.offerers(skill):
+                if v not in seen:
+                    seen.add(v)
+                    yield v
+
+    def edge_weight(self, u, v):
+        """How many skills ``v`` could teach ``u``."""
+        return len(set(self.wanted_skills(u)) & set(self.offered_skills(v)))
+
+    def skill_distances(self, target, depth, floor=None):
+        """Map each skill to how many hops its wanters are from ``target``.
+
+        A user wanting skill ``s`` can get back to ``target`` in
+        ``hops[s]`` hops (1 if ``target`` offers ``s`` itself). Walking the
+        skill layer touches only the wanters of nearby skills, far fewer than
+        the users a user-level BFS would visit in a graph with popular skills.
+        With ``floor``, paths only pass through users above it.
+        """
+        hops = {skill: 1 for skill in self.offered_skills(target)}
+        frontier = list(hops)
+        seen_users = {target}
+        for level in range(2, depth + 1):
+            next_frontier = []
+            for skill in frontier:
+                for p in self.wanters(skill):
+                    if p in seen_users or (floor is not None and p <= floor):
+                        continue
+                    seen_users.add(p)
+                    for offered in self.offered_skills(p):
+                        if offered not in hops:
+                            hops[offered] = level
+                            next_frontier.append(offered)
+            frontier = next_frontier
+        return hops
+
+
+class CsrGraph(SwapGraph):
+    """Compressed adjacency arrays over dense user and skill indices.
+
+    Four CSR pairs are stored: user -> wanted skills, user -> offered skills,
+    skill -> offering users and skill -> wanting users. Node ids inside the
+    graph are dense indices; ``user_ids[i]`` maps back to ``User.id``.
+    """
+
+    def __init__(self, user_ids, wants, offers, offerers, wanters):
+        self.user_ids = user_ids
+        self._wants = wants
+        self._offers = offers
+        self._offerers = offerers
+        self._wanters = wanters
+
+    @staticmethod
+    def _csr(pairs, size):
+        # pairs: iterable of (row, col); returns (indptr, indices) arrays
+        pairs = list(pairs)
+        indptr = array('i', bytes(4 * (size + 1)))
+        for row, _ in pairs:
+            indptr[row + 1] += 1
+        for i in range(size):
+            indptr[i + 1] += indptr[i]
+        indices = array('i', bytes(4 * len(pairs)))
+        cursor = indptr[:size]
+        for row, col in pairs:
+            indices[cursor[row]] = col
+            cursor[row] += 1
+        return indptr, indices
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from ``(user_id, skill_id, role)`` tuples."""
+        user_index = {}
+        skill_index = {}
+        wanted = []
+        offered = []
+        for user_id, skill_id, role in rows:
+            u = user_index.setdefault(user_id, len(user_index))
+            s = skill_index.setdefault(skill_id, len(skill_index))
+            (offered if role == 'offered' else wanted).append((u, s))
+
+        n_users, n_skills = len(user_index), len(skill_index)
+        user_ids = array('i', bytes(4 * n_users))
+        for user_id, u in user_index.items():
+            user_ids[u] = user_id
+        return cls(
+            user_ids,
+            wants=cls._csr(wanted, n_users),
+            offers=cls._csr(offered, n_users),
+            offerers=cls._csr(((s, u) for u, s in offered), n_skills),
+            wanters=cls._csr(((s, u) for u, s in wanted), n_skills),
+        )
+
+    @classmethod
+    def from_database(cls):
+        rows = db.session.query(UserSkill.user_id, UserSkill.skill_id, UserSkill.role).join(
+            User, User.id == UserSkill.user_id
+        ).filter(User.is_public == True).yield_per(10000)
+        return cls.from_rows(rows)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @staticmethod
+    def _row(csr, i):
+        indptr, indices = csr
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def wanted_skills(self, user):
+        return self._row(self._wants, user)
+
+    def offered_skills(self, user):
+        return self._row(self._offers, user)
+
+    def offerers(self, skill):
+        return self._row(self._offerers, skill)
+
+    def wanters(self, skill):
+        return self._row(self._wanters, skill)
+
+
+class MatchIndexGraph(SwapGraph):
+    """The same graph over the worker's live ``MatchIndex``.
+
+    Nodes are plain user and skill ids, so online queries need no build step.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def wanted_skills(self, user):
+        return self.index.user_wants.get(user, ())
+
+    def offered_skills(self, user):
+        return self.index.user_offers.get(user, ())
+
+    def offerers(self, skill):
+        return self.index.offered_by.get(skill, ())
+
+    def wanters(self, skill):
+        return self.index.wanted_by.get(skill, ())
+
+
+def find_cycles(graph, start, max_length=4, min_length=3, canonical_only=False,
+                limit=50, budget=20000):
+    """Cycles through ``start`` with ``min_length``..``max_length`` members.
+
+    With ``canonical_only`` only cycles whose smallest node is ``start`` are
+    returned, so a batch run over every start finds each cycle once.
+    ``budget`` caps DFS steps so hub-heavy neighbourhoods stay bounded.
+    Returns up to ``limit`` best-ranked ``Cycle`` tuples.
+    """
+    floor = start if canonical_only else None
+    # Exact distances back to start are only needed for the last `reach` hops;
+    # a deeper reverse search would cover most of a dense graph for little gain
+    reach = max(1, max_length // 2)
+    skill_hops = graph.skill_distances(start, reach, floor)
+    beyond = reach + 1
+
+    best = []
+    path = [start]
+    on_path = {start}
+    stack = [graph.successors(start)]
+    while stack and budget > 0:
+        step = next(stack[-1], None)
+        if step is None:
+            stack.pop()
+            on_path.discard(path.pop())
+            continue
+        budget -= 1
+        if step in on_path or (floor is not None and step < floor):
+            continue
+        # Taking `step` uses len(path) edges; `remaining` are left to get back
+        remaining = max_length - len(path)
+        hops = min((skill_hops.get(skill, beyond) for skill in graph.wanted_skills(step)), default=beyond)
+        if remaining <= reach and hops > remaining:
+            continue
+        if hops == 1 and len(path) + 1 >= min_length:
+            members = tuple(path) + (step,)
+            weights = tuple(graph.edge_weight(a, b) for a, b in zip(members, members[1:] + members[:1]))
+            best.append(Cycle(members, weights))
+            if len(best) >= limit * 4:
+                best = heapq.nsmallest(limit, best, key=cycle_rank_key)
+        if remaining > 1:
+            path.append(step)
+            on_path.add(step)
+            stack.append(graph.successors(step))
+
+    return heapq.nsmallest(limit, best, key=cycle_rank_key)
+
+
+def cycles_for_user(user_id, max_length=None, limit=20):
+    """Ranked swap cycles through ``user_id`` hydrated for display.
+
+    Returns ``(cycle, links)`` pairs where ``links`` lists
+    ``(learner, teacher, skills)`` for each hop, starting with ``user_id``.
+    Cycles passing through a private profile are dropped.
+    """
+    if max_length is None:
+        max_length = current_app.config['SWAP_CYCLE_MAX_LENGTH']
+    index = get_match_index()
+    cycles = find_cycles(MatchIndexGraph(index), user_id, max_length=max_length, limit=limit * 2)
+
+    member_ids = {m for cycle in cycles for m in cycle.members}
+    users = {u.id: u for u in User.query.filter(User.id.in_(member_ids))}
+    cycles = [c for c in cycles
+              if all(m in users and (users[m].is_public or m == user_id) for m in c.members)][:limit]
+
+    hops = {(a, b) for c in cycles for a, b in zip(c.members, c.members[1:] + c.members[:1])}
+    shared = {(a, b): index.user_wants.get(a, set()) & index.user_offers.get(b, set()) for a, b in hops}
+    skills = {s.id: s for s in Skill.query.filter(Skill.id.in_(set().union(*shared.values())))} if shared else {}
+
+    results = []
+    for cycle in cycles:
+        links = []
+        for a, b in zip(cycle.members, cycle.members[1:] + cycle.members[:1]):
+            named = sorted((skills[i] for i in shared[a, b] if i in skills), key=lambda s: s.normalized_name)
+            links.append((users[a], users[b], named))
+        results.append((cycle, links))
+    return results
+
+
+# ---- offline batch mode ---------------------------------------------------
+
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _search_partition(args):
+    starts, max_length, min_length, limit, budget = args
+    found = []
+    for start in starts:
+        found.extend(find_cycles(_worker_graph, start, max_length=max_length, min_length=min_length,
+                                 canonical_only=True, limit=limit, budget=budget))
+        if len(found) > limit * 4:
+            found = heapq.nsmallest(limit, found, key=cycle_rank_key)
+    return heapq.nsmallest(limit, found, key=cycle_rank_key)
+
+
+def batch_find_cycles(graph, max_length=4, min_length=3, limit=1000, budget=20000,
+                      processes=None, starts=None, chunks_per_process=8):
+    """Best ``limit`` cycles over the whole graph, searched by a process pool.
+
+    Start nodes are dealt out round-robin so hub-heavy regions are spread
+    across workers. Returned cycles hold ``User.id`` values.
+    """
+    starts = list(range(len(graph)) if starts is None else starts)
+    processes = processes or multiprocessing.cpu_count()
+    n_chunks = max(1, processes * chunks_per_process)
+    tasks = [(starts[i::n_chunks], max_length, min_length, limit, budget) for i in range(n_chunks)]
+
+    if processes == 1:
+        _init_worker(graph)
+        partials = map(_search_partition, tasks)
+        results = [c for part in partials for c in part]
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(graph,)) as pool:
+            results = [c for part in pool.imap_unordered(_search_partition, tasks) for c in part]
+
+    best = heapq.nsmallest(limit, results, key=cycle_rank_key)
+    return [Cycle(tuple(graph.user_ids[m] for m in c.members), c.weights) for c in best]
+
+
+# ---- proposing a cycle ----------------------------------------------------
+
+class CycleError(ValueError):
+    pass
+
+
+def propose_cycle(proposer, member_ids):
+    """Send the proposer's own request in a swap circle.
+
+    ``member_ids`` must start with the proposer. Every link u -> v is
+    re-checked against the database (v must still offer something u wants),
+    but only the first one becomes a pending ``SwapRequest``: nobody can send
+    requests in the other members' names. Its message lays out the whole
+    circle, so each member can pass it on with their own request. The caller
+    commits. Returns the new request, or None if it is already pending.
+    """
+    member_ids = [int(m) for m in member_ids]
+    if len(member_ids) < 2 or member_ids[0] != proposer.id or len(set(member_ids)) != len(member_ids):
+        raise CycleError('Invalid swap circle.')
+    if len(member_ids) > current_app.config['SWAP_CYCLE_MAX_LENGTH']:
+        raise CycleError('Swap circle is too long.')
+
+    users = {u.id: u for u in User.query.filter(User.id.in_(member_ids))}
+    if len(users) != len(member_ids) or not all(u.is_public or u.id == proposer.id for u in users.values()):
+        raise CycleError('Someone in this swap circle is no longer available.')
+
+    rows = db.session.query(UserSkill.user_id, UserSkill.skill_id, UserSkill.role).filter(
+        UserSkill.user_id.in_(member_ids)).all()
+    wants = {m: set() for m in member_ids}
+    offers = {m: set() for m in member_ids}
+    for user_id, skill_id, role in rows:
+        (offers if role == 'offered' else wants)[user_id].add(skill_id)
+
+    links = list(zip(member_ids, member_ids[1:] + member_ids[:1]))
+    skill_names = dict(db.session.query(Skill.id, Skill.name).filter(
+        Skill.id.in_(set().union(*wants.values()))))
+
+    steps = []
+    for learner_id, teacher_id in links:
+        shared = wants[learner_id] & offers[teacher_id]
+        if not shared:
+            raise CycleError('This swap circle no longer works: skills have changed.')
+        skills = ', '.join(sorted(skill_names[s] for s in shared))
+        steps.append(f'{users[learner_id].username} learns {skills} from {users[teacher_id].username}')
+
+    receiver_id = member_ids[1]
+    if SwapRequest.pending_between(proposer.id, receiver_id):
+        return None
+    names = ' → '.join(users[m].username for m in member_ids + member_ids[:1])
+    swap = SwapRequest(
+        sender_id=proposer.id,
+        receiver_id=receiver_id,
+        message=f'Swap circle proposed by {proposer.username}: {names}. {"; ".join(steps)}.'
+    )
+    db.session.add(swap)
+    return swap
@@ -0,0 +1,138 @@
+"""Cache for rendered template fragments that depend on a single user.
+
+Templates wrap a fragment in a call block::
+
+    {% call cached_fragment('skills', user) %} ...badges... {% endcall %}
+
+The rendered HTML is stored under the fragment name, the user's id and
+``User.version``, which every skill edit and swap transition bumps (see
+``_bump_user_versions`` in ``app.models``). A write therefore never has
+to find and delete entries: the next render simply asks for a new key, and
+stale versions age out of the LRU (or expire, on Redis).
+
+Views call ``prefetch`` first. It loads the cached fragments for a whole
+page in one round trip and returns the users that missed, so the view only
+runs the queries those fragments need.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import current_app, g
+from markupsafe import Markup
+
+
+class MemoryBackend:
+    """Per-worker LRU of fragment key -> HTML."""
+
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                html = self._entries.get(key)
+                if html is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = html
+        return found
+
+    def set(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Fragments shared by every worker, each kept for ``ttl`` seconds."""
+
+    def __init__(self, client, ttl=86400, prefix='fragment:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: value.decode() for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, html):
+        self.client.set(self.prefix + key, html.encode(), ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+def get_fragment_cache():
+    """The configured backend, or None when fragment caching is off."""
+    extensions = current_app.extensions
+    if 'fragment_cache' not in extensions:
+        config = current_app.config
+        kind = config['FRAGMENT_CACHE']
+        if kind == 'redis':
+            import redis
+            backend = RedisBackend(redis.Redis.from_url(config['FRAGMENT_CACHE_URL']),
+                                   ttl=config['FRAGMENT_CACHE_TTL'])
+        elif kind == 'memory':
+            backend = MemoryBackend(max_size=config['FRAGMENT_CACHE_SIZE'])
+        else:
+            backend = None
+        extensions.setdefault('fragment_cache', backend)
+    return extensions['fragment_cache']
+
+
+def fragment_key(name, user):
+    # The template fingerprint changes on deploy, so edited markup isn't served stale
+    fingerprint = current_app.extensions['page_fingerprint'][:12]
+    return f'{name}:{user.id}:{user.version}:{fingerprint}'
+
+
+def _loaded():
+    if 'fragments' not in g:
+        g.fragments = {}
+    return g.fragments
+
+
+def prefetch(name, users):
+    """Load the ``name`` fragments for ``users``; returns the users without one."""
+    backend = get_fragment_cache()
+    if backend is None:
+        return list(users)
+    keys = {fragment_key(name, user): user for user in users}
+    found = backend.get_many(keys)
+    # Misses are remembered too, so rendering doesn't look them up again
+    _loaded().update((key, found.get(key)) for key in keys)
+    return [user for key, user in keys.items() if key not in found]
+
+
+def cached_fragment(name, user, caller, cache=True):
+    """Template global for ``{% call cached_fragment(name, user) %}``.
+
+    Pass ``cache=False`` to render without storing, e.g. while the fragment
+    shows something that will change without a version bump.
+    """
+    backend = get_fragment_cache()
+    if backend is None or not cache:
+        return caller()
+    key = fragment_key(name, user)
+    loaded = _loaded()
+    if key in loaded:
+        html = loaded[key]
+    else:
+        html = backend.get_many([key]).get(key)
+    if html is None:
+        html = str(caller())
+        backend.set(key, html)
+        loaded[key] = html
+    return Markup(html)
@@ -0,0 +1,308 @@
+"""Profile photo pipeline.
+
+An upload is streamed to disk under a size cap, its header is checked, and
+the request returns straight away. Resizing runs on a shared executor
+(threads by default; Pillow releases the GIL while decoding and encoding)
+and writes every size in ``PHOTO_SIZES`` as WebP and JPEG, each scaled to
+fit a square box without distorting the aspect ratio. Templates render a
+placeholder until the derivatives exist, then let the browser pick the
+smallest one that fits the slot.
+
+``User.profile_photo`` holds the photo's base name: the first 32 hex digits
+of the upload's SHA-256, so identical uploads share one set of files.
+Derivatives are ``<base>-<size>.<ext>`` in the configured storage backend
+(``app.storage``) and never change once written. Values with a file
+extension are photos uploaded before the pipeline and are served as-is.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app, url_for
+
+from app.metrics import UPLOADS, UPLOAD_BYTES
+from app.storage import get_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+    print("Warning: PIL not installed. Profile photo processing disabled.")
+
+# Longest edge in pixels for each derivative, smallest first
+PHOTO_SIZES = {'avatar': 96, 'card': 320, 'full': 1024}
+PHOTO_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+CHUNK_SIZE = 64 * 1024
+
+
+# What derivative_name() produces for a content-addressed photo
+_DERIVATIVE_NAME = re.compile(r'^[0-9a-f]{32}-(?:%s)\.(?:%s)$' % ('|'.join(PHOTO_SIZES), '|'.join(PHOTO_FORMATS)))
+
+
+class PhotoError(ValueError):
+    pass
+
+
+def derivative_name(base, size, ext):
+    return f'{base}-{size}.{ext}'
+
+
+def is_derivative_name(name):
+    """True for the immutable, content-addressed names of finished photo files."""
+    return _DERIVATIVE_NAME.match(name) is not None
+
+
+def marker_name(base):
+    # The largest JPEG is written last, so its presence means the set is complete
+    return derivative_name(base, max(PHOTO_SIZES, key=PHOTO_SIZES.get), 'jpg')
+
+
+def render_derivatives(source_path, out_dir, base, quality=82):
+    """Write every size/format of ``source_path`` into ``out_dir``; runs on the executor.
+
+    Each file is written under a temporary name and renamed into place, so
+    readers never see a partial image. Returns the names written, with
+    ``marker_name(base)`` last. The original is deleted either way, and so
+    is everything written if rendering fails.
+    """
+    written = []
+    try:
+        return _render(source_path, out_dir, base, quality, written)
+    except BaseException:
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        os.remove(source_path)
+
+
+def _render(source_path, out_dir, base, quality, written):
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Flatten transparency onto white; JPEG has no alpha channel
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        image = image.convert('RGB')
+
+        outputs = []
+        for size, edge in sorted(PHOTO_SIZES.items(), key=lambda item: item[1], reverse=True):
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            for ext, fmt in PHOTO_FORMATS.items():
+                outputs.append((derivative_name(base, size, ext), resized, fmt))
+
+        marker = marker_name(base)
+        outputs.sort(key=lambda output: output[0] == marker)
+        for name, resized, fmt in outputs:
+            final_path = os.path.join(out_dir, name)
+            temp_path = f'{final_path}.tmp'
+            written.extend((temp_path, final_path))
+            options = {'quality': quality, 'method': 4} if fmt == 'WEBP' else {'quality': quality, 'optimize': True, 'progressive': True}
+            resized.save(temp_path, format=fmt, **options)
+            os.replace(temp_path, final_path)
+    return [name for name, _, _ in outputs]
+
+
+class PhotoPipeline:
+    """Executor plus the bookkeeping for photos still being processed.
+
+    Uploads are staged and rendered in a private scratch directory, never
+    in storage: the raw original still carries its EXIF data (GPS position
+    included), and storage is publicly served. Only finished derivatives
+    are copied into storage, the marker last.
+    """
+
+    def __init__(self, storage, workers=2, kind='thread'):
+        self.storage = storage
+        self.work_dir = tempfile.mkdtemp(prefix='photos-')  # mode 0700
+        self.kind = kind
+        if kind == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photos')
+        else:
+            self.executor = None  # 'inline': process during the request
+        self._ready = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.logger = current_app.logger
+
+    def claim(self, base):
+        """True if ``base`` still needs processing and this caller should do it."""
+        with self._lock:
+            if base in self._pending:
+                return False
+            self._pending.add(base)
+        # Ask storage rather than the ready cache: `flask uploads gc` may have
+        # removed files this process still remembers
+        exists = self.storage.exists(marker_name(base))
+        if exists:
+            with self._lock:
+                self._pending.discard(base)
+        else:
+            self._ready.discard(base)
+        return not exists
+
+    def submit(self, source_path, base):
+        if self.executor is None:
+            try:
+                names = render_derivatives(source_path, self.work_dir, base)
+            except Exception:
+                with self._lock:
+                    self._pending.discard(base)
+                raise
+            self._store(names, base)
+            return None
+        future = self.executor.submit(render_derivatives, source_path, self.work_dir, base)
+        future.add_done_callback(lambda f: self._finished(f, base))
+        return future
+
+    def _store(self, names, base):
+        try:
+            try:
+                for name in names:
+                    path = os.path.join(self.work_dir, name)
+                    self.storage.put_file(name, path, content_type=mimetypes.guess_type(name)[0])
+            finally:
+                for name in names:
+                    path = os.path.join(self.work_dir, name)
+                    if os.path.exists(path):
+                        os.remove(path)
+            with self._lock:
+                self._ready.add(base)
+        finally:
+            with self._lock:
+                self._pending.discard(base)
+
+    def _finished(self, future, base):
+        error = future.exception()
+        if error is None:
+            try:
+                self._store(future.result(), base)
+                return
+            except Exception as e:
+                error = e
+        with self._lock:
+            self._pending.discard(base)
+        self.logger.error(f"Photo processing error for {base}: {str(error)}")
+
+    def is_ready(self, base):
+        if base in self._ready:
+            return True
+        if self.storage.exists(marker_name(base)):
+            with self._lock:
+                self._ready.add(base)
+            return True
+        return False
+
+
+def get_pipeline():
+    pipeline = current_app.extensions.get('photo_pipeline')
+    if pipeline is None:
+        config = current_app.config
+        pipeline = current_app.extensions.setdefault('photo_pipeline', PhotoPipeline(
+            get_storage(), workers=config['PHOTO_WORKERS'], kind=config['PHOTO_EXECUTOR']))
+    return pipeline
+
+
+def save_upload(file):
+    """Stream ``file`` (a werkzeug ``FileStorage``) to disk and queue resizing.
+
+    Photos are named by a hash of their content, so re-uploading an image
+    anyone has uploaded before reuses the stored derivatives. Returns the
+    name to store in ``User.profile_photo``. Raises ``PhotoError`` for
+    oversized or unreadable uploads.
+    """
+    if Image is None:
+        raise PhotoError('Photo uploads are not available right now.')
+    pipeline = get_pipeline()
+    limit = current_app.config['MAX_PHOTO_BYTES']
+    temp_path = os.path.join(pipeline.work_dir, f'{secrets.token_hex(8)}.upload')
+
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(temp_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > limit:
+                    raise PhotoError(f'Photos must be smaller than {limit // (1024 * 1024)} MB.')
+                digest.update(chunk)
+                out.write(chunk)
+        if not written:
+            raise PhotoError('The uploaded file is empty.')
+        # Header-only check: cheap, and rejects non-images before they're queued
+        try:
+            with Image.open(temp_path) as image:
+                if image.format not in ACCEPTED_FORMATS:
+                    raise PhotoError('Please upload a JPEG, PNG, GIF or WebP image.')
+        except (OSError, Image.DecompressionBombError):
+            raise PhotoError('That file is not an image we can read.')
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        UPLOADS.inc(result='rejected')
+        raise
+
+    UPLOAD_BYTES.inc(written)
+    base = digest.hexdigest()[:32]
+    if not pipeline.claim(base):
+        # Already stored, or being processed for an identical upload
+        os.remove(temp_path)
+        UPLOADS.inc(result='duplicate')
+        return base
+    UPLOADS.inc(result='stored')
+    source_path = os.path.join(pipeline.work_dir, f'{base}.upload')
+    os.replace(temp_path, source_path)
+    pipeline.submit(source_path, base)
+    return base
+
+
+def photo_url(name):
+    storage = get_storage()
+    return storage.public_url(name) or url_for('media.file', name=name)
+
+
+def photo_pending(photo):
+    """True while ``photo``'s derivatives are still being made."""
+    return bool(photo) and '.' not in photo and not get_pipeline().is_ready(photo)
+
+
+def photo_sources(photo, slot_px):
+    """What a template needs to render ``photo`` in a ``slot_px``-wide slot.
+
+    Returns ``None`` for no photo, ``{'pending': True}`` while derivatives
+    are being made, otherwise ``src`` (smallest JPEG that fits) plus
+    ``webp_srcset``/``jpg_srcset`` so high-DPI screens can choose larger.
+    """
+    if not photo:
+        return None
+    if '.' in photo:
+        return {'src': url_for('static', filename=f'uploads/{photo}')}
+    if not get_pipeline().is_ready(photo):
+        return {'pending': True}
+
+    sizes = sorted(PHOTO_SIZES.items(), key=lambda item: item[1])
+    fit = next((size for size, edge in sizes if edge >= slot_px), sizes[-1][0])
+
+    def srcset(ext):
+        return ', '.join(f'{photo_url(derivative_name(photo, size, ext))} {edge}w' for size, edge in sizes)
+
+    return {
+        'src': photo_url(derivative_name(photo, fit, 'jpg')),
+        'webp_srcset': srcset('webp'),
+        'jpg_srcset': srcset('jpg'),
+        'sizes': f'{slot_px}px',
+    }
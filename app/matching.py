@@ -0,0 +1,201 @@
+"""Reciprocal skill matching.
+
+``MatchIndex`` is an inverted index from each catalog skill to the users who
+offer it and the users who want it. Finding partners for a user walks only
+the posting lists of that user's own skills, so a lookup costs roughly the
+number of candidates rather than the number of users.
+
+The index lives in worker memory and is kept current incrementally: every
+user_skill write is recorded in ``UserSkillChange`` on flush, and each
+lookup first replays the entries it hasn't seen yet.
+
+``flask swaps prune-changes`` deletes log entries older than
+``MATCH_LOG_RETENTION_HOURS``. A worker that hasn't synced for half that
+long might have missed pruned entries, so it rebuilds instead of replaying.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from collections import defaultdict, namedtuple
+
+from flask import current_app
+
+from app import db
+from app.models import User, Skill, UserSkill, UserSkillChange
+
+# Log ids come from a sequence, so a transaction can commit a lower id after a
+# higher one has been seen. Re-reading this many ids behind the high-water
+# mark catches those late arrivals.
+SYNC_LOOKBACK = 100
+
+_Match = namedtuple('Match', 'user_id gives gets')
+
+
+class Match(_Match):
+    """A candidate partner.
+
+    ``gives`` are skills they offer that I want; ``gets`` are skills I offer
+    that they want.
+    """
+    __slots__ = ()
+
+    @property
+    def score(self):
+        # Harmonic mean of the two overlaps: zero unless the swap works both
+        # ways, and highest when both sides are large and balanced
+        gives, gets = len(self.gives), len(self.gets)
+        return 2 * gives * gets / (gives + gets) if gives and gets else 0.0
+
+    @property
+    def is_mutual(self):
+        return bool(self.gives and self.gets)
+
+    def sort_key(self):
+        return (-self.score, -(len(self.gives) + len(self.gets)), self.user_id)
+
+
+class MatchIndex:
+    """skill -> offering/wanting users, plus the reverse user -> skills maps."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.offered_by = defaultdict(set)
+        self.wanted_by = defaultdict(set)
+        self.user_offers = defaultdict(set)
+        self.user_wants = defaultdict(set)
+        self._last_change_id = None
+        self._recent_ids = set()
+        self._synced_at = 0.0
+
+    def _maps(self, role):
+        if role == 'offered':
+            return self.offered_by, self.user_offers
+        return self.wanted_by, self.user_wants
+
+    def add(self, user_id, skill_id, role):
+        by_skill, by_user = self._maps(role)
+        by_skill[skill_id].add(user_id)
+        by_user[user_id].add(skill_id)
+
+    def remove(self, user_id, skill_id, role):
+        by_skill, by_user = self._maps(role)
+        by_skill[skill_id].discard(user_id)
+        by_user[user_id].discard(skill_id)
+        if not by_skill[skill_id]:
+            del by_skill[skill_id]
+        if not by_user[user_id]:
+            del by_user[user_id]
+
+    def build(self):
+        """Load every user_skill row. Only needed once per worker."""
+        with self._lock:
+            # Read the log position first: changes racing with the load get
+            # replayed afterwards, and add/remove are idempotent
+            self._last_change_id = db.session.query(db.func.max(UserSkillChange.id)).scalar() or 0
+            self._recent_ids = set(range(self._last_change_id - SYNC_LOOKBACK, self._last_change_id + 1))
+            self.offered_by.clear()
+            self.wanted_by.clear()
+            self.user_offers.clear()
+            self.user_wants.clear()
+            rows = db.session.query(UserSkill.user_id, UserSkill.skill_id, UserSkill.role).yield_per(10000)
+            for user_id, skill_id, role in rows:
+                self.add(user_id, skill_id, role)
+            self._synced_at = time.monotonic()
+
+    def sync(self):
+        """Apply user_skill changes recorded since the last sync or build."""
+        with self._lock:
+            stale_after = current_app.config['MATCH_LOG_RETENTION_HOURS'] * 3600 / 2
+            if self._last_change_id is None or time.monotonic() - self._synced_at > stale_after:
+                self.build()
+                return
+            changes = db.session.query(UserSkillChange).filter(
+                UserSkillChange.id > self._last_change_id - SYNC_LOOKBACK
+            ).order_by(UserSkillChange.id).all()
+            for change in changes:
+                if change.id in self._recent_ids:
+                    continue
+                if change.added:
+                    self.add(change.user_id, change.skill_id, change.role)
+                else:
+                    self.remove(change.user_id, change.skill_id, change.role)
+                self._recent_ids.add(change.id)
+                self._last_change_id = max(self._last_change_id, change.id)
+            floor = self._last_change_id - SYNC_LOOKBACK
+            self._recent_ids = {i for i in self._recent_ids if i > floor}
+            self._synced_at = time.monotonic()
+
+    def matches_for(self, user_id):
+        """Every user who complements ``user_id`` on at least one side, best first."""
+        gives = defaultdict(set)
+        gets = defaultdict(set)
+        for skill_id in self.user_wants.get(user_id, ()):
+            for other in self.offered_by.get(skill_id, ()):
+                gives[other].add(skill_id)
+        for skill_id in self.user_offers.get(user_id, ()):
+            for other in self.wanted_by.get(skill_id, ()):
+                gets[other].add(skill_id)
+
+        candidates = (gives.keys() | gets.keys()) - {user_id}
+        matches = [Match(other, frozenset(gives.get(other, ())), frozenset(gets.get(other, ())))
+                   for other in candidates]
+        matches.sort(key=Match.sort_key)
+        return matches
+
+
+def get_match_index():
+    """This worker's match index, brought up to date with the change log."""
+    index = current_app.extensions.get('match_index')
+    if index is None:
+        index = current_app.extensions.setdefault('match_index', MatchIndex())
+    index.sync()
+    return index
+
+
+def prune_change_log(older_than_hours):
+    """Delete user_skill_change entries older than ``older_than_hours``; returns how many.
+
+    The newest SYNC_LOOKBACK entries always stay, so log ids keep rising
+    (SQLite reuses ids past the highest row left in a table).
+    """
+    newest = db.session.query(db.func.max(UserSkillChange.id)).scalar()
+    if newest is None:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    deleted = UserSkillChange.query.filter(
+        UserSkillChange.created_at < cutoff, UserSkillChange.id <= newest - SYNC_LOOKBACK
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def best_matches(user, limit=20, mutual_only=False):
+    """Ranked matches for ``user`` hydrated for display.
+
+    Returns ``(match, partner, gives_skills, gets_skills)`` tuples for public
+    users only, with the skill lists as ``Skill`` rows sorted by name.
+    """
+    ranked = get_match_index().matches_for(user.id)
+    if mutual_only:
+        ranked = [m for m in ranked if m.is_mutual]
+
+    results = []
+    position = 0
+    # The index includes private profiles; they're dropped by the is_public
+    # filter below, so fetch in chunks until the page fills
+    while len(results) < limit and position < len(ranked):
+        chunk = ranked[position:position + limit * 2]
+        position += len(chunk)
+        users = {u.id: u for u in User.query.filter(
+            User.id.in_([m.user_id for m in chunk]), User.is_public == True
+        )}
+        chunk = [m for m in chunk if m.user_id in users][:limit - len(results)]
+        skill_ids = set().union(*(m.gives | m.gets for m in chunk)) if chunk else set()
+        skills = {s.id: s for s in Skill.query.filter(Skill.id.in_(skill_ids))}
+
+        def named(ids):
+            return sorted((skills[i] for i in ids if i in skills), key=lambda s: s.normalized_name)
+
+        for match in chunk:
+            results.append((match, users[match.user_id], named(match.gives), named(match.gets)))
+    return results
@@ -0,0 +1,63 @@
+"""Serving stored uploads.
+
+Stored names are content-addressed and never rewritten, so every response
+is cacheable for a year (``immutable``: browsers don't revalidate on
+reload) and the name itself is a strong ETag. Remote backends with a public
+URL are redirected to; otherwise the object is streamed through the app.
+
+Only finished photo derivatives (``<sha256 prefix>-<size>.<webp|jpg>``) are
+served. Anything else in storage, such as temporary files or photos from
+before content addressing, is a 404 here and can't be cached for a year.
+"""
+import mimetypes
+
+from flask import Blueprint, Response, abort, redirect, request, send_file
+
+from app.images import is_derivative_name
+from app.storage import get_storage
+
+media_bp = Blueprint('media', __name__, url_prefix='/media')
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def _cache_forever(response):
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+@media_bp.route('/<name>')
+def file(name):
+    if not is_derivative_name(name):
+        abort(404)
+    storage = get_storage()
+    if storage.local_root is not None:
+        try:
+            path = storage.path(name)
+        except FileNotFoundError:
+            abort(404)
+        try:
+            response = send_file(path, etag=name, max_age=ONE_YEAR)
+        except FileNotFoundError:
+            abort(404)
+        return _cache_forever(response)
+
+    url = storage.public_url(name)
+    if url:
+        return _cache_forever(redirect(url, code=301))
+
+    # Answer revalidations without fetching the object
+    if name in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(name)
+        return _cache_forever(response)
+    try:
+        body = storage.open(name)
+    except FileNotFoundError:
+        abort(404)
+    response = Response(body, mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                        direct_passthrough=True)
+    response.set_etag(name)
+    return _cache_forever(response.make_conditional(request))
@@ -0,0 +1,440 @@
+"""Prometheus metrics, aggregated across worker processes.
+
+Metrics are declared once at import time (see the bottom of this module)
+and updated from request hooks, pool events, session events and a few
+routes. ``GET /metrics`` renders them in the Prometheus text exposition
+format.
+
+With ``METRICS_DIR`` set, which ``entrypoint.sh`` does for gunicorn, every
+process writes its values into its own memory-mapped files in that
+directory: ``counter_<pid>.db``, ``histogram_<pid>.db`` and
+``gauge_<pid>.db``. Updates are a dict lookup plus a ``struct.pack_into``.
+A scrape, answered by whichever worker gets it, reads every file and adds
+the values up. Counters and histograms of workers that have exited are
+kept, so totals never go backwards. Gauges only count processes that are
+still alive. Empty the directory before the server starts.
+
+Without ``METRICS_DIR`` (``python run.py``), values are kept in memory and
+describe this process only.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter as _Tally, defaultdict
+
+from flask import Blueprint, Response, current_app, g, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import SwapRequest, _previous_value
+
+metrics_bp = Blueprint('metrics', __name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_INITIAL_FILE_SIZE = 64 * 1024
+_registry = []
+
+
+# -- storage -----------------------------------------------------------------
+
+def _entries(data, used):
+    """``(key, value, value offset)`` for every slot in a values file."""
+    position = 8
+    while position < used:
+        (length,) = struct.unpack_from('i', data, position)
+        key = data[position + 4:position + 4 + length].decode()
+        position += 4 + length + (-(4 + length) % 8)
+        (value,) = struct.unpack_from('d', data, position)
+        yield key, value, position
+        position += 8
+
+
+class MmapValues:
+    """Float slots keyed by string in one process's memory-mapped file.
+
+    The first 4 bytes hold how much of the file is in use. Each slot is the
+    key's length, the key (padded to 8 bytes) and a double. New slots are
+    written before the used size is bumped, so readers never see half of one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_FILE_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._positions = {key: position for key, _, position in _entries(self._map, self._used)}
+
+    def _slot(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = key.encode()
+            padding = -(4 + len(encoded)) % 8
+            size = 4 + len(encoded) + padding + 8
+            while self._used + size > self._capacity:
+                self._capacity *= 2
+                self._file.truncate(self._capacity)
+                self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), self._capacity)
+            struct.pack_into(f'i{len(encoded) + padding}sd', self._map, self._used,
+                             len(encoded), encoded, 0.0)
+            position = self._used + 4 + len(encoded) + padding
+            self._used += size
+            struct.pack_into('i', self._map, 0, self._used)
+            self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._slot(key)
+        (value,) = struct.unpack_from('d', self._map, position)
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def set(self, key, value):
+        struct.pack_into('d', self._map, self._slot(key), value)
+
+    @staticmethod
+    def read(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < 8:
+            return {}
+        used = struct.unpack_from('i', data, 0)[0]
+        return {key: value for key, value, _ in _entries(data, used)}
+
+
+class MemoryValues:
+    """Single-process stand-in for ``MmapValues``."""
+
+    def __init__(self):
+        self.values = defaultdict(float)
+
+    def add(self, key, amount):
+        self.values[key] += amount
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class _Store:
+    """Routes each update to this process's file for the metric's kind."""
+
+    KINDS = ('counter', 'histogram', 'gauge')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.directory = None
+        self._pid = None
+        self._values = {}
+
+    def configure(self, directory):
+        with self._lock:
+            self.directory = directory
+            self._pid = None
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _current(self, kind):
+        pid = os.getpid()
+        if pid != self._pid:
+            # First use, or first use after a fork: never write to the parent's files
+            self._pid = pid
+            self._values = {}
+        values = self._values.get(kind)
+        if values is None:
+            if self.directory:
+                values = MmapValues(os.path.join(self.directory, f'{kind}_{pid}.db'))
+            else:
+                values = MemoryValues()
+            self._values[kind] = values
+        return values
+
+    def add(self, kind, key, amount):
+        with self._lock:
+            self._current(kind).add(key, amount)
+
+    def set(self, kind, key, value):
+        with self._lock:
+            self._current(kind).set(key, value)
+
+    def collect(self):
+        """Merged ``{kind: {key: value}}`` over every process that wrote here."""
+        merged = {kind: defaultdict(float) for kind in self.KINDS}
+        if not self.directory:
+            with self._lock:
+                for kind in self.KINDS:
+                    values = self._current(kind)
+                    merged[kind].update(values.values)
+            return merged
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            kind, _, pid = os.path.basename(path)[:-3].rpartition('_')
+            if kind not in merged:
+                continue
+            if kind == 'gauge' and not _alive(int(pid)):
+                continue
+            for key, value in MmapValues.read(path).items():
+                merged[kind][key] += value
+        return merged
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def mark_process_dead(pid, directory=None):
+    """Drop an exited worker's gauges; call from gunicorn's ``child_exit`` hook."""
+    directory = directory or _store.directory
+    if directory:
+        try:
+            os.remove(os.path.join(directory, f'gauge_{pid}.db'))
+        except FileNotFoundError:
+            pass
+
+
+_store = _Store()
+
+
+# -- metric types --------------------------------------------------------------
+
+class _Metric:
+    kind = None
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, suffix, labels, extra=()):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        pairs = [(name, str(labels[name])) for name in self.labelnames] + list(extra)
+        return json.dumps([self.name + suffix, pairs], separators=(',', ':'))
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _store.add(self.kind, self._key('_total', labels), amount)
+
+
+class Gauge(_Metric):
+    """A value per live process, summed on scrape."""
+    kind = 'gauge'
+    type_name = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        _store.add(self.kind, self._key('', labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        _store.set(self.kind, self._key('', labels), value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        # Stored per bucket, not cumulative: one slot changes per observation
+        bound = next((b for b in self.buckets if value <= b), float('inf'))
+        _store.add(self.kind, self._key('_bucket', labels, [('le', _format_value(bound))]), 1)
+        _store.add(self.kind, self._key('_sum', labels), value)
+        _store.add(self.kind, self._key('_count', labels), 1)
+
+
+# -- exposition ----------------------------------------------------------------
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample_line(name, pairs, value):
+    labels = ','.join(f'{key}="{_escape(val)}"' for key, val in pairs)
+    return f'{name}{{{labels}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}'
+
+
+def render():
+    """Every registered metric in the Prometheus text format, version 0.0.4."""
+    merged = _store.collect()
+    samples = defaultdict(list)
+    for kind, values in merged.items():
+        for key, value in values.items():
+            name, pairs = json.loads(key)
+            samples[name].append((tuple(tuple(pair) for pair in pairs), value))
+
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {metric.name} {metric.type_name}')
+        if isinstance(metric, Histogram):
+            lines.extend(_histogram_lines(metric, samples))
+            continue
+        suffix = '_total' if isinstance(metric, Counter) else ''
+        for pairs, value in sorted(samples.get(metric.name + suffix, ())):
+            lines.append(_sample_line(metric.name + suffix, pairs, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, samples):
+    buckets = defaultdict(_Tally)
+    for pairs, value in samples.get(metric.name + '_bucket', ()):
+        labels = tuple(pair for pair in pairs if pair[0] != 'le')
+        bound = dict(pairs)['le']
+        buckets[labels][float(bound)] += value
+    sums = dict(samples.get(metric.name + '_sum', ()))
+    counts = dict(samples.get(metric.name + '_count', ()))
+    for labels in sorted(buckets):
+        cumulative = 0
+        for bound in metric.buckets + (float('inf'),):
+            cumulative += buckets[labels].get(bound, 0)
+            yield _sample_line(metric.name + '_bucket', labels + (('le', _format_value(bound)),), cumulative)
+        yield _sample_line(metric.name + '_sum', labels, sums.get(labels, 0.0))
+        yield _sample_line(metric.name + '_count', labels, counts.get(labels, 0))
+
+
+# -- the metrics -------------------------------------------------------------
+
+REQUEST_LATENCY = Histogram('skillswap_http_request_duration_seconds',
+                            'Time to handle a request, by endpoint.', ['endpoint'])
+REQUESTS = Counter('skillswap_http_requests', 'Requests handled, by endpoint and status code.',
+                   ['endpoint', 'status'])
+IN_FLIGHT = Gauge('skillswap_http_requests_in_flight', 'Requests being handled right now.')
+POOL_WAIT = Histogram('skillswap_db_pool_checkout_seconds',
+                      'Time to get a database connection from the pool.',
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+POOL_SIZE = Gauge('skillswap_db_pool_size', 'Connections the pool keeps open.')
+POOL_CHECKED_OUT = Gauge('skillswap_db_pool_checked_out', 'Connections currently in use.')
+LOGINS = Counter('skillswap_logins', 'Login attempts, by result.', ['result'])
+REGISTRATIONS = Counter('skillswap_registrations', 'Accounts created through the sign-up form.')
+SWAP_TRANSITIONS = Counter('skillswap_swap_transitions', 'Swap request status changes.', ['from_status', 'to_status'])
+UPLOAD_BYTES = Counter('skillswap_upload_bytes', 'Bytes of accepted photo uploads.')
+UPLOADS = Counter('skillswap_uploads', 'Photo uploads, by result.', ['result'])
+
+
+# -- hooks -------------------------------------------------------------------
+
+def _request_started():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _request_finished(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    IN_FLIGHT.dec()
+    endpoint = request.endpoint or 'unmatched'  # unrouted paths would explode the label set
+    REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=g.pop('metrics_status', 500))
+
+
+def _timed_pool_class(cls):
+    """``cls`` with checkouts timed into ``POOL_WAIT``."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return cls._do_get(self)
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+    # No new slots, so existing pools can switch to it in place
+    return type(f'Timed{cls.__name__}', (cls,), {'__slots__': (), '_do_get': _do_get, 'timed_checkout': True})
+
+
+def _instrument_pool(engine):
+    pool = engine.pool
+    if not getattr(pool, 'timed_checkout', False):
+        # recreate() after dispose() builds the same class, so this sticks
+        pool.__class__ = _timed_pool_class(type(pool))
+
+    def update(*_):
+        # Only QueuePool reports these; SQLite's other pools don't
+        pool = engine.pool
+        if callable(getattr(pool, 'checkedout', None)):
+            POOL_CHECKED_OUT.set(pool.checkedout())
+        if callable(getattr(pool, 'size', None)):
+            POOL_SIZE.set(pool.size())
+
+    event.listen(engine, 'checkout', update)
+    event.listen(engine, 'checkin', update)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_swap_transitions(session, flush_context):
+    transitions = _Tally()
+    for obj in session.new:
+        if isinstance(obj, SwapRequest):
+            transitions['new', obj.status or 'pending'] += 1
+    for obj in session.deleted:
+        if isinstance(obj, SwapRequest):
+            transitions[_previous_value(inspect(obj), 'status'), 'deleted'] += 1
+    for obj in session.dirty:
+        if isinstance(obj, SwapRequest) and session.is_modified(obj, include_collections=False):
+            old = _previous_value(inspect(obj), 'status')
+            if old != obj.status:
+                transitions[old, obj.status] += 1
+    if transitions:
+        session.info.setdefault('swap_transitions', _Tally()).update(transitions)
+
+
+@event.listens_for(Session, 'after_commit')
+def _count_swap_transitions(session):
+    for (old, new), count in session.info.pop('swap_transitions', {}).items():
+        SWAP_TRANSITIONS.inc(count, from_status=old, to_status=new)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_swap_transitions(session):
+    session.info.pop('swap_transitions', None)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    _store.configure(app.config['METRICS_DIR'])
+    app.before_request_funcs.setdefault(None, []).insert(0, _request_started)
+    app.after_request(_record_status)
+    app.teardown_request(_request_finished)
+    with app.app_context():
+        _instrument_pool(db.engine)
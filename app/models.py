@@ -1,5 +1,5 @@
 # from datetime import datetime
-# from app import db, login_manager
+# from app import db
 # from flask_login import UserMixin
 # from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -92,16 +92,28 @@
 
 #     # Your existing relationships and methods...
 
+import re
+from collections import Counter
 from datetime import datetime
-from app import db, login_manager
+from functools import partial
+from app import db
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
 class User(UserMixin, db.Model):
     """User model with authentication and profile details."""
     __tablename__ = 'user'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Browse, search and the admin user list page newest first
+        db.Index('ix_user_created', 'created_at', 'id'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True, nullable=False)
@@ -114,10 +126,27 @@ class User(UserMixin, db.Model):
     bio = db.Column(db.Text, nullable=True)
     availability = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever anything shown about this user changes: the row itself,
+    # their skills, or a swap request they're part of (see _bump_user_versions)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Denormalized totals, kept in step on flush by _count_user_totals so
+    # pages and badges read them off the loaded user; `flask counters
+    # rebuild` recomputes them from the skill and swap tables
+    offered_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    wanted_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    pending_received_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    pending_sent_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
-    skills_offered = db.relationship('Skill', backref='offered_by', foreign_keys='Skill.offered_by_id', lazy='dynamic')
-    skills_wanted = db.relationship('Skill', backref='wanted_by', foreign_keys='Skill.wanted_by_id', lazy='dynamic')
+    skills = db.relationship('UserSkill', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    skills_offered = db.relationship(
+        'UserSkill', primaryjoin="and_(User.id == UserSkill.user_id, UserSkill.role == 'offered')",
+        lazy='dynamic', viewonly=True)
+    skills_wanted = db.relationship(
+        'UserSkill', primaryjoin="and_(User.id == UserSkill.user_id, UserSkill.role == 'wanted')",
+        lazy='dynamic', viewonly=True)
     sent_swap_requests = db.relationship('SwapRequest', foreign_keys='SwapRequest.sender_id', backref='sender', lazy='dynamic')
     received_swap_requests = db.relationship('SwapRequest', foreign_keys='SwapRequest.receiver_id', backref='receiver', lazy='dynamic')
 
@@ -134,48 +163,496 @@ class User(UserMixin, db.Model):
     
     @property
     def offered_skills(self):
-        return Skill.query.filter_by(offered_by_id=self.id).all()
+        return UserSkill.query.filter_by(user_id=self.id, role='offered').order_by(UserSkill.id).all()
 
     @property
     def wanted_skills(self):
-        return Skill.query.filter_by(wanted_by_id=self.id).all()
+        return UserSkill.query.filter_by(user_id=self.id, role='wanted').order_by(UserSkill.id).all()
+
+    @staticmethod
+    def add_to_counters(connection, deltas):
+        """Add ``{(user_id, counter column): delta}`` onto the stored counters.
+
+        Users that get the same changes share one UPDATE.
+        """
+        changes = {}
+        for (user_id, column), delta in deltas.items():
+            if delta and user_id is not None:
+                changes.setdefault(user_id, {})[column] = delta
+        groups = {}
+        for user_id, change in changes.items():
+            groups.setdefault(tuple(sorted(change.items())), []).append(user_id)
+        table = User.__table__
+        for change, user_ids in groups.items():
+            connection.execute(table.update().where(table.c.id.in_(user_ids)).values(
+                {column: table.c[column] + delta for column, delta in change}))
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 
 class Skill(db.Model):
-    """Skills offered/wanted by users."""
+    """Canonical skill catalog entry shared by every user who lists it."""
     __tablename__ = 'skill'
     __table_args__ = {'extend_existing': True}
-    
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    offered_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    wanted_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    availability = db.Column(db.String(100))  # e.g., "Weekends, Evenings"
+    name = db.Column(db.String(100), nullable=False)  # display spelling, first one seen
+    normalized_name = db.Column(db.String(100), index=True, unique=True, nullable=False)
+    slug = db.Column(db.String(120), index=True, unique=True, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def normalize(name):
+        """Catalog key for a skill name: collapsed whitespace, case-folded."""
+        return ' '.join((name or '').split()).casefold()
+
+    @staticmethod
+    def slugify(name):
+        return re.sub(r'[^a-z0-9]+', '-', Skill.normalize(name)).strip('-') or 'skill'
+
+    @classmethod
+    def get_or_create(cls, name):
+        """Return the catalog entry for ``name``, adding it if it is new."""
+        name = ' '.join(name.split())
+        normalized = cls.normalize(name)
+        skill = cls.query.filter_by(normalized_name=normalized).first()
+        if skill:
+            return skill
+
+        base = slug = cls.slugify(name)
+        suffix = 2
+        while cls.query.filter_by(slug=slug).first() is not None:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+
+        skill = cls(name=name, normalized_name=normalized, slug=slug)
+        try:
+            # Savepoint so a concurrent insert of the same name doesn't
+            # roll back the caller's whole transaction
+            with db.session.begin_nested():
+                db.session.add(skill)
+        except IntegrityError:
+            skill = cls.query.filter_by(normalized_name=normalized).one()
+        return skill
+
+    @staticmethod
+    def role_counts(skill_ids):
+        """How many users offer/want each skill, as ``{skill_id: {'offered': n, 'wanted': n}}``."""
+        counts = {skill_id: {'offered': 0, 'wanted': 0} for skill_id in skill_ids}
+        if not counts:
+            return counts
+        rows = db.session.query(UserSkill.skill_id, UserSkill.role, db.func.count()).filter(
+            UserSkill.skill_id.in_(counts)
+        ).group_by(UserSkill.skill_id, UserSkill.role).all()
+        for skill_id, role, count in rows:
+            counts[skill_id][role] = count
+        return counts
 
     def __repr__(self):
         return f'<Skill {self.name}>'
 
 
+class UserSkill(db.Model):
+    """A catalog skill that a user offers or wants."""
+    __tablename__ = 'user_skill'
+    __table_args__ = (
+        # Also serves "this user's offered/wanted skills" lookups
+        db.UniqueConstraint('user_id', 'role', 'skill_id', name='uq_user_skill_user_role_skill'),
+        # "Who offers/wants skill X" lookups
+        db.Index('ix_user_skill_skill_role_user', 'skill_id', 'role', 'user_id'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    skill_id = db.Column(db.Integer, db.ForeignKey('skill.id'), nullable=False)
+    # 'offered' or 'wanted'; old value kept like SwapRequest.status
+    role = db.column_property(db.Column(db.String(10), nullable=False), active_history=True)
+    availability = db.Column(db.String(100))  # e.g., "Weekends, Evenings"
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    skill = db.relationship('Skill', lazy='joined', backref=db.backref('user_skills', lazy='dynamic'))
+
+    @property
+    def name(self):
+        return self.skill.name
+
+    @staticmethod
+    def grouped_by_user(user_ids):
+        """Load offered/wanted skills for many users in a single query.
+
+        Returns a dict mapping each user id to ``{'offered': [...], 'wanted': [...]}``
+        so list pages can render skill badges without a query per user.
+        """
+        grouped = {user_id: {'offered': [], 'wanted': []} for user_id in user_ids}
+        if not grouped:
+            return grouped
+
+        entries = UserSkill.query.filter(
+            UserSkill.user_id.in_(grouped)
+        ).order_by(UserSkill.id).all()
+
+        for entry in entries:
+            grouped[entry.user_id][entry.role].append(entry)
+        return grouped
+
+    def __repr__(self):
+        return f'<UserSkill {self.user_id} {self.role} {self.skill_id}>'
+
+
+class UserSkillChange(db.Model):
+    """Append-only log of user_skill additions and removals.
+
+    Written automatically on flush; in-memory indexes (see app.matching)
+    replay it to stay current across worker processes.
+    """
+    __tablename__ = 'user_skill_change'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    skill_id = db.Column(db.Integer, nullable=False)
+    role = db.Column(db.String(10), nullable=False)
+    added = db.Column(db.Boolean, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserSkillChange {"+" if self.added else "-"}{self.user_id} {self.role} {self.skill_id}>'
+
+
+def _previous_value(state, key):
+    history = state.attrs[key].history
+    return history.deleted[0] if history.deleted else state.attrs[key].value
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_user_skill_changes(session, flush_context):
+    changes = []
+    now = datetime.utcnow()
+
+    def log(user_id, skill_id, role, added):
+        changes.append({'user_id': user_id, 'skill_id': skill_id, 'role': role,
+                        'added': added, 'created_at': now})
+
+    for obj in session.new:
+        if isinstance(obj, UserSkill):
+            log(obj.user_id, obj.skill_id, obj.role, True)
+    for obj in session.deleted:
+        if isinstance(obj, UserSkill):
+            state = inspect(obj)
+            log(_previous_value(state, 'user_id'), _previous_value(state, 'skill_id'),
+                _previous_value(state, 'role'), False)
+    for obj in session.dirty:
+        if isinstance(obj, UserSkill) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            old = (_previous_value(state, 'user_id'), _previous_value(state, 'skill_id'),
+                   _previous_value(state, 'role'))
+            new = (obj.user_id, obj.skill_id, obj.role)
+            if old != new:
+                log(*old, False)
+                log(*new, True)
+
+    if changes:
+        session.connection().execute(UserSkillChange.__table__.insert(), changes)
+
+
 class SwapRequest(db.Model):
     """Swap requests between users."""
     __tablename__ = 'swap_request'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # One user's received/sent requests, newest first (requests page,
+        # dashboard, API); id breaks created_at ties for keyset paging
+        db.Index('ix_swap_request_receiver_created', 'receiver_id', 'created_at', 'id'),
+        db.Index('ix_swap_request_sender_created', 'sender_id', 'created_at', 'id'),
+        # Admin listing of every request
+        db.Index('ix_swap_request_created', 'created_at', 'id'),
+        # Duplicate check before sending; only pending rows are looked up by pair
+        # (see pending_between, which matches this WHERE clause literally)
+        db.Index('ix_swap_request_pending_pair', 'sender_id', 'receiver_id',
+                 sqlite_where=db.text("status = 'pending'"),
+                 postgresql_where=db.text("status = 'pending'")),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     message = db.Column(db.Text)
-    status = db.Column(db.String(20), default='pending')  # 'accepted', 'rejected', 'completed'
+    # 'accepted', 'rejected', 'completed'; active_history keeps the old value
+    # when it's assigned unloaded, for the flush listeners that count transitions
+    status = db.column_property(db.Column(db.String(20), default='pending'), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     feedback = db.Column(db.Text)
 
+    @classmethod
+    def pending_between(cls, sender_id, receiver_id):
+        """The pending request from ``sender_id`` to ``receiver_id``, if any.
+
+        The status is compared to an inline literal rather than a bound
+        parameter so the planner can prove the partial index applies.
+        """
+        return cls.query.filter(
+            cls.sender_id == sender_id,
+            cls.receiver_id == receiver_id,
+            cls.status == db.literal_column("'pending'"),
+        ).first()
+
     def __repr__(self):
         return f'<SwapRequest {self.id}: {self.sender.username} -> {self.receiver.username}>'
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+@event.listens_for(Session, 'after_flush')
+def _bump_user_versions(session, flush_context):
+    user_ids = set()
+    skill_ids = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        if isinstance(obj, User) and obj not in session.new:
+            user_ids.add(obj.id)
+        elif isinstance(obj, UserSkill):
+            user_ids.update((obj.user_id, _previous_value(state, 'user_id')))
+        elif isinstance(obj, SwapRequest):
+            user_ids.update((obj.sender_id, obj.receiver_id,
+                             _previous_value(state, 'sender_id'), _previous_value(state, 'receiver_id')))
+        elif isinstance(obj, Skill) and obj not in session.new:
+            skill_ids.add(obj.id)
+    user_ids.discard(None)
+    if not user_ids and not skill_ids:
+        return
+
+    table = User.__table__
+    condition = table.c.id.in_(user_ids)
+    if skill_ids:
+        # A renamed skill shows up on everyone who lists it
+        condition = db.or_(condition, table.c.id.in_(
+            db.select(UserSkill.__table__.c.user_id).where(UserSkill.__table__.c.skill_id.in_(skill_ids))))
+    session.connection().execute(
+        table.update().where(condition).values(version=table.c.version + 1, updated_at=datetime.utcnow()))
+    # The ORM doesn't see this UPDATE; let the logged-in user cache know
+    session.info.setdefault('bumped_user_ids', set()).update(user_ids)
+
+
+def _swap_counters(sender_id, receiver_id, status):
+    """The ``(user_id, counter column)`` pairs a request with ``status`` counts towards."""
+    if status == 'pending':
+        return [(sender_id, 'pending_sent_count'), (receiver_id, 'pending_received_count')]
+    if status == 'completed':
+        return [(sender_id, 'completed_count'), (receiver_id, 'completed_count')]
+    return []
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_user_totals(session, flush_context):
+    deltas = Counter()
+
+    def count(pairs, amount):
+        for user_id, column in pairs:
+            # A swap whose user was deleted out from under it counts for nobody
+            if user_id is not None:
+                deltas[user_id, column] += amount
+
+    def counters(obj, old=False):
+        value = partial(_previous_value, inspect(obj)) if old else partial(getattr, obj)
+        if isinstance(obj, UserSkill):
+            return [(value('user_id'), f"{value('role')}_count")]
+        return _swap_counters(value('sender_id'), value('receiver_id'), value('status') or 'pending')
+
+    for obj in session.new:
+        if isinstance(obj, (UserSkill, SwapRequest)):
+            count(counters(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, (UserSkill, SwapRequest)):
+            count(counters(obj, old=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, (UserSkill, SwapRequest)) and session.is_modified(obj, include_collections=False):
+            count(counters(obj, old=True), -1)
+            count(counters(obj), 1)
+
+    deltas = {pair: delta for pair, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    User.add_to_counters(session.connection(), deltas)
+    # Keep users already loaded in this session (current_user) in step
+    # without reloading them; unloaded values come fresh from the UPDATE
+    for (user_id, column), delta in deltas.items():
+        user = session.identity_map.get(identity_key(User, user_id))
+        if user is not None and column in inspect(user).dict:
+            set_committed_value(user, column, getattr(user, column) + delta)
+
+
+class DailyStat(db.Model):
+    """Per-day counters behind the admin dashboard.
+
+    ``value`` is the net change to ``metric`` on ``day``; ``key`` narrows a
+    metric (a skill id for the ``skills.*`` metrics, 0 otherwise). Rows are
+    maintained on flush by ``_roll_up_daily_stats`` and rebuilt from scratch
+    with ``flask stats backfill``.
+    """
+    __tablename__ = 'daily_stat'
+    __table_args__ = (
+        db.Index('ix_daily_stat_metric_day', 'metric', 'day'),
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(40), primary_key=True)
+    key = db.Column(db.Integer, primary_key=True, default=0)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def add(connection, deltas):
+        """Add ``{(day, metric, key): delta}`` onto the stored counters."""
+        rows = [{'day': day, 'metric': metric, 'key': key, 'value': delta}
+                for (day, metric, key), delta in deltas.items() if delta]
+        if not rows:
+            return
+        table = DailyStat.__table__
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.metric, table.c.key],
+            set_={'value': table.c.value + stmt.excluded.value},
+        )
+        connection.execute(stmt, rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _roll_up_daily_stats(session, flush_context):
+    deltas = Counter()
+    today = datetime.utcnow().date()
+
+    def bump(metric, amount=1, key=0, day=today):
+        deltas[day, metric, key] += amount
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            bump('users.registered', day=(obj.created_at or datetime.utcnow()).date())
+            if obj.is_public:
+                bump('users.public')
+        elif isinstance(obj, SwapRequest):
+            bump('swaps.created')
+            bump(f'swaps.status.{obj.status or "pending"}')
+        elif isinstance(obj, UserSkill):
+            bump(f'skills.{obj.role}', key=obj.skill_id)
+        elif isinstance(obj, Skill):
+            bump('skills.catalog')
+
+    for obj in session.deleted:
+        state = inspect(obj)
+        if isinstance(obj, User):
+            bump('users.deleted')
+            if _previous_value(state, 'is_public'):
+                bump('users.public', -1)
+        elif isinstance(obj, SwapRequest):
+            old = _previous_value(state, 'status')
+            bump(f'swaps.status.{old}', -1)
+            bump(f'swaps.transition.{old}.deleted')
+        elif isinstance(obj, UserSkill):
+            bump(f'skills.{_previous_value(state, "role")}', -1, key=_previous_value(state, 'skill_id'))
+        elif isinstance(obj, Skill):
+            bump('skills.catalog', -1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, (User, SwapRequest, UserSkill)):
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        if isinstance(obj, User):
+            was_public = _previous_value(state, 'is_public')
+            if bool(was_public) != bool(obj.is_public):
+                bump('users.public', 1 if obj.is_public else -1)
+        elif isinstance(obj, SwapRequest):
+            old = _previous_value(state, 'status')
+            if old != obj.status:
+                bump(f'swaps.status.{old}', -1)
+                bump(f'swaps.status.{obj.status}')
+                bump(f'swaps.transition.{old}.{obj.status}')
+        else:
+            old = (_previous_value(state, 'role'), _previous_value(state, 'skill_id'))
+            if old != (obj.role, obj.skill_id):
+                bump(f'skills.{old[0]}', -1, key=old[1])
+                bump(f'skills.{obj.role}', key=obj.skill_id)
+
+    if deltas:
+        DailyStat.add(session.connection(), deltas)
+
+
+class StoredFile(db.Model):
+    """Reference count for each content-addressed upload in storage.
+
+    ``key`` is the base name shared by a photo's derivatives (see
+    ``app.images``). Users with identical photos share one set of files, so
+    files are only removable once ``refcount`` reaches zero; ``released_at``
+    records when that happened, for the grace period in ``flask uploads gc``.
+    """
+    __tablename__ = 'stored_file'
+
+    key = db.Column(db.String(64), primary_key=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    @staticmethod
+    def add_references(connection, deltas):
+        """Add ``{key: delta}`` onto the stored refcounts, creating rows as needed."""
+        now = datetime.utcnow()
+        rows = [{'key': key, 'refcount': delta, 'created_at': now,
+                 'released_at': now if delta <= 0 else None}
+                for key, delta in deltas.items() if delta]
+        if not rows:
+            return
+        table = StoredFile.__table__
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        refcount = table.c.refcount + stmt.excluded.refcount
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                'refcount': refcount,
+                'released_at': db.case((refcount <= 0, db.func.coalesce(table.c.released_at, now)), else_=None),
+            },
+        )
+        connection.execute(stmt, rows)
+
+
+def _stored_key(photo):
+    # Photos from before content addressing have a file extension and aren't counted
+    return photo if photo and '.' not in photo else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_photo_references(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, User) and _stored_key(obj.profile_photo):
+            deltas[obj.profile_photo] += 1
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            old = _stored_key(_previous_value(inspect(obj), 'profile_photo'))
+            if old:
+                deltas[old] -= 1
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if not state.attrs.profile_photo.history.has_changes():
+            continue
+        old = _stored_key(_previous_value(state, 'profile_photo'))
+        new = _stored_key(obj.profile_photo)
+        if old != new:
+            if old:
+                deltas[old] -= 1
+            if new:
+                deltas[new] += 1
+    if deltas:
+        StoredFile.add_references(session.connection(), deltas)
@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values, direction='next'):
+    """Pack the sort-key values of a boundary row into an opaque URL-safe token."""
+    payload = {
+        'd': direction,
+        'k': [v.isoformat() if isinstance(v, datetime) else v for v in values],
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Unpack a cursor token. Returns ``(values, direction)`` or ``None`` if invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        direction = payload['d']
+        keys = payload['k']
+        if direction not in ('next', 'prev') or len(keys) != len(columns):
+            return None
+        values = []
+        for column, value in zip(columns, keys):
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            values.append(value)
+        return values, direction
+    except (ValueError, TypeError, KeyError, NotImplementedError):
+        return None
+
+
+class KeysetPage:
+    """One page of keyset-paginated results plus the cursors around it."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def paginate(query, order_by, cursor=None, per_page=None):
+    """Keyset-paginate ``query`` newest first on the ``order_by`` columns.
+
+    ``order_by`` must end in a unique column (normally the primary key) so every
+    row has a distinct position, e.g. ``(User.created_at, User.id)``. Each page
+    is a single indexed range scan with ``LIMIT per_page + 1``, so deep pages
+    cost the same as the first one, unlike OFFSET paging.
+    """
+    if per_page is None:
+        per_page = current_app.config.get('ITEMS_PER_PAGE', 20)
+
+    columns = list(order_by)
+    decoded = decode_cursor(cursor, columns)
+    key = tuple_(*columns)
+
+    if decoded is None:
+        values, direction = None, 'next'
+    else:
+        values, direction = decoded
+
+    if direction == 'next':
+        if values is not None:
+            query = query.filter(key < tuple_(*values))
+        query = query.order_by(*[c.desc() for c in columns])
+    else:
+        query = query.filter(key > tuple_(*values))
+        query = query.order_by(*[c.asc() for c in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    def key_of(row):
+        return [getattr(row, c.key) for c in columns]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if direction == 'next':
+            more_after, more_before = has_more, values is not None
+        else:
+            more_after, more_before = True, has_more
+        if more_after:
+            next_cursor = encode_cursor(key_of(rows[-1]), 'next')
+        if more_before:
+            prev_cursor = encode_cursor(key_of(rows[0]), 'prev')
+
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate_request(query, order_by, param='cursor', per_page=None):
+    """``paginate`` using the cursor found in ``request.args[param]``."""
+    return paginate(query, order_by, cursor=request.args.get(param), per_page=per_page)
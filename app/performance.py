@@ -0,0 +1,295 @@
+"""Sampled per-request profiling: wall time, SQL and template rendering.
+
+A fraction of requests (``PERF_SAMPLE_RATE``) get a ``RequestProfile``
+when they start. While a profile is active, SQLAlchemy engine events count
+every statement and its duration, and the template signals time rendering.
+Template time includes any lazy loads a template triggers, which is usually
+where N+1 queries come from. When the request finishes, the profile goes
+into this worker's ring buffer, which ``/admin/performance`` summarises.
+
+These are written to the ``PERF_LOG_PATH`` rotating log as JSON lines:
+
+- statements slower than ``PERF_SLOW_QUERY_MS``, with the types and sizes
+  of their parameters, never the values
+- requests slower than ``PERF_SLOW_REQUEST_MS``
+- requests that repeat one statement shape at least ``PERF_REPEAT_THRESHOLD``
+  times
+
+Unsampled requests cost one ``random()`` call plus a ``g`` lookup per
+statement. With the rate at 0, nothing is hooked up at all.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import (before_render_template, current_app, g, has_request_context, request,
+                   request_finished, request_started, template_rendered)
+from sqlalchemy import event
+
+from app import db
+
+RequestRecord = namedtuple('RequestRecord', 'at endpoint method status wall_ms sql_count sql_ms template_ms repeated')
+QueryRecord = namedtuple('QueryRecord', 'at endpoint shape parameters ms')
+
+# Placeholders in every DBAPI paramstyle SQLAlchemy emits: ?, %s, %(name)s, :name, $1
+_PLACEHOLDER = re.compile(r'\?|%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+')
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_SPACE = re.compile(r'\s+')
+
+logger = logging.getLogger('skillswap.performance')
+
+
+def statement_shape(statement):
+    """``statement`` with placeholders unified and IN lists collapsed, for grouping."""
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _PLACEHOLDER_LIST.sub('?, ...', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def _type_name(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def parameter_shape(parameters, executemany=False):
+    """Types (and string lengths) of the bound parameters; runs are collapsed."""
+    if executemany:
+        return f'{len(parameters)} x {parameter_shape(parameters[0])}' if parameters else '[]'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {_type_name(value)}' for key, value in parameters.items()) + '}'
+    runs = []
+    for name in map(_type_name, parameters or ()):
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return '(' + ', '.join(name if count == 1 else f'{name} x {count}' for name, count in runs) + ')'
+
+
+class RequestProfile:
+    """Counters for one sampled request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.shapes = defaultdict(int)
+        self.rendering = []
+
+    def repeated(self, threshold):
+        return sorted(((shape, count) for shape, count in self.shapes.items() if count >= threshold),
+                      key=lambda item: -item[1])
+
+
+class PerformanceMonitor:
+    """This worker's ring buffers of recent sampled requests and slow statements."""
+
+    def __init__(self, sample_rate=1.0, slow_request_ms=500, slow_query_ms=100, repeat_threshold=10,
+                 buffer_size=2000):
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        self.requests = deque(maxlen=buffer_size)
+        self.queries = deque(maxlen=buffer_size)
+
+    def sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def add_request(self, record):
+        with self._lock:
+            self.requests.append(record)
+
+    def add_query(self, record):
+        with self._lock:
+            self.queries.append(record)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.requests), list(self.queries)
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.queries.clear()
+
+    def endpoint_summary(self, requests):
+        """Per-endpoint latency and query stats, slowest p95 first."""
+        grouped = defaultdict(list)
+        for record in requests:
+            grouped[record.endpoint].append(record)
+        rows = []
+        for endpoint, records in grouped.items():
+            walls = sorted(r.wall_ms for r in records)
+            count = len(records)
+            rows.append({
+                'endpoint': endpoint,
+                'count': count,
+                'p50': walls[(count - 1) // 2],
+                'p95': walls[max(0, -(-count * 95 // 100) - 1)],
+                'max': walls[-1],
+                'sql_count': sum(r.sql_count for r in records) / count,
+                'sql_ms': sum(r.sql_ms for r in records) / count,
+                'template_ms': sum(r.template_ms for r in records) / count,
+                'repeated': sum(1 for r in records if r.repeated),
+            })
+        rows.sort(key=lambda row: -row['p95'])
+        return rows
+
+    def repeated_statements(self, requests):
+        """``(endpoint, shape)`` pairs flagged as N+1, most repeats first."""
+        grouped = {}
+        for record in requests:
+            for shape, count in record.repeated:
+                row = grouped.setdefault((record.endpoint, shape), {
+                    'endpoint': record.endpoint, 'shape': shape, 'requests': 0, 'max_repeats': 0})
+                row['requests'] += 1
+                row['max_repeats'] = max(row['max_repeats'], count)
+        return sorted(grouped.values(), key=lambda row: (-row['max_repeats'], -row['requests']))
+
+    def slowest_queries(self, queries, limit=20):
+        grouped = {}
+        for record in queries:
+            row = grouped.setdefault(record.shape, {
+                'shape': record.shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': set()})
+            row['count'] += 1
+            row['total_ms'] += record.ms
+            if record.ms >= row['max_ms']:
+                row['max_ms'] = record.ms
+                row['parameters'] = record.parameters
+            row['endpoints'].add(record.endpoint)
+        return sorted(grouped.values(), key=lambda row: -row['max_ms'])[:limit]
+
+
+def _log(kind, **fields):
+    if logger.handlers:
+        logger.warning(json.dumps({'kind': kind, 'at': datetime.utcnow().isoformat(), **fields}, default=str))
+
+
+def _profile():
+    return g.get('perf_profile') if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context rather than the connection: a statement that
+    # raises never reaches _after_cursor_execute, and its context goes with it
+    if _profile() is not None and context is not None:
+        context._perf_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile()
+    started = getattr(context, '_perf_started', None)
+    if profile is None or started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    shape = statement_shape(statement)
+    profile.sql_count += 1
+    profile.sql_ms += ms
+    profile.shapes[shape] += 1
+
+    monitor = g.perf_monitor
+    if ms >= monitor.slow_query_ms:
+        record = QueryRecord(datetime.utcnow(), request.endpoint, shape,
+                             parameter_shape(parameters, executemany), ms)
+        monitor.add_query(record)
+        _log('slow_query', endpoint=record.endpoint, ms=round(ms, 2), statement=shape,
+             parameters=record.parameters)
+
+
+def _request_started(app, **extra):
+    monitor = app.extensions['performance']
+    if monitor.sample():
+        g.perf_monitor = monitor
+        g.perf_profile = RequestProfile()
+
+
+def _request_finished(app, response, **extra):
+    profile = g.pop('perf_profile', None)
+    if profile is None:
+        return
+    monitor = g.perf_monitor
+    record = RequestRecord(
+        at=datetime.utcnow(),
+        endpoint=request.endpoint or request.path,
+        method=request.method,
+        status=response.status_code,
+        wall_ms=(time.perf_counter() - profile.started) * 1000,
+        sql_count=profile.sql_count,
+        sql_ms=profile.sql_ms,
+        template_ms=profile.template_ms,
+        repeated=profile.repeated(monitor.repeat_threshold),
+    )
+    monitor.add_request(record)
+    if record.repeated:
+        _log('repeated_statements', endpoint=record.endpoint, path=request.full_path,
+             statements=[{'statement': shape, 'count': count} for shape, count in record.repeated])
+    if record.wall_ms >= monitor.slow_request_ms:
+        _log('slow_request', endpoint=record.endpoint, path=request.full_path, status=record.status,
+             wall_ms=round(record.wall_ms, 2), sql_count=record.sql_count, sql_ms=round(record.sql_ms, 2),
+             template_ms=round(record.template_ms, 2))
+
+
+def _render_started(app, template, context, **extra):
+    profile = _profile()
+    if profile is not None:
+        profile.rendering.append(time.perf_counter())
+
+
+def _render_finished(app, template, context, **extra):
+    profile = _profile()
+    if profile is not None and profile.rendering:
+        started = profile.rendering.pop()
+        if not profile.rendering:  # nested render_template calls are already inside the outer one
+            profile.template_ms += (time.perf_counter() - started) * 1000
+
+
+def _configure_log(path, max_bytes, backups):
+    path = os.path.abspath(path)
+    if any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+
+
+def get_monitor():
+    return current_app.extensions['performance']
+
+
+def init_performance(app):
+    config = app.config
+    monitor = PerformanceMonitor(
+        sample_rate=config['PERF_SAMPLE_RATE'],
+        slow_request_ms=config['PERF_SLOW_REQUEST_MS'],
+        slow_query_ms=config['PERF_SLOW_QUERY_MS'],
+        repeat_threshold=config['PERF_REPEAT_THRESHOLD'],
+        buffer_size=config['PERF_BUFFER_SIZE'],
+    )
+    app.extensions['performance'] = monitor
+    if monitor.sample_rate <= 0:
+        return
+    if config['PERF_LOG_PATH']:
+        _configure_log(config['PERF_LOG_PATH'], config['PERF_LOG_MAX_BYTES'], config['PERF_LOG_BACKUPS'])
+
+    with app.app_context():
+        for engine in db.engines.values():  # the replica too, if there is one
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
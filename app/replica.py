@@ -0,0 +1,145 @@
+"""Route reads in ``@read_only`` views to an optional replica database.
+
+With ``SQLALCHEMY_REPLICA_URI`` set, the replica is the ``replica`` bind
+and ``db.session`` is a ``RoutingSession``. Its ``get_bind`` sends a
+statement to the replica only when all of these hold:
+
+- the statement is a plain SELECT (no ``FOR UPDATE``)
+- it runs during a request whose view is marked ``@read_only``
+- the session has not written anything in this transaction
+- the user hasn't written anything in the last ``REPLICA_STICKY_SECONDS``
+  (read-your-writes; the deadline rides in the Flask session cookie, so it
+  holds whichever worker serves the next request)
+- the replica isn't marked down
+
+Everything else goes to the primary as before. The first replica read in a
+transaction opens the replica connection up front. If that fails, or the
+replica drops a connection later, the replica is marked down for
+``REPLICA_RETRY_SECONDS`` and reads fall back to the primary. The next read
+after that tries the replica again.
+"""
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session as cookie_session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+PIN_KEY = '_primary_until'
+
+
+def read_only(view):
+    """Mark ``view`` as safe to serve from the replica."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+class ReplicaHealth:
+    """Whether this worker should try the replica, with a retry timer after failures."""
+
+    def __init__(self, retry_seconds=30):
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self.down_until = 0.0
+        self.failures = 0
+
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self, error):
+        with self._lock:
+            if self.available():
+                logger.warning('Read replica unavailable, using the primary for %ss: %s',
+                               self.retry_seconds, error)
+            self.down_until = time.monotonic() + self.retry_seconds
+            self.failures += 1
+
+
+def _pinned_to_primary():
+    until = cookie_session.get(PIN_KEY)
+    return until is not None and until > time.time()
+
+
+class RoutingSession(FlaskSession):
+    """``db.session`` class that sends read-only views' SELECTs to the replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._wants_replica(clause):
+            replica = self._db.engines[REPLICA_BIND]
+            if self._connect_replica(replica):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _wants_replica(self, clause):
+        return (
+            getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None
+            and not self._flushing
+            and not self.info.get('replica_wrote')
+            and has_request_context() and g.get('read_only', False)
+            and 'replica' in current_app.extensions
+            and not _pinned_to_primary()
+        )
+
+    def _connect_replica(self, replica):
+        if self.info.get('replica_connected'):
+            return True
+        health = current_app.extensions['replica']
+        if not health.available():
+            return False
+        try:
+            self.connection(bind_arguments={'bind': replica})
+        except DBAPIError as error:
+            health.mark_down(error)
+            return False
+        self.info['replica_connected'] = True
+        return True
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_write(session, flush_context):
+    session.info['replica_wrote'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _pin_to_primary(session):
+    if session.info.pop('replica_wrote', False) and has_request_context() \
+            and 'replica' in current_app.extensions:
+        cookie_session[PIN_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('replica_connected', None)
+        session.info.pop('replica_wrote', None)
+
+
+def init_replica(app):
+    """Set up routing if ``SQLALCHEMY_REPLICA_URI`` is configured."""
+    from app import db
+
+    if REPLICA_BIND not in app.config['SQLALCHEMY_BINDS']:
+        return
+    # The replica is a copy of the primary, never a schema of its own: without
+    # its (empty) metadata, create_all()/drop_all() leave it alone
+    db.metadatas.pop(REPLICA_BIND, None)
+    health = ReplicaHealth(app.config['REPLICA_RETRY_SECONDS'])
+    app.extensions['replica'] = health
+
+    def replica_error(context):
+        if context.is_disconnect or context.connection is None:
+            health.mark_down(context.original_exception)
+
+    with app.app_context():
+        event.listen(db.engines[REPLICA_BIND], 'handle_error', replica_error)
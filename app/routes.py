@@ -5,20 +5,22 @@ try:
 except ImportError:
     from urllib.parse import urlparse as url_parse
 from app import db
-from app.models import User, Skill, SwapRequest
+from app.models import User, Skill, UserSkill, SwapRequest
 from app.forms import LoginForm, RegistrationForm, SkillForm, SwapRequestForm, ProfileSettingsForm
+from app.pagination import paginate_request
+from app.search import get_search
+from app.matching import best_matches
+from app.cycles import cycles_for_user, propose_cycle, CycleError
+from app.images import save_upload, PhotoError
+from app.conditional import not_modified, user_state, directory_state, swap_state
+from app.fragments import prefetch
+from app.metrics import LOGINS, REGISTRATIONS
+from app.replica import read_only
 from werkzeug.utils import secure_filename
 from flask import current_app
 import os
 from flask import session, jsonify
 
-# PIL import with error handling
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-    print("Warning: PIL not installed. Profile photo resizing disabled.")
-
 # Blueprint definitions - FIXED ORDER
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -66,10 +68,12 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data.strip().lower()).first()
         if user is None or not user.check_password(form.password.data):
+            LOGINS.inc(result='failure')
             flash('Invalid email or password', 'danger')
             return redirect(url_for('auth.login'))
         
         login_user(user, remember=form.remember.data)
+        LOGINS.inc(result='success')
         next_page = request.args.get('next')
         if not next_page or url_parse(next_page).netloc != '':
             next_page = url_for('main.index')  # Fixed: use index instead of dashboard
@@ -105,6 +109,7 @@ def register():
         try:
             db.session.add(user)
             db.session.commit()
+            REGISTRATIONS.inc()
             
             # Automatically log in the new user
             login_user(user)
@@ -169,22 +174,12 @@ def reset_password(token):
 @profile_bp.route('')
 @login_required
 def view():
+    cached = not_modified(user_state(current_user.id))
+    if cached:
+        return cached
     try:
-        # Get user's skills for display
-        offered_skills = Skill.query.filter_by(offered_by_id=current_user.id).all()
-        wanted_skills = Skill.query.filter_by(wanted_by_id=current_user.id).all()
-        
-        # Get recent swap requests for the user
-        recent_requests = SwapRequest.query.filter(
-            (SwapRequest.sender_id == current_user.id) | 
-            (SwapRequest.receiver_id == current_user.id)
-        ).order_by(SwapRequest.created_at.desc()).limit(5).all()
-        
-        return render_template('profile/view.html',
-                             user=current_user,
-                             offered_skills=offered_skills,
-                             wanted_skills=wanted_skills,
-                             recent_requests=recent_requests)
+        # The template reads the skill lists itself, inside a cached fragment
+        return render_template('profile/view.html', user=current_user)
     except Exception as e:
         flash('Error loading profile. Please try again.', 'danger')
         current_app.logger.error(f"Profile view error: {str(e)}")
@@ -205,19 +200,14 @@ def edit():
         current_user.location = form.location.data
         current_user.availability = form.availability.data
 
-        # Handle profile photo upload
-        if form.profile_photo.data:
-            filename = secure_filename(form.profile_photo.data.filename)
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, filename)
-            form.profile_photo.data.save(file_path)
-            current_user.profile_photo = filename
-
-            image = Image.open(file_path)
-            image = image.convert("RGB")  # Ensures compatibility
-            image = image.resize((400, 400))  # Resize to 100x100
-            image.save(file_path, format='JPEG')  # Save resized image
+        # Handle profile photo upload; resizing happens in the background
+        if form.profile_photo.data and form.profile_photo.data.filename:
+            try:
+                current_user.profile_photo = save_upload(form.profile_photo.data)
+            except PhotoError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return render_template('profile/edit.html', form=form)
 
         db.session.commit()
         flash('Profile updated successfully!', 'success')
@@ -235,32 +225,34 @@ def edit():
 @profile_bp.route('/skill/<int:skill_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_skill(skill_id):
-    skill = Skill.query.get_or_404(skill_id)
+    skill = UserSkill.query.get_or_404(skill_id)
     
     # Check if user owns this skill
-    if skill.offered_by_id != current_user.id and skill.wanted_by_id != current_user.id:
+    if skill.user_id != current_user.id:
         abort(403)
     
     form = SkillForm(obj=skill)
     
     # Pre-populate skill_type based on current skill
-    if skill.offered_by_id == current_user.id:
-        form.skill_type.data = 'offered'
-    else:
-        form.skill_type.data = 'wanted'
+    if request.method == 'GET':
+        form.skill_type.data = skill.role
     
     if form.validate_on_submit():
         try:
-            skill.name = form.name.data.strip()
-            skill.availability = form.availability.data.strip() if form.availability.data else None
+            catalog_skill = Skill.get_or_create(form.name.data)
+            duplicate = UserSkill.query.filter(
+                UserSkill.user_id == current_user.id,
+                UserSkill.role == form.skill_type.data,
+                UserSkill.skill_id == catalog_skill.id,
+                UserSkill.id != skill.id
+            ).first()
+            if duplicate:
+                flash(f'You already list "{catalog_skill.name}" as {form.skill_type.data}.', 'warning')
+                return redirect(url_for('profile.edit_skill', skill_id=skill_id))
             
-            # Handle skill type change
-            if form.skill_type.data == 'offered':
-                skill.offered_by_id = current_user.id
-                skill.wanted_by_id = None
-            else:
-                skill.wanted_by_id = current_user.id
-                skill.offered_by_id = None
+            skill.skill = catalog_skill
+            skill.role = form.skill_type.data
+            # skill.availability = form.availability.data.strip() if form.availability.data else None
             
             db.session.commit()
             flash(f'Skill "{skill.name}" has been updated!', 'success')
@@ -279,10 +271,21 @@ def add_skill():
     form = SkillForm()
     if form.validate_on_submit():
         try:
-            skill = Skill(
-                name=form.name.data.strip(),
-                offered_by_id=current_user.id if form.skill_type.data == 'offered' else None,
-                wanted_by_id=current_user.id if form.skill_type.data == 'wanted' else None,
+            catalog_skill = Skill.get_or_create(form.name.data)
+            existing = UserSkill.query.filter_by(
+                user_id=current_user.id,
+                role=form.skill_type.data,
+                skill_id=catalog_skill.id
+            ).first()
+            if existing:
+                db.session.commit()
+                flash(f'You already list "{catalog_skill.name}" as {form.skill_type.data}.', 'info')
+                return redirect(url_for('profile.view'))
+            
+            skill = UserSkill(
+                user_id=current_user.id,
+                skill=catalog_skill,
+                role=form.skill_type.data,
                 # availability=form.availability.data.strip() if form.availability.data else None
             )
             db.session.add(skill)
@@ -299,10 +302,10 @@ def add_skill():
 @profile_bp.route('/skill/<int:skill_id>/delete', methods=['POST'])
 @login_required
 def delete_skill(skill_id):
-    skill = Skill.query.get_or_404(skill_id)
+    skill = UserSkill.query.get_or_404(skill_id)
     
     # Check if user owns this skill
-    if skill.offered_by_id != current_user.id and skill.wanted_by_id != current_user.id:
+    if skill.user_id != current_user.id:
         abort(403)
     
     try:
@@ -322,8 +325,12 @@ def delete_skill(skill_id):
 # ======================
 
 @swaps_bp.route('/browse')
+@read_only
 @login_required
 def browse():
+    cached = not_modified(user_state(current_user.id), directory_state())
+    if cached:
+        return cached
     try:
         search_query = request.args.get('q', '').strip()
         skill_filter = request.args.get('skill', '').strip()
@@ -334,18 +341,29 @@ def browse():
             User.id != current_user.id
         )
         
+        search = get_search()
         if search_query:
-            query = query.filter(User.username.ilike(f'%{search_query}%'))
+            query = query.filter(search.username_filter(search_query))
         
         if skill_filter:
-            # Fixed: Proper skill filtering with joins
-            query = query.join(Skill, 
-                (Skill.offered_by_id == User.id) | (Skill.wanted_by_id == User.id)
-            ).filter(Skill.name.ilike(f'%{skill_filter}%')).distinct()
+            # Resolve the filter to the best-matching catalog entries via the
+            # trigram index, then an indexed lookup on user_skill finds
+            # everyone who offers or wants them
+            skill_ids = [match.id for match in search.search_skills(skill_filter, limit=50)]
+            query = query.filter(User.id.in_(
+                db.session.query(UserSkill.user_id).filter(UserSkill.skill_id.in_(skill_ids))
+            ))
         
-        users = query.all()
+        page = paginate_request(query, (User.created_at, User.id))
+        users = page.items
+        # Fetch skills in one query, and only for cards not in the fragment
+        # cache whose counters say they list any
+        user_skills = UserSkill.grouped_by_user([user.id for user in prefetch('browse_card', users)
+                                                 if user.offered_count or user.wanted_count])
         return render_template('swaps/browse.html', 
                              users=users, 
+                             page=page,
+                             user_skills=user_skills,
                              search_query=search_query,
                              skill_filter=skill_filter)
     except Exception as e:
@@ -353,6 +371,71 @@ def browse():
         current_app.logger.error(f"Browse error: {str(e)}")
         return redirect(url_for('main.index'))
 
+@swaps_bp.route('/matches')
+@login_required
+def matches():
+    """Best matches: users who offer what I want and want what I offer"""
+    try:
+        mutual_only = request.args.get('mutual') == '1'
+        results = best_matches(current_user, limit=current_app.config['ITEMS_PER_PAGE'], mutual_only=mutual_only)
+        return render_template('swaps/matches.html', results=results, mutual_only=mutual_only)
+    except Exception as e:
+        flash('Error loading matches. Please try again.', 'danger')
+        current_app.logger.error(f"Matches error: {str(e)}")
+        return redirect(url_for('main.index'))
+
+@swaps_bp.route('/matches.json')
+@login_required
+def matches_json():
+    """Best matches as JSON"""
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    mutual_only = request.args.get('mutual') == '1'
+    results = best_matches(current_user, limit=limit, mutual_only=mutual_only)
+    return jsonify({
+        'matches': [{
+            'user_id': partner.id,
+            'username': partner.username,
+            'score': round(match.score, 3),
+            'mutual': match.is_mutual,
+            'they_offer': [skill.name for skill in gives],
+            'they_want': [skill.name for skill in gets],
+        } for match, partner, gives, gets in results]
+    })
+
+@swaps_bp.route('/circles')
+@login_required
+def circles():
+    """Swap circles: A teaches B, B teaches C, C teaches A"""
+    try:
+        results = cycles_for_user(current_user.id, limit=current_app.config['ITEMS_PER_PAGE'])
+        return render_template('swaps/circles.html', results=results)
+    except Exception as e:
+        flash('Error loading swap circles. Please try again.', 'danger')
+        current_app.logger.error(f"Circles error: {str(e)}")
+        return redirect(url_for('main.index'))
+
+@swaps_bp.route('/circles/propose', methods=['POST'])
+@login_required
+def propose_circle():
+    try:
+        members = request.form.get('members', '').split(',')
+        swap = propose_cycle(current_user, members)
+        db.session.commit()
+        if swap:
+            flash(f'Swap circle proposed: your request to {swap.receiver.username} is on its way.', 'success')
+        else:
+            flash('Your request in this swap circle is already pending.', 'info')
+        return redirect(url_for('swaps.manage_requests'))
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e) if isinstance(e, CycleError) else 'Invalid swap circle.', 'warning')
+        return redirect(url_for('swaps.circles'))
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while proposing the swap circle. Please try again.', 'danger')
+        current_app.logger.error(f"Propose circle error: {str(e)}")
+        return redirect(url_for('swaps.circles'))
+
 @swaps_bp.route('/request/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def send_request(user_id):
@@ -364,11 +447,7 @@ def send_request(user_id):
         return redirect(url_for('swaps.browse'))
     
     # Check if request already exists
-    existing_request = SwapRequest.query.filter_by(
-        sender_id=current_user.id,
-        receiver_id=receiver.id,
-        status='pending'
-    ).first()
+    existing_request = SwapRequest.pending_between(current_user.id, receiver.id)
     
     if existing_request:
         flash('You already have a pending request with this user.', 'warning')
@@ -398,8 +477,12 @@ def send_request(user_id):
 @login_required
 def manage_requests():
     try:
-        received = SwapRequest.query.filter_by(receiver_id=current_user.id).order_by(SwapRequest.created_at.desc()).all()
-        sent = SwapRequest.query.filter_by(sender_id=current_user.id).order_by(SwapRequest.created_at.desc()).all()
+        order = (SwapRequest.created_at, SwapRequest.id)
+        # Each list shows the other party; current_user is already loaded
+        received = paginate_request(SwapRequest.query.filter_by(receiver_id=current_user.id).options(
+            db.joinedload(SwapRequest.sender)), order, param='received')
+        sent = paginate_request(SwapRequest.query.filter_by(sender_id=current_user.id).options(
+            db.joinedload(SwapRequest.receiver)), order, param='sent')
         return render_template('swaps/requests.html', received=received, sent=sent)
     except Exception as e:
         flash('Error loading swap requests. Please try again.', 'danger')
@@ -556,16 +639,26 @@ def toggle_dark_mode():
 def index():
     """Root route - serves as both landing page and dashboard"""
     if current_user.is_authenticated:
-        # Get user's skills for the dashboard
+        viewer = user_state(current_user.id)
+        # Get recent swap requests. Not a cached fragment: it shows the
+        # other party's username, which doesn't bump current_user's version.
+        # The ETag covers those parties instead
+        recent_requests = SwapRequest.query.filter(
+            (SwapRequest.sender_id == current_user.id) |
+            (SwapRequest.receiver_id == current_user.id)
+        ).options(db.joinedload(SwapRequest.sender), db.joinedload(SwapRequest.receiver)).order_by(
+            SwapRequest.created_at.desc()).limit(5).all()
+        cached = not_modified(viewer, swap_state(recent_requests))
+        if cached:
+            return cached
+        # Get user's skills for the dashboard; panels already in the
+        # fragment cache don't need their queries
         try:
-            offered_skills = Skill.query.filter_by(offered_by_id=current_user.id).all()
-            wanted_skills = Skill.query.filter_by(wanted_by_id=current_user.id).all()
-            
-            # Get recent swap requests
-            recent_requests = SwapRequest.query.filter(
-                (SwapRequest.sender_id == current_user.id) | 
-                (SwapRequest.receiver_id == current_user.id)
-            ).order_by(SwapRequest.created_at.desc()).limit(5).all()
+            offered_skills = wanted_skills = None
+            if prefetch('dashboard_skills', [current_user]):
+                # The counters on the user row say when there's nothing to load
+                offered_skills = current_user.offered_skills if current_user.offered_count else []
+                wanted_skills = current_user.wanted_skills if current_user.wanted_count else []
             
             return render_template('main/dashboard.html', 
                                  offered_skills=offered_skills, 
@@ -625,6 +718,7 @@ def contact():
     return render_template('main/contact.html')
 
 @main_bp.route('/search')
+@read_only
 @login_required
 def search():
     """Global search functionality"""
@@ -633,17 +727,17 @@ def search():
         return redirect(url_for('main.index'))
     
     try:
+        search = get_search()
+
         # Search users
-        users = User.query.filter(
+        users = paginate_request(User.query.filter(
             User.is_public == True,
             User.id != current_user.id,
-            User.username.ilike(f'%{query}%')
-        ).limit(10).all()
+            search.username_filter(query)
+        ), (User.created_at, User.id), param='users', per_page=10)
         
-        # Search skills
-        skills = Skill.query.filter(
-            Skill.name.ilike(f'%{query}%')
-        ).limit(10).all()
+        # Search skills, best matches first (typos included)
+        skills = search.search_skills(query, limit=20)
         
         return render_template('main/search_results.html', 
                              query=query, 
@@ -669,24 +763,13 @@ def upload_photo():
     
     if file and allowed_file(file.filename):
         try:
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            import time
-            timestamp = str(int(time.time()))
-            filename = f"{current_user.id}_{timestamp}_{filename}"
-            
-            # Ensure upload directory exists
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            file_path = os.path.join(upload_dir, filename)
-            file.save(file_path)
-            
-            # Update user's profile photo
-            current_user.profile_photo = filename
+            # Stored under a generated name; resized copies appear shortly
+            current_user.profile_photo = save_upload(file)
             db.session.commit()
             
             flash('Profile photo updated successfully!', 'success')
+        except PhotoError as e:
+            flash(str(e), 'danger')
         except Exception as e:
             db.session.rollback()
             flash('Error uploading photo. Please try again.', 'danger')
@@ -697,9 +780,13 @@ def upload_photo():
     return redirect(url_for('profile.edit'))
 
 @main_bp.route('/user/<int:user_id>')
+@read_only
 @login_required
 def view_user_profile(user_id):
     """View another user's public profile"""
+    cached = not_modified(user_state(user_id, current_user.id))
+    if cached:
+        return cached
     user = User.query.get_or_404(user_id)
     
     # Check if profile is public or if it's the current user
@@ -708,8 +795,8 @@ def view_user_profile(user_id):
         return redirect(url_for('swaps.browse'))
     
     try:
-        offered_skills = Skill.query.filter_by(offered_by_id=user.id).all()
-        wanted_skills = Skill.query.filter_by(wanted_by_id=user.id).all()
+        offered_skills = user.offered_skills if user.offered_count else []
+        wanted_skills = user.wanted_skills if user.wanted_count else []
         
         return render_template('main/user_profile.html',
                              user=user,
@@ -719,13 +806,3 @@ def view_user_profile(user_id):
         flash('Error loading user profile. Please try again.', 'danger')
         current_app.logger.error(f"View user profile error: {str(e)}")
         return redirect(url_for('swaps.browse'))
-    
-# Replace your existing profile_bp.route('/edit') with this updated version:
-
-from PIL import Image  # Add this import at the top of your file
-
-def resize_image(image_path, max_size=(300, 300)):
-    """Resize image to maximum dimensions while maintaining aspect ratio"""
-    with Image.open(image_path) as img:
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        img.save(image_path, optimize=True, quality=85)
@@ -0,0 +1,54 @@
+"""Schema bootstrap and the startup schema-version check.
+
+Tables are created and upgraded only by explicit steps (``flask db upgrade``
+in entrypoint.sh, or ``flask init-db`` for a fresh database), never while
+serving requests. ``verify_schema`` runs once when the app is created and
+refuses to start against a database whose Alembic revision doesn't match
+the migrations shipped with the code.
+"""
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask import current_app
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+
+from app import db
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def _revisions(app):
+    directory = app.extensions['migrate'].directory
+    expected = set(ScriptDirectory(directory).get_heads())
+    with db.engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    return current, expected
+
+
+def verify_schema(app):
+    """Raise ``SchemaVersionError`` unless the database is at the migration head."""
+    with app.app_context():
+        current, expected = _revisions(app)
+    if current != expected:
+        found = ', '.join(sorted(current)) or 'no Alembic revision'
+        raise SchemaVersionError(
+            f"Database schema is at {found} but this code expects {', '.join(sorted(expected))}. "
+            f"Run `flask db upgrade` (or `flask init-db` on an empty database) before starting the app."
+        )
+
+
+def init_db():
+    """Bring the database to the current schema.
+
+    An empty database gets every table from the models in one go and is
+    stamped at the migration head; anything else goes through the
+    migrations. Returns ``'created'`` or ``'upgraded'``.
+    """
+    if not inspect(db.engine).get_table_names():
+        db.create_all()
+        stamp(directory=current_app.extensions['migrate'].directory)
+        return 'created'
+    upgrade(directory=current_app.extensions['migrate'].directory)
+    return 'upgraded'
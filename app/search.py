@@ -0,0 +1,164 @@
+"""Trigram search over the skill catalog.
+
+On Postgres, queries run against pg_trgm GIN indexes (see the
+``add_trigram_search_indexes`` migration). Elsewhere an in-process trigram
+index over the catalog is kept per worker and topped up from new catalog
+rows before each search. Both backends return the same ranked
+``SkillMatch`` results, scored with pg_trgm's similarity formula.
+"""
+import heapq
+import math
+import re
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, namedtuple
+
+from flask import current_app
+
+from app import db
+from app.models import Skill, User
+
+# Same default as pg_trgm.similarity_threshold, which the Postgres backend uses
+SIMILARITY_THRESHOLD = 0.3
+
+SkillMatch = namedtuple('SkillMatch', 'id name score')
+
+# pg_trgm treats anything that isn't alphanumeric as a word separator
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """pg_trgm-compatible trigram set: each word lowercased and padded '  word '."""
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class TrigramSearch(ABC):
+    """Common interface for the search backends."""
+
+    @abstractmethod
+    def search_skills(self, query, limit=20):
+        """Catalog skills whose name contains ``query`` or is similar to it, best first."""
+
+    def username_filter(self, query):
+        """Filter clause matching users whose username contains ``query``."""
+        return User.username.ilike(f'%{_like_escape(query)}%', escape='\\')
+
+
+class PostgresTrigramSearch(TrigramSearch):
+    """pg_trgm-backed search; both predicates below are served by GIN indexes."""
+
+    def search_skills(self, query, limit=20):
+        q = Skill.normalize(query)
+        if not q:
+            return []
+        score = db.func.similarity(Skill.normalized_name, q)
+        rows = db.session.query(Skill.id, Skill.name, score.label('score')).filter(
+            db.or_(
+                Skill.normalized_name.like(f'%{_like_escape(q)}%', escape='\\'),
+                Skill.normalized_name.op('%')(q),
+            )
+        ).order_by(score.desc(), Skill.name).limit(limit).all()
+        return [SkillMatch(row.id, row.name, float(row.score)) for row in rows]
+
+
+class InProcessTrigramSearch(TrigramSearch):
+    """Trigram index over the skill catalog held in this worker's memory.
+
+    Catalog rows are append-only (names are never edited in place), so the
+    index stays current by loading rows with an id above the highest one it
+    has seen. Postings are compact ``array('i')`` lists of row positions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._ids = array('i')
+        self._names = []
+        self._normalized = []
+        self._gram_counts = array('H')
+        self._postings = {}
+
+    def add(self, skill_id, name, normalized_name):
+        position = len(self._ids)
+        grams = trigrams(normalized_name)
+        self._ids.append(skill_id)
+        self._names.append(name)
+        self._normalized.append(normalized_name)
+        self._gram_counts.append(min(len(grams), 65535))
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('i')
+            postings.append(position)
+        self._last_id = max(self._last_id, skill_id)
+
+    def sync(self):
+        """Index catalog rows added since the last sync (normally none)."""
+        with self._lock:
+            rows = db.session.query(Skill.id, Skill.name, Skill.normalized_name).filter(
+                Skill.id > self._last_id
+            ).order_by(Skill.id).yield_per(10000)
+            for row in rows:
+                self.add(row.id, row.name, row.normalized_name)
+
+    def _substring_candidates(self, q):
+        # Any 3-char window of a query word also appears in every name containing
+        # that word, so the shortest such posting list bounds the candidates
+        windows = [word[i:i + 3] for word in _WORD_RE.findall(q) for i in range(len(word) - 2)]
+        if not windows:
+            return range(len(self._ids))
+        shortest = min((self._postings.get(w, ()) for w in windows), key=len)
+        return shortest
+
+    def search_skills(self, query, limit=20):
+        q = Skill.normalize(query)
+        if not q:
+            return []
+        self.sync()
+
+        query_grams = trigrams(q)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+
+        size = len(query_grams)
+        gram_counts = self._gram_counts
+        normalized = self._normalized
+        scored = {}
+        # sim = common / (a + b - common) <= common / a, so fewer shared trigrams can't qualify
+        min_shared = max(1, math.ceil(SIMILARITY_THRESHOLD * size))
+        for position, common in shared.items():
+            if common >= min_shared:
+                value = common / (size + gram_counts[position] - common)
+                if value >= SIMILARITY_THRESHOLD:
+                    scored[position] = value
+        for position in self._substring_candidates(q):
+            if position not in scored and q in normalized[position]:
+                common = shared[position]
+                scored[position] = common / (size + gram_counts[position] - common)
+
+        names = self._names
+        best = heapq.nsmallest(limit, scored.items(), key=lambda item: (-item[1], names[item[0]]))
+        return [SkillMatch(self._ids[p], names[p], value) for p, value in best]
+
+
+def get_search():
+    """The search backend for the current app's database, created on first use."""
+    search = current_app.extensions.get('skill_search')
+    if search is None:
+        if db.engine.dialect.name == 'postgresql':
+            search = PostgresTrigramSearch()
+        else:
+            search = InProcessTrigramSearch()
+        current_app.extensions['skill_search'] = search
+    return search
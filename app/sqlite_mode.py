@@ -0,0 +1,153 @@
+"""SQLite tuning for several workers sharing one database file.
+
+Every new connection gets (``SQLITE_WAL``):
+
+- ``journal_mode=WAL``, so readers never block the writer or each other
+- ``synchronous=NORMAL``, which is durable in WAL mode except across a
+  power loss
+- ``busy_timeout``, so a locked database is waited for instead of failing
+  at once
+- a larger page cache and memory-mapped reads
+
+With ``SQLITE_WRITE_LANE``, writes also go through a lane. When a session
+is about to flush, or runs an ORM INSERT/UPDATE/DELETE, it takes this
+process's lane lock and opens the transaction with ``BEGIN IMMEDIATE``.
+That claims SQLite's write lock up front, before anything is written. The
+driver's default is a deferred BEGIN that only asks for the lock partway
+through the transaction. When another writer holds it at that point, the
+result is "database is locked", and busy_timeout can't always help because
+SQLite refuses to wait when waiting could deadlock. Nothing has been
+written yet when BEGIN IMMEDIATE runs, so if it times out it is simply
+retried, with exponential backoff and jitter. The lane is released when the
+transaction commits, rolls back or the session closes. Threads of one
+worker queue on the lock; other processes wait in SQLite.
+"""
+import logging
+import random
+import sqlite3
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Engine -> WriteLane, for the session listeners
+_lanes = weakref.WeakKeyDictionary()
+
+
+def is_busy(error):
+    """Whether ``error`` is SQLite's "database is locked"/"busy"."""
+    orig = getattr(error, 'orig', error)
+    return isinstance(orig, sqlite3.OperationalError) and any(
+        word in str(orig) for word in ('locked', 'busy'))
+
+
+class WriteLane:
+    """One writer at a time per process, with write transactions begun IMMEDIATE."""
+
+    def __init__(self, busy_timeout_ms=5000, retries=5, backoff_ms=20):
+        self.timeout = busy_timeout_ms / 1000
+        self.retries = retries
+        self.backoff = backoff_ms / 1000
+        self._lock = threading.Lock()
+
+    def _wait(self, attempt):
+        time.sleep(random.uniform(0, min(self.backoff * 2 ** attempt, 1.0)))
+
+    def enter(self, connection):
+        """Take the lock and begin ``connection``'s write transaction."""
+        for attempt in range(self.retries + 1):
+            if self._lock.acquire(timeout=self.timeout):
+                break
+            if attempt == self.retries:
+                raise OperationalError('BEGIN IMMEDIATE', (), sqlite3.OperationalError(
+                    'database is locked (write lane busy)'))
+            self._wait(attempt)
+
+        for attempt in range(self.retries + 1):
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+                return
+            except OperationalError as error:
+                if not is_busy(error) or attempt == self.retries:
+                    self._lock.release()
+                    raise
+                logger.info('SQLite write lock busy; retry %d', attempt + 1)
+                self._wait(attempt)
+
+    def leave(self):
+        self._lock.release()
+
+
+def _enter_lane(session):
+    if 'write_lane' in session.info:
+        return
+    connection = session.connection()
+    lane = _lanes.get(connection.engine)
+    if lane is None or connection.connection.dbapi_connection.in_transaction:
+        return  # not a tuned SQLite engine, or already writing outside the lane
+    lane.enter(connection)
+    session.info['write_lane'] = lane
+
+
+@event.listens_for(Session, 'before_flush')
+def _lane_before_flush(session, flush_context, instances):
+    if _lanes:
+        _enter_lane(session)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _lane_before_bulk_write(state):
+    if _lanes and (state.is_insert or state.is_update or state.is_delete):
+        _enter_lane(state.session)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _leave_lane(session, transaction):
+    if transaction.parent is None:
+        lane = session.info.pop('write_lane', None)
+        if lane is not None:
+            lane.leave()
+
+
+def _pragmas(config):
+    pragmas = [
+        'journal_mode=WAL',
+        f"synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}",
+        f"cache_size={-config['SQLITE_CACHE_SIZE_KB']}",  # negative means KiB
+        f"mmap_size={config['SQLITE_MMAP_SIZE']}",
+    ]
+    return [f'PRAGMA {pragma}' for pragma in pragmas]
+
+
+def tune_engine(engine, config):
+    """Apply the pragmas to ``engine``'s connections and register its write lane."""
+    if config['SQLITE_WAL']:
+        statements = _pragmas(config)
+
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.close()
+
+    if config['SQLITE_WRITE_LANE']:
+        _lanes[engine] = WriteLane(config['SQLITE_BUSY_TIMEOUT_MS'], config['SQLITE_WRITE_RETRIES'],
+                                   config['SQLITE_WRITE_BACKOFF_MS'])
+
+
+def init_sqlite(app):
+    """Tune every file-backed SQLite engine of ``app``; call before anything connects."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                tune_engine(engine, app.config)
+                engine.dispose()  # connections opened before now lack the pragmas
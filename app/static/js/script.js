@@ -217,7 +217,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const newStatus = e.target.checked;
         const model = e.target.dataset.model;
         
-        fetch(`/admin/${model}/${targetId}/status`, {
+        fetch(`/api/v1/admin/${model}/${targetId}/status`, {
             method: 'PATCH',
             headers: {
                 'Content-Type': 'application/json',
@@ -231,7 +231,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 showAlert(`Status updated successfully`, 'success');
             } else {
                 e.target.checked = !newStatus; // Revert toggle
-                showAlert(data.message || 'Update failed', 'danger');
+                showAlert(data.error || 'Update failed', 'danger');
             }
         })
         .catch(error => {
@@ -263,7 +263,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Helper Functions
     // ======================
     function performBulkAction(action, ids) {
-        fetch('/admin/bulk-action', {
+        fetch('/api/v1/admin/bulk-action', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -277,7 +277,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 showAlert(data.message || 'Action completed successfully', 'success');
                 setTimeout(() => location.reload(), 1500);
             } else {
-                showAlert(data.message || 'Action failed', 'danger');
+                showAlert(data.error || 'Action failed', 'danger');
             }
         })
         .catch(error => {
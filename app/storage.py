@@ -0,0 +1,159 @@
+"""Pluggable blob storage for uploaded media.
+
+Objects are written once under content-addressed names and never modified,
+so any backend can be fronted by long-lived caches. ``LocalStorage`` keeps
+files in a directory (the default). ``S3Storage`` speaks the small subset of
+the S3 API used here (put/get/head/delete/list objects), so boto3, MinIO or
+any local stand-in with those methods will do.
+"""
+import os
+import shutil
+
+from flask import current_app
+
+
+class Storage:
+    """Interface shared by the backends. Names are flat, URL-safe strings."""
+
+    local_root = None  # set by backends that keep files in a local directory
+
+    def put_file(self, name, path, content_type=None):
+        raise NotImplementedError
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def open(self, name):
+        """A readable binary file object; raises ``FileNotFoundError``."""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def iter_names(self):
+        """Every stored name, with its size in bytes and mtime as ``(name, size, mtime)``."""
+        raise NotImplementedError
+
+    def public_url(self, name):
+        """A URL clients can fetch directly, or None to stream through the app."""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, root):
+        self.root = self.local_root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        if os.sep in name or (os.altsep and os.altsep in name) or name.startswith('.'):
+            raise FileNotFoundError(name)
+        return os.path.join(self.root, name)
+
+    def put_file(self, name, path, content_type=None):
+        target = self.path(name)
+        if os.path.abspath(path) != os.path.abspath(target):
+            temp = f'{target}.tmp'
+            shutil.copyfile(path, temp)
+            os.replace(temp, target)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def iter_names(self):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield entry.name, stat.st_size, stat.st_mtime
+
+
+class S3Storage(Storage):
+    """Objects in ``bucket`` under ``prefix`` through an S3-style ``client``."""
+
+    def __init__(self, client, bucket, prefix='', public_base_url=None):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+
+    def _key(self, name):
+        return f'{self.prefix}{name}'
+
+    def put_file(self, name, path, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        with open(path, 'rb') as body:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=body,
+                                   CacheControl='public, max-age=31536000, immutable', **extra)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    def open(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))['Body']
+        except Exception as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(name) from e
+            raise
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def iter_names(self):
+        token = None
+        while True:
+            kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+            if token:
+                kwargs['ContinuationToken'] = token
+            page = self.client.list_objects_v2(**kwargs)
+            for item in page.get('Contents', ()):
+                modified = item.get('LastModified')
+                yield (item['Key'][len(self.prefix):], item.get('Size', 0),
+                       modified.timestamp() if modified is not None else 0)
+            if not page.get('IsTruncated'):
+                break
+            token = page.get('NextContinuationToken')
+
+    def public_url(self, name):
+        if self.public_base_url:
+            return f'{self.public_base_url}/{self._key(name)}'
+        return None
+
+
+def _is_not_found(error):
+    # botocore raises ClientError with an error code; stand-ins may raise KeyError
+    if isinstance(error, (KeyError, FileNotFoundError)):
+        return True
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+def get_storage():
+    """The configured storage backend, created on first use."""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        config = current_app.config
+        if config['STORAGE_BACKEND'] == 's3':
+            import boto3
+            client = boto3.client('s3', endpoint_url=config['STORAGE_S3_ENDPOINT_URL'])
+            storage = S3Storage(client, config['STORAGE_S3_BUCKET'], config['STORAGE_S3_PREFIX'],
+                                config['STORAGE_S3_PUBLIC_URL'])
+        else:
+            storage = LocalStorage(config['STORAGE_LOCAL_ROOT'])
+        storage = current_app.extensions.setdefault('storage', storage)
+    return storage
@@ -0,0 +1,513 @@
+"""Bulk import and export of users, skills and swap requests.
+
+Files are JSONL (one object per line) or CSV with a header row, picked by
+file extension. Records name users by username (or email) and skills by
+name, never by database id, so a dump from one database loads into another.
+
+Export streams rows in id order through ``yield_per`` (a server-side cursor
+on Postgres). Import reads the file in fixed-size batches. Each batch
+resolves its references with a few IN queries and is written with one
+multi-row INSERT per table, in its own transaction. These inserts skip the
+ORM, so each batch also does the work of the flush listeners in
+``app.models``:
+
+- the user_skill change log, which the match index replays
+- the daily_stat rollup
+- stored_file refcounts
+- ``User.version`` and the per-user counters
+
+After every committed batch, ``<file>.checkpoint`` records how far the run
+got. Running the same command again carries on from there, and the
+checkpoint is deleted when the run finishes. Records that already exist are
+skipped, so a batch replayed after a crash doesn't load twice. For users
+that means the same username or email; for skills, the same entry; for
+swaps, the same sender, receiver and creation time.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+from app import db
+from app.analytics import SWAP_STATUSES
+from app.models import User, Skill, UserSkill, UserSkillChange, SwapRequest, DailyStat, StoredFile, _stored_key, _swap_counters
+
+FIELDS = {
+    'users': ('username', 'email', 'password_hash', 'is_public', 'is_admin', 'location',
+              'profile_photo', 'bio', 'availability', 'created_at'),
+    'skills': ('user', 'skill', 'role', 'availability', 'created_at'),
+    'swaps': ('sender', 'receiver', 'message', 'status', 'created_at', 'feedback'),
+}
+KINDS = tuple(FIELDS)
+FORMATS = ('jsonl', 'csv')
+ROLES = ('offered', 'wanted')
+MAX_ERRORS = 20
+
+
+class TransferReport:
+    """Counts for one import or export run."""
+
+    def __init__(self, kind, resumed_from=0):
+        self.kind = kind
+        self.resumed_from = resumed_from
+        self.records = resumed_from  # records read (import) or written (export), including earlier runs
+        self.inserted = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors = []
+
+    def reject(self, number, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'record {number}: {reason}')
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise ValueError(f'Cannot tell the format of {path} from its extension; pass --format')
+
+
+def checkpoint_path(path):
+    return f'{path}.checkpoint'
+
+
+def _load_checkpoint(path, kind, mode):
+    try:
+        with open(checkpoint_path(path)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get('kind') != kind or state.get('mode') != mode:
+        raise ValueError(f'{checkpoint_path(path)} belongs to a {state.get("mode")} of '
+                         f'{state.get("kind")}; delete it or pass --restart')
+    return state
+
+
+def _save_checkpoint(path, state):
+    target = checkpoint_path(path)
+    temp = f'{target}.{os.getpid()}.tmp'
+    with open(temp, 'w') as out:
+        json.dump(state, out)
+    os.replace(temp, target)
+
+
+def _clear_checkpoint(path):
+    try:
+        os.remove(checkpoint_path(path))
+    except FileNotFoundError:
+        pass
+
+
+# -- reading and writing values ---------------------------------------------
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _datetime(value):
+    if value is None or value == '':
+        return None
+    parsed = datetime.fromisoformat(str(value).strip())
+    if parsed.tzinfo is not None:
+        # Stored columns are naive UTC
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _dump(value, fmt):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if fmt == 'csv':
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+    return value
+
+
+def read_records(path, fmt):
+    """Yield each record in ``path`` as a dict."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'{path}:{line_number}: invalid JSON ({e})') from None
+            if not isinstance(record, dict):
+                raise ValueError(f'{path}:{line_number}: expected a JSON object')
+            yield record
+
+
+# -- import ------------------------------------------------------------------
+
+def _insert(connection, table):
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _resolve_users(connection, refs):
+    """``{ref: user_id}`` for refs that match a username or, failing that, an email."""
+    refs = {ref for ref in refs if ref}
+    if not refs:
+        return {}
+    table = User.__table__
+    by_username, by_email = {}, {}
+    for user_id, username, email in connection.execute(
+            db.select(table.c.id, table.c.username, table.c.email).where(
+                db.or_(table.c.username.in_(refs), table.c.email.in_(refs)))):
+        by_username[username] = user_id
+        by_email[email] = user_id
+    return {ref: by_username.get(ref, by_email.get(ref)) for ref in refs
+            if ref in by_username or ref in by_email}
+
+
+def _bump_versions(connection, user_ids):
+    if user_ids:
+        table = User.__table__
+        connection.execute(table.update().where(table.c.id.in_(user_ids)).values(
+            version=table.c.version + 1, updated_at=datetime.utcnow()))
+
+
+def _load_users(connection, batch, report):
+    now = datetime.utcnow()
+    rows = []
+    for number, record in batch:
+        username, email = _text(record.get('username')), _text(record.get('email'))
+        if not username or not email:
+            report.reject(number, 'username and email are required')
+            continue
+        try:
+            created_at = _datetime(record.get('created_at')) or now
+        except ValueError as e:
+            report.reject(number, f'bad created_at ({e})')
+            continue
+        rows.append({
+            'username': username,
+            'email': email,
+            'password_hash': _text(record.get('password_hash')),
+            'is_public': _bool(record.get('is_public'), True),
+            'is_admin': _bool(record.get('is_admin'), False),
+            'location': _text(record.get('location')),
+            'profile_photo': _text(record.get('profile_photo')),
+            'bio': _text(record.get('bio')),
+            'availability': _text(record.get('availability')),
+            'created_at': created_at,
+            'version': 1,
+            'updated_at': now,
+        })
+    if not rows:
+        return
+
+    table = User.__table__
+    stmt = _insert(connection, table).on_conflict_do_nothing().returning(
+        table.c.created_at, table.c.is_public, table.c.profile_photo)
+    inserted = connection.execute(stmt, rows).all()
+    report.inserted += len(inserted)
+    report.skipped += len(rows) - len(inserted)
+
+    stats, photos = Counter(), Counter()
+    for created_at, is_public, photo in inserted:
+        stats[created_at.date(), 'users.registered', 0] += 1
+        if is_public:
+            stats[created_at.date(), 'users.public', 0] += 1
+        if _stored_key(photo):
+            photos[photo] += 1
+    DailyStat.add(connection, stats)
+    StoredFile.add_references(connection, photos)
+
+
+def _unique_slugs(connection, names):
+    """A free slug for each new catalog name, chosen like ``Skill.get_or_create`` does."""
+    table = Skill.__table__
+    bases = {name: Skill.slugify(name) for name in names}
+    taken = {slug for (slug,) in connection.execute(
+        db.select(table.c.slug).where(table.c.slug.in_(set(bases.values()))))}
+    slugs = {}
+    for name, base in bases.items():
+        slug, suffix = base, 2
+        while slug in taken or (slug != base and connection.execute(
+                db.select(table.c.id).where(table.c.slug == slug)).first() is not None):
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        taken.add(slug)
+        slugs[name] = slug
+    return slugs
+
+
+def _resolve_skills(connection, names, first_used):
+    """``{normalized name: skill_id}``, adding catalog entries for new names."""
+    table = Skill.__table__
+    by_normalized = {Skill.normalize(name): name for name in names}
+
+    def lookup():
+        return dict(connection.execute(db.select(table.c.normalized_name, table.c.id).where(
+            table.c.normalized_name.in_(by_normalized))).all())
+
+    found = lookup()
+    missing = [name for normalized, name in by_normalized.items() if normalized not in found]
+    if missing:
+        slugs = _unique_slugs(connection, missing)
+        stmt = _insert(connection, table).on_conflict_do_nothing().returning(table.c.normalized_name)
+        created = connection.execute(stmt, [
+            {'name': name, 'normalized_name': Skill.normalize(name), 'slug': slugs[name],
+             'updated_at': datetime.utcnow()} for name in missing]).scalars().all()
+        # Dated by first use, as `flask stats backfill` does
+        DailyStat.add(connection, Counter((first_used[n].date(), 'skills.catalog', 0) for n in created))
+        found = lookup()
+    return found
+
+
+def _load_skills(connection, batch, report):
+    now = datetime.utcnow()
+    users = _resolve_users(connection, {_text(record.get('user')) for _, record in batch})
+    parsed = []
+    first_used = {}
+    for number, record in batch:
+        ref, name = _text(record.get('user')), _text(record.get('skill'))
+        role = (_text(record.get('role')) or '').lower()
+        if ref not in users:
+            report.reject(number, f'unknown user {ref!r}')
+            continue
+        name = ' '.join((name or '').split())
+        if not name or len(name) > 100:
+            report.reject(number, 'skill name is missing or too long')
+            continue
+        if role not in ROLES:
+            report.reject(number, f'role must be one of {", ".join(ROLES)}')
+            continue
+        try:
+            created_at = _datetime(record.get('created_at')) or now
+        except ValueError as e:
+            report.reject(number, f'bad created_at ({e})')
+            continue
+        normalized = Skill.normalize(name)
+        first_used[normalized] = min(created_at, first_used.get(normalized, created_at))
+        parsed.append((users[ref], name, role, _text(record.get('availability')), created_at))
+    if not parsed:
+        return
+
+    skills = _resolve_skills(connection, {name for _, name, _, _, _ in parsed}, first_used)
+    rows = [{'user_id': user_id, 'skill_id': skills[Skill.normalize(name)], 'role': role,
+             'availability': availability, 'created_at': created_at}
+            for user_id, name, role, availability, created_at in parsed]
+    table = UserSkill.__table__
+    stmt = _insert(connection, table).on_conflict_do_nothing().returning(
+        table.c.user_id, table.c.skill_id, table.c.role, table.c.created_at)
+    inserted = connection.execute(stmt, rows).all()
+    report.inserted += len(inserted)
+    report.skipped += len(rows) - len(inserted)
+    if not inserted:
+        return
+
+    connection.execute(UserSkillChange.__table__.insert(), [
+        {'user_id': user_id, 'skill_id': skill_id, 'role': role, 'added': True, 'created_at': now}
+        for user_id, skill_id, role, _ in inserted])
+    DailyStat.add(connection, Counter(
+        (created_at.date(), f'skills.{role}', skill_id) for _, skill_id, role, created_at in inserted))
+    User.add_to_counters(connection, Counter((user_id, f'{role}_count') for user_id, _, role, _ in inserted))
+    _bump_versions(connection, {user_id for user_id, _, _, _ in inserted})
+
+
+def _load_swaps(connection, batch, report):
+    now = datetime.utcnow()
+    users = _resolve_users(connection, {_text(record.get(side)) for _, record in batch
+                                        for side in ('sender', 'receiver')})
+    rows = []
+    for number, record in batch:
+        sender, receiver = _text(record.get('sender')), _text(record.get('receiver'))
+        status = (_text(record.get('status')) or 'pending').lower()
+        if sender not in users or receiver not in users:
+            report.reject(number, f'unknown user {sender if sender not in users else receiver!r}')
+            continue
+        if users[sender] == users[receiver]:
+            report.reject(number, 'sender and receiver are the same user')
+            continue
+        if status not in SWAP_STATUSES:
+            report.reject(number, f'status must be one of {", ".join(SWAP_STATUSES)}')
+            continue
+        try:
+            created_at = _datetime(record.get('created_at')) or now
+        except ValueError as e:
+            report.reject(number, f'bad created_at ({e})')
+            continue
+        rows.append({'sender_id': users[sender], 'receiver_id': users[receiver],
+                     'message': _text(record.get('message')), 'status': status,
+                     'created_at': created_at, 'updated_at': now,
+                     'feedback': _text(record.get('feedback'))})
+    if not rows:
+        return
+
+    # No unique key to conflict on; skip requests an earlier run already loaded
+    table = SwapRequest.__table__
+    natural_key = db.tuple_(table.c.sender_id, table.c.receiver_id, table.c.created_at)
+    existing = set(connection.execute(db.select(table.c.sender_id, table.c.receiver_id, table.c.created_at).where(
+        natural_key.in_([(r['sender_id'], r['receiver_id'], r['created_at']) for r in rows]))).all())
+    fresh = []
+    for row in rows:
+        key = (row['sender_id'], row['receiver_id'], row['created_at'])
+        if key not in existing:
+            existing.add(key)
+            fresh.append(row)
+    report.skipped += len(rows) - len(fresh)
+    if not fresh:
+        return
+
+    connection.execute(table.insert(), fresh)
+    report.inserted += len(fresh)
+    stats, counters = Counter(), Counter()
+    for row in fresh:
+        stats[row['created_at'].date(), 'swaps.created', 0] += 1
+        stats[row['created_at'].date(), f'swaps.status.{row["status"]}', 0] += 1
+        counters.update(_swap_counters(row['sender_id'], row['receiver_id'], row['status']))
+    DailyStat.add(connection, stats)
+    User.add_to_counters(connection, counters)
+    _bump_versions(connection, {row['sender_id'] for row in fresh} | {row['receiver_id'] for row in fresh})
+
+
+_LOADERS = {'users': _load_users, 'skills': _load_skills, 'swaps': _load_swaps}
+
+
+def import_records(kind, path, fmt=None, batch_size=1000, restart=False, progress=None):
+    """Load ``kind`` records from ``path``, resuming from its checkpoint if there is one.
+
+    Returns a ``TransferReport``. ``progress`` is called with the report
+    after every committed batch. A failing batch is rolled back and the
+    error re-raised; the checkpoint still marks the last good batch.
+    """
+    fmt = detect_format(path, fmt)
+    loader = _LOADERS[kind]
+    state = None if restart else _load_checkpoint(path, kind, 'import')
+    report = TransferReport(kind, resumed_from=state['records'] if state else 0)
+
+    def flush(batch, last_number):
+        try:
+            loader(db.session.connection(), batch, report)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        report.records = last_number
+        report.batches += 1
+        _save_checkpoint(path, {'kind': kind, 'mode': 'import', 'records': last_number})
+        if progress:
+            progress(report)
+
+    batch = []
+    number = report.resumed_from
+    for number, record in enumerate(read_records(path, fmt), 1):
+        if number <= report.resumed_from:
+            continue
+        batch.append((number, record))
+        if len(batch) >= batch_size:
+            flush(batch, number)
+            batch = []
+    if batch:
+        flush(batch, number)
+    _clear_checkpoint(path)
+    return report
+
+
+# -- export ------------------------------------------------------------------
+
+def _export_query(kind):
+    """``(query, id column)``; the query's first column is the id, the rest ``FIELDS[kind]``."""
+    if kind == 'users':
+        return db.session.query(User.id, *(getattr(User, field) for field in FIELDS['users'])), User.id
+    if kind == 'skills':
+        return db.session.query(
+            UserSkill.id, User.username.label('user'), Skill.name.label('skill'), UserSkill.role,
+            UserSkill.availability, UserSkill.created_at,
+        ).join(User, User.id == UserSkill.user_id).join(Skill, Skill.id == UserSkill.skill_id), UserSkill.id
+    sender, receiver = db.aliased(User), db.aliased(User)
+    return db.session.query(
+        SwapRequest.id, sender.username.label('sender'), receiver.username.label('receiver'),
+        SwapRequest.message, SwapRequest.status, SwapRequest.created_at, SwapRequest.feedback,
+    ).join(sender, sender.id == SwapRequest.sender_id).join(
+        receiver, receiver.id == SwapRequest.receiver_id), SwapRequest.id
+
+
+def export_records(kind, path, fmt=None, batch_size=1000, restart=False, progress=None):
+    """Write every ``kind`` row to ``path``, resuming from its checkpoint if there is one.
+
+    Rows are read ``batch_size`` at a time and the checkpoint is saved after
+    each batch. Resuming truncates anything written after the checkpoint,
+    so the file never holds a row twice.
+    """
+    fmt = detect_format(path, fmt)
+    fields = FIELDS[kind]
+    state = None if restart else _load_checkpoint(path, kind, 'export')
+    report = TransferReport(kind, resumed_from=state['records'] if state else 0)
+    query, id_column = _export_query(kind)
+
+    if state:
+        if not os.path.exists(path) or os.path.getsize(path) < state['offset']:
+            raise ValueError(f'{path} is shorter than its checkpoint says; pass --restart')
+        out = open(path, 'r+', newline='', encoding='utf-8')
+        out.truncate(state['offset'])
+        out.seek(state['offset'])
+        query = query.filter(id_column > state['last_id'])
+    else:
+        out = open(path, 'w', newline='', encoding='utf-8')
+
+    with out:
+        writer = csv.writer(out) if fmt == 'csv' else None
+        if writer and not state:
+            writer.writerow(fields)
+
+        def flush(last_id):
+            out.flush()
+            os.fsync(out.fileno())
+            report.batches += 1
+            _save_checkpoint(path, {'kind': kind, 'mode': 'export', 'last_id': last_id,
+                                    'offset': out.tell(), 'records': report.records})
+            if progress:
+                progress(report)
+
+        pending = 0
+        row_id = None
+        for row in query.order_by(id_column).yield_per(batch_size):
+            row_id, values = row[0], [_dump(value, fmt) for value in row[1:]]
+            if writer:
+                writer.writerow(values)
+            else:
+                out.write(json.dumps(dict(zip(fields, values)), ensure_ascii=False) + '\n')
+            report.records += 1
+            pending += 1
+            if pending >= batch_size:
+                flush(row_id)
+                pending = 0
+        if pending:
+            flush(row_id)
+    _clear_checkpoint(path)
+    return report
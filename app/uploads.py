@@ -0,0 +1,154 @@
+"""Garbage collection for stored uploads nobody references any more.
+
+Replacing or removing a profile photo leaves its files behind. ``collect``
+finds them by streaming the ``user.profile_photo`` column in batches into a
+set of referenced names, then walking storage one entry at a time
+(``os.scandir`` for local storage, paged listings for S3). Memory grows
+with the number of distinct photos in use, never with the number of users
+or files.
+
+A file is removed only when nothing references it and it is older than the
+grace period, which covers uploads still being processed and profile edits
+that haven't committed yet. Content-addressed photos are also checked
+against ``stored_file`` just before removal, since an identical upload may
+have started sharing them after the reference scan.
+"""
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.images import PHOTO_SIZES
+from app.models import User, StoredFile
+from app.storage import get_storage
+
+_DERIVATIVE = re.compile(r'^(?P<base>[^.]+)-(?:%s)\.[a-z]+(?:\.tmp)?$' % '|'.join(PHOTO_SIZES))
+_IN_FLIGHT = re.compile(r'^(?P<base>[^.]+)\.upload$')
+
+
+class GcReport:
+    """Counts for one collection run."""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.referenced = 0
+        self.scanned = 0
+        self.kept = 0
+        self.too_new = 0
+        self.removed = 0
+        self.reclaimed_bytes = 0
+        self.failed = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _owner(name):
+    """The ``profile_photo`` value ``name`` belongs to, if it is a pipeline file."""
+    match = _DERIVATIVE.match(name) or _IN_FLIGHT.match(name)
+    return match.group('base') if match else None
+
+
+def referenced_names(batch_size=5000):
+    """Every distinct ``profile_photo`` value, streamed from the database."""
+    names = set()
+    rows = db.session.query(User.profile_photo).filter(
+        User.profile_photo.isnot(None), User.profile_photo != ''
+    ).execution_options(yield_per=batch_size)
+    for (photo,) in rows:
+        names.add(photo)
+    return names
+
+
+def _still_released(keys, cutoff):
+    """The subset of ``keys`` with no references since before ``cutoff``."""
+    if not keys:
+        return set()
+    live = {key for (key,) in db.session.query(StoredFile.key).filter(
+        StoredFile.key.in_(keys),
+        db.or_(StoredFile.refcount > 0, StoredFile.released_at >= cutoff),
+    )}
+    return set(keys) - live
+
+
+def _quarantine(storage, name, quarantine_dir):
+    target = os.path.join(quarantine_dir, name)
+    if storage.local_root is not None:
+        shutil.move(storage.path(name), target)
+        return
+    with storage.open(name) as body, open(target, 'wb') as out:
+        shutil.copyfileobj(body, out)
+    storage.delete(name)
+
+
+def collect(grace=timedelta(hours=24), dry_run=False, quarantine_dir=None, batch_size=1000,
+            progress=None):
+    """Remove (or move to ``quarantine_dir``) unreferenced uploads older than ``grace``.
+
+    Returns a ``GcReport``. ``progress`` is called with the report after
+    every batch of candidates.
+    """
+    storage = get_storage()
+    report = GcReport(dry_run)
+    referenced = referenced_names()
+    report.referenced = len(referenced)
+    now = time.time()
+    oldest = now - grace.total_seconds()
+    cutoff = datetime.utcnow() - grace
+    if quarantine_dir and not dry_run:
+        os.makedirs(quarantine_dir, exist_ok=True)
+
+    def flush(batch):
+        # Re-check shared photos against their refcounts right before removal
+        keys = {owner for _, _, owner in batch if owner}
+        released = _still_released(keys, cutoff)
+        removed_keys = set()
+        for name, size, owner in batch:
+            if owner and owner not in released:
+                report.kept += 1
+                continue
+            if not dry_run:
+                try:
+                    if quarantine_dir:
+                        _quarantine(storage, name, quarantine_dir)
+                    else:
+                        storage.delete(name)
+                except OSError as e:
+                    report.failed += 1
+                    current_app.logger.error(f"Upload GC error for {name}: {str(e)}")
+                    continue
+            if owner:
+                removed_keys.add(owner)
+            report.removed += 1
+            report.reclaimed_bytes += size
+        if removed_keys and not dry_run:
+            StoredFile.query.filter(
+                StoredFile.key.in_(removed_keys), StoredFile.refcount <= 0
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        if progress:
+            progress(report)
+
+    batch = []
+    for name, size, mtime in storage.iter_names():
+        if name.startswith('.'):
+            continue
+        report.scanned += 1
+        owner = _owner(name)
+        if name in referenced or (owner and owner in referenced):
+            report.kept += 1
+            continue
+        if mtime > oldest:
+            report.too_new += 1
+            continue
+        batch.append((name, size, owner))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
@@ -0,0 +1,164 @@
+"""Flask-Login user loading backed by a small in-process cache.
+
+Flask-Login already keeps the loaded user for the rest of a request. This
+adds a per-worker cache of each user's column values, bounded in size and
+age (``USER_CACHE_SIZE``, ``USER_CACHE_TTL`` seconds). A hit runs no SQL.
+
+Any flushed change to a user (profile edits, admin actions, password
+changes, and the version bumps from skill and swap changes) drops them from
+this worker's cache. Once the change commits, a ``user-changed:<id>`` stamp
+also goes into the fragment cache backend. A hit that was loaded before the
+stamp is thrown away and reloaded. With ``FRAGMENT_CACHE=redis`` the stamp
+is shared, so an ``is_admin`` or ``is_public`` change reaches every worker
+on its next request. The memory backend only covers this worker, and the
+redis backend costs a round trip per hit. With fragment caching off,
+entries are trusted for the TTL, so keep it short.
+
+Misses load from the primary, never the read replica. Session protection
+runs before the loader and is unaffected.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app import db
+from app.fragments import get_fragment_cache
+from app.models import User
+
+
+class UserCache:
+    """LRU of user id -> (load time, column values) with a per-entry TTL."""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def put(self, user_id, values):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('user_cache', UserCache(
+            max_size=current_app.config['USER_CACHE_SIZE'],
+            ttl=current_app.config['USER_CACHE_TTL'],
+        ))
+    return cache
+
+
+_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+
+def load_user(user_id):
+    """``login_manager.user_loader`` callback."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    cache = get_user_cache()
+    entry = cache.get(user_id)
+    if entry is not None and _changed_since(user_id, entry[0]):
+        cache.invalidate(user_id)
+        entry = None
+    if entry is None:
+        loaded_at = time.time()  # before the read: a change committed during it must win
+        # The replica may lag; who may do what is always read from the primary
+        user = db.session.get(User, user_id, bind_arguments={'bind': db.engine})
+        if user is not None:
+            cache.put(user_id, (loaded_at, {key: getattr(user, key) for key in _COLUMNS}))
+        return user
+
+    # Rebuild the row as if it had just been loaded, then attach it to this
+    # request's session (load=False: no SELECT, reuses an instance already there)
+    user = User(**entry[1])
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _stamp_key(user_id):
+    return f'user-changed:{user_id}'
+
+
+def _changed_since(user_id, loaded_at):
+    """Whether another request committed a change to the user after ``loaded_at``."""
+    backend = get_fragment_cache()
+    if backend is None:
+        return False
+    stamp = backend.get_many([_stamp_key(user_id)]).get(_stamp_key(user_id))
+    return stamp is not None and float(stamp) >= loaded_at
+
+
+def _changed_user_ids(session):
+    # Users whose version was bumped by _bump_user_versions in this flush
+    ids = set(session.info.pop('bumped_user_ids', ()))
+    for obj in session.dirty:
+        if isinstance(obj, User) and session.is_modified(obj, include_collections=False):
+            ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            ids.add(obj.id)
+    return ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_users(session, flush_context):
+    ids = _changed_user_ids(session)
+    if ids and has_app_context():
+        cache = get_user_cache()
+        for user_id in ids:
+            cache.invalidate(user_id)
+        # A request racing with this transaction could re-cache the old row
+        # before it commits; drop these ids again once the commit lands
+        session.info.setdefault('user_cache_invalidate', set()).update(ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    ids = session.info.pop('user_cache_invalidate', None)
+    if ids and has_app_context():
+        cache = get_user_cache()
+        backend = get_fragment_cache()
+        stamp = repr(time.time())
+        for user_id in ids:
+            cache.invalidate(user_id)
+            if backend is not None:
+                backend.set(_stamp_key(user_id), stamp)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_users(session):
+    session.info.pop('user_cache_invalidate', None)
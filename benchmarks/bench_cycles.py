@@ -0,0 +1,65 @@
+"""Swap-circle search throughput on synthetic want/offer graphs.
+
+Usage:
+    python benchmarks/bench_cycles.py                          # 10k/100k users
+    python benchmarks/bench_cycles.py --users 300000 --processes 1,4,8
+    python benchmarks/bench_cycles.py --max-length 5 --sample 2000
+
+Skill popularity follows a Zipf-like distribution, so a few skills are
+offered and wanted by many users (the hub case that makes naive cycle
+enumeration blow up). No database is needed.
+"""
+import argparse
+import random
+import sys
+import time
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from app.cycles import CsrGraph, batch_find_cycles  # noqa: E402
+
+
+def synthetic_rows(users, skills, per_user=3, skew=1.1, seed=42):
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, skills + 1)]
+    for user_id in range(1, users + 1):
+        for role in ('offered', 'wanted'):
+            for skill_id in set(rng.choices(range(1, skills + 1), weights=weights, k=per_user)):
+                yield user_id, skill_id, role
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', default='10000,100000')
+    parser.add_argument('--skills', type=int, default=2000)
+    parser.add_argument('--per-user', type=int, default=3, help='Skills offered and wanted per user.')
+    parser.add_argument('--max-length', type=int, default=4)
+    parser.add_argument('--budget', type=int, default=20000, help='DFS steps per start user.')
+    parser.add_argument('--sample', type=int, default=1000, help='Start users searched per run (0 = all).')
+    parser.add_argument('--processes', default='1,2,4')
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'edges':>9} {'build s':>8} {'procs':>6} {'starts':>7} "
+          f"{'time s':>8} {'starts/s':>9} {'circles':>8} {'best':>10}")
+    for users in [int(u) for u in args.users.split(',')]:
+        rows = list(synthetic_rows(users, args.skills, args.per_user))
+        started = time.perf_counter()
+        graph = CsrGraph.from_rows(rows)
+        build = time.perf_counter() - started
+
+        starts = list(range(len(graph)))
+        if args.sample:
+            starts = random.Random(7).sample(starts, min(args.sample, len(starts)))
+        for processes in [int(p) for p in args.processes.split(',')]:
+            started = time.perf_counter()
+            cycles = batch_find_cycles(graph, max_length=args.max_length, budget=args.budget,
+                                       processes=processes, starts=starts)
+            elapsed = time.perf_counter() - started
+            best = '-'.join(str(w) for w in cycles[0].weights) if cycles else '-'
+            print(f'{users:>8} {len(rows):>9} {build:>8.2f} {processes:>6} {len(starts):>7} '
+                  f'{elapsed:>8.2f} {len(starts) / elapsed:>9.0f} {len(cycles):>8} {best:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""End-to-end latency, throughput and SQL counts for the main pages.
+
+Usage:
+    python benchmarks/bench_endpoints.py                           # 2k users, test client
+    python benchmarks/bench_endpoints.py --users 50000 --requests 300
+    python benchmarks/bench_endpoints.py --mode http --workers 4 --concurrency 8
+    python benchmarks/bench_endpoints.py --save-baseline baseline.json
+    python benchmarks/bench_endpoints.py --baseline baseline.json  # exit 1 on regressions
+
+The database is filled with a synthetic community (see synthetic.py) through
+``flask data import``, then each page is requested as a logged-in user, or
+as the admin for admin pages. ``client`` mode calls the app in-process
+through the Werkzeug test client. ``http`` mode forks ``--workers`` server
+processes on a shared socket and sends requests from ``--concurrency``
+threads. Pages are fetched without validators, so every response is a full
+render; the fragment cache warms up during the warm-up requests as it would
+in production.
+
+Unless --reuse is given, the target database is wiped and refilled, so only
+point --database-uri at a scratch database.
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname
+from urllib.parse import urlencode
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# (name, endpoint, query args, who)
+ENDPOINTS = [
+    ('dashboard', 'main.index', {}, 'user'),
+    ('browse', 'swaps.browse', {}, 'user'),
+    ('browse_skill', 'swaps.browse', {'skill': 'python'}, 'user'),
+    ('search', 'main.search', {'q': 'gui'}, 'user'),
+    ('requests', 'swaps.manage_requests', {}, 'user'),
+    ('admin', 'admin.dashboard', {}, 'admin'),
+    ('admin_users', 'admin.manage_users', {}, 'admin'),
+    ('admin_skills', 'admin.manage_skills', {}, 'admin'),
+    ('admin_swaps', 'admin.manage_swaps', {}, 'admin'),
+]
+SQL_HEADER = 'X-Bench-SQL'
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return samples[max(0, math.ceil(pct / 100 * len(samples)) - 1)]
+
+
+def summarize(samples, sql, errors, elapsed):
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'sql': sql / len(samples),
+        'errors': errors,
+    }
+
+
+def instrument(app):
+    """Count the SQL statements each request runs into a response header."""
+    from flask import g, has_request_context
+    from sqlalchemy import event
+    from app import db
+
+    def count(*_):
+        if has_request_context():
+            g.bench_sql = g.get('bench_sql', 0) + 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+
+    @app.after_request
+    def report_sql(response):
+        response.headers[SQL_HEADER] = str(g.get('bench_sql', 0))
+        return response
+
+
+def prepare(app, args):
+    """Fill the database unless reusing it; returns ``{who: (email, password)}``."""
+    from app import db
+    from app.models import User, SwapRequest
+    from synthetic import PASSWORD, Community
+
+    with app.app_context():
+        if not args.reuse:
+            db.drop_all()
+            db.create_all()
+            community = Community(users=args.users, skills=args.skills, seed=args.seed)
+            started = time.perf_counter()
+            reports = community.load(tempfile.mkdtemp(prefix='bench_endpoints'))
+            print(f'Loaded {", ".join(f"{r.inserted} {kind}" for kind, r in reports.items())} '
+                  f'in {time.perf_counter() - started:.1f}s')
+        # The busiest regular user, so the requests page has something to show
+        busiest = db.session.query(SwapRequest.receiver_id).join(User, User.id == SwapRequest.receiver_id).filter(
+            User.is_admin == False).group_by(SwapRequest.receiver_id).order_by(
+            db.func.count().desc(), SwapRequest.receiver_id).limit(1).scalar()
+        user = db.session.get(User, busiest) if busiest else User.query.filter_by(is_admin=False).first()
+        admin = User.query.filter_by(is_admin=True).first()
+        accounts = {'user': (user.email, PASSWORD), 'admin': (admin.email, PASSWORD)}
+        db.session.remove()
+    return accounts
+
+
+def urls(app):
+    from flask import url_for
+
+    with app.test_request_context():
+        return [(name, url_for(endpoint, **values), who) for name, endpoint, values, who in ENDPOINTS]
+
+
+def run_client(app, accounts, targets, args):
+    from werkzeug.test import Client
+
+    clients = {}
+    for who, (email, password) in accounts.items():
+        clients[who] = Client(app)
+        response = clients[who].post('/auth/login', data={'email': email, 'password': password})
+        assert response.status_code == 302, f'login as {email} failed ({response.status_code})'
+
+    results = {}
+    for name, url, who in targets:
+        client = clients[who]
+        for _ in range(args.warmup):
+            client.get(url)
+        samples, sql, errors = [], 0, 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - start) * 1000)
+            response.close()
+            sql += int(response.headers.get(SQL_HEADER, 0))
+            errors += response.status_code != 200
+        results[name] = summarize(samples, sql, errors, time.perf_counter() - started)
+    return results
+
+
+def _serve(app, fd):
+    from werkzeug.serving import make_server
+    from app import db
+
+    with app.app_context():
+        db.engine.dispose()  # don't share the parent's connections
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', 0, app, fd=fd).serve_forever()
+
+
+def _fetch(port, method, url, cookie=None, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Cookie': cookie} if cookie else {}
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    start = time.perf_counter()
+    connection.request(method, url, body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    elapsed = (time.perf_counter() - start) * 1000
+    connection.close()
+    return response, elapsed
+
+
+def cookie_header(response):
+    """The ``Cookie`` header to send back for ``response``'s non-empty cookies."""
+    pairs = (value.split(';', 1)[0] for value in response.msg.get_all('Set-Cookie') or ())
+    return '; '.join(pair for pair in pairs if not pair.endswith('='))
+
+
+def run_http(app, accounts, targets, args):
+    from app import db
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(256)
+    port = listener.getsockname()[1]
+    with app.app_context():
+        db.engine.dispose()
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_serve, args=(app, listener.fileno()), daemon=True)
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        cookies = {}
+        for who, (email, password) in accounts.items():
+            response, _ = _fetch(port, 'POST', '/auth/login', body=urlencode({'email': email, 'password': password}))
+            assert response.status == 302, f'login as {email} failed ({response.status})'
+            cookies[who] = cookie_header(response)
+
+        results = {}
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for name, url, who in targets:
+                def one(_):
+                    response, elapsed = _fetch(port, 'GET', url, cookies[who])
+                    return elapsed, int(response.getheader(SQL_HEADER) or 0), response.status != 200
+
+                list(pool.map(one, range(args.warmup * args.workers)))
+                started = time.perf_counter()
+                outcomes = list(pool.map(one, range(args.requests)))
+                elapsed = time.perf_counter() - started
+                results[name] = summarize([o[0] for o in outcomes], sum(o[1] for o in outcomes),
+                                          sum(o[2] for o in outcomes), elapsed)
+        return results
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        listener.close()
+
+
+def compare(results, baseline, tolerance):
+    """``{name: note}`` for endpoints slower (p95) or chattier (SQL) than the baseline."""
+    regressions = {}
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        notes = []
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            notes.append(f"p95 {result['p95'] / base['p95'] - 1:+.0%}")
+        if result['sql'] > base['sql'] + 0.01:
+            notes.append(f"sql {base['sql']:.1f}->{result['sql']:.1f}")
+        if notes:
+            regressions[name] = ', '.join(notes)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--skills', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark the existing data instead of reloading.')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--workers', type=int, default=2, help='Server processes in http mode.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Client threads in http mode.')
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', help='Comma-separated endpoint names to run.')
+    parser.add_argument('--baseline', help='Compare against this baseline; exit 1 on regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown (0.2 = 20%%).')
+    parser.add_argument('--save-baseline', help='Write the results here as a new baseline.')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bench_endpoints')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri or 'sqlite:///' + os.path.join(scratch, 'bench.db')
+    os.environ['SCHEMA_CHECK'] = 'false'  # scratch schema comes from create_all
+    os.environ.setdefault('STATIC_BUILD_DIR', os.path.join(scratch, 'static-build'))
+
+    from app import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False  # the login POST has no form token
+    accounts = prepare(app, args)
+    instrument(app)
+    targets = urls(app)
+    if args.only:
+        wanted = set(args.only.split(','))
+        targets = [target for target in targets if target[0] in wanted]
+
+    runner = run_http if args.mode == 'http' else run_client
+    results = runner(app, accounts, targets, args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('users') != args.users or baseline['meta'].get('mode') != args.mode:
+            print(f"warning: baseline was recorded with {baseline['meta']}", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance) if baseline else {}
+
+    mode = args.mode if args.mode == 'client' else f'http, {args.workers} workers x {args.concurrency} clients'
+    print(f'{args.users} users, {args.requests} requests per endpoint ({mode})')
+    print(f"{'endpoint':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'sql':>6}{'errors':>8}  baseline")
+    for name, result in results.items():
+        base = baseline['results'].get(name) if baseline else None
+        verdict = regressions.get(name, 'ok' if base else '-')
+        print(f"{name:<14}{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}"
+              f"{result['rps']:>9.1f}{result['sql']:>6.1f}{result['errors']:>8}  {verdict}")
+
+    if args.save_baseline:
+        meta = {'users': args.users, 'skills': args.skills, 'seed': args.seed, 'mode': args.mode,
+                'workers': args.workers, 'concurrency': args.concurrency, 'requests': args.requests}
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1, sort_keys=True)
+        print(f'Saved baseline to {args.save_baseline}')
+    if regressions or any(result['errors'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Per-request cost of schema bootstrap: create_all() in before_request vs none.
+
+Usage:
+    python benchmarks/bench_request_overhead.py
+    python benchmarks/bench_request_overhead.py --requests 2000 --path /auth/login
+    python benchmarks/bench_request_overhead.py --database-uri postgresql://.../scratch_db
+
+"before" re-registers the old ``@app.before_request`` hook that called
+``db.create_all()``; "after" is the app as shipped, which checks the schema
+revision once at startup. The target database is wiped, so only point
+--database-uri at a scratch database.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--path', default='/auth/login')
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_overhead.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = uri
+    os.environ['SCHEMA_CHECK'] = 'false'  # scratch schema comes from create_all below
+
+    from sqlalchemy import event
+    from werkzeug.test import Client
+    from app import create_app, db
+
+    queries = [0]
+
+    def count(*_):
+        queries[0] += 1
+
+    def run(label, app):
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        client = Client(app)
+        client.get(args.path)  # warm-up
+        samples = []
+        queries[0] = 0
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(args.path)
+            samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f'{label:<8}{statistics.median(samples):>10.2f}{p95:>10.2f}{queries[0] / args.requests:>14.1f}')
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    before = create_app()
+    with before.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f'Database: {db.engine.url.render_as_string(hide_password=True)}, GET {args.path} x {args.requests}')
+
+    @before.before_request
+    def create_tables():
+        db.create_all()
+
+    print(f"{'':<8}{'p50 ms':>10}{'p95 ms':>10}{'SQL/request':>14}")
+    run('before', before)
+    run('after', create_app())
+
+
+if __name__ == '__main__':
+    main()
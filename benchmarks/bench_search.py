@@ -0,0 +1,103 @@
+"""Compare skill search latency: leading-wildcard ILIKE vs the trigram backend.
+
+Usage:
+    python benchmarks/bench_search.py                      # temp SQLite, 10k/100k/1M skills
+    python benchmarks/bench_search.py --sizes 10000,100000
+    python benchmarks/bench_search.py --database-uri postgresql://.../scratch_db
+
+The target database is wiped and refilled for every size, so only point
+--database-uri at a scratch database.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+WORDS = [
+    'python', 'guitar', 'cooking', 'photography', 'spanish', 'french', 'piano', 'yoga',
+    'drawing', 'painting', 'javascript', 'marketing', 'design', 'writing', 'chess', 'baking',
+    'gardening', 'running', 'swimming', 'singing', 'dancing', 'knitting', 'pottery', 'welding',
+    'accounting', 'statistics', 'calculus', 'physics', 'chemistry', 'biology', 'history', 'rust',
+]
+LEVELS = ['beginner', 'intermediate', 'advanced', 'applied', 'creative', 'modern', 'classical']
+QUERIES = ['pyth', 'photo', 'guitr', 'javscript', 'ceramics', 'advanced chess', 'ing', 'sql']
+
+
+def skill_rows(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        name = f'{rng.choice(LEVELS)} {rng.choice(WORDS)} {rng.choice(WORDS)} {i}'
+        yield {'id': i, 'name': name.title(), 'normalized_name': name, 'slug': name.replace(' ', '-')}
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = uri
+    os.environ['SCHEMA_CHECK'] = 'false'  # scratch schema comes from create_all below
+
+    from app import create_app, db
+    from app.models import Skill
+    from app.search import InProcessTrigramSearch, PostgresTrigramSearch
+
+    app = create_app()
+    with app.app_context():
+        postgres = db.engine.dialect.name == 'postgresql'
+        print(f'Database: {db.engine.url.render_as_string(hide_password=True)}')
+        print(f"{'skills':>9}  {'query':<16}{'ILIKE ms':>10}{'trigram ms':>12}{'hits':>6}")
+
+        for size in [int(s) for s in args.sizes.split(',')]:
+            db.drop_all()
+            db.create_all()
+            if postgres:
+                db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                db.session.execute(db.text(
+                    'CREATE INDEX ix_skill_normalized_name_trgm ON skill '
+                    'USING gin (normalized_name gin_trgm_ops)'))
+            batch = []
+            for row in skill_rows(size):
+                batch.append(row)
+                if len(batch) == 10000:
+                    db.session.execute(Skill.__table__.insert(), batch)
+                    batch = []
+            if batch:
+                db.session.execute(Skill.__table__.insert(), batch)
+            db.session.commit()
+            if postgres:
+                db.session.execute(db.text('ANALYZE skill'))
+
+            search = PostgresTrigramSearch() if postgres else InProcessTrigramSearch()
+            start = time.perf_counter()
+            search.search_skills('warmup')
+            print(f'{size:>9}  index warm-up {(time.perf_counter() - start) * 1000:.0f} ms')
+
+            for q in QUERIES:
+                ilike_ms, _ = timed(lambda: Skill.query.filter(
+                    Skill.name.ilike(f'%{q}%')).limit(20).all(), args.repeat)
+                trigram_ms, _ = timed(lambda: search.search_skills(q, limit=20), args.repeat)
+                hits = len(search.search_skills(q, limit=20))
+                print(f'{size:>9}  {q:<16}{ilike_ms:>10.2f}{trigram_ms:>12.2f}{hits:>6}')
+
+
+if __name__ == '__main__':
+    main()
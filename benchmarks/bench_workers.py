@@ -0,0 +1,192 @@
+"""Throughput of the gunicorn worker modes on the same data and request mix.
+
+Usage:
+    python benchmarks/bench_workers.py                             # sync:4 vs threaded:2x4
+    python benchmarks/bench_workers.py --modes sync:2,sync:4,threaded:1x8,threaded:2x4
+    python benchmarks/bench_workers.py --database-uri postgresql://localhost/skillswap_bench --seconds 30
+
+Each mode is ``sync:WORKERS`` or ``threaded:WORKERSxTHREADS``. For every
+mode, gunicorn is started with gunicorn.conf.py and the production profile
+(so the connection pools are sized the way they would be in a deployment).
+Then ``--concurrency`` client threads request the pages in a loop for
+``--seconds`` as one logged-in user. Latency is measured client-side and
+includes connection setup.
+
+Unless --reuse is given, the target database is wiped and refilled with a
+synthetic community, so only point --database-uri at a scratch database.
+"""
+import argparse
+import http.client
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname
+from urllib.parse import urlencode
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_endpoints import cookie_header, percentile, prepare, urls  # noqa: E402
+
+DEFAULT_PAGES = 'dashboard,browse,browse_skill,search,requests'
+_CSRF = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def parse_mode(spec):
+    """``'sync:4'`` -> ``('sync', 4, 1)``, ``'threaded:2x4'`` -> ``('threaded', 2, 4)``."""
+    mode, _, size = spec.partition(':')
+    workers, _, threads = size.partition('x')
+    if mode not in ('sync', 'threaded') or not workers.isdigit() or (threads and not threads.isdigit()):
+        raise argparse.ArgumentTypeError(f'bad mode {spec!r}; use sync:N or threaded:NxT')
+    if mode == 'sync' and threads:
+        raise argparse.ArgumentTypeError(f'sync workers have one thread: {spec!r}')
+    return mode, int(workers), int(threads or (4 if mode == 'threaded' else 1))
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _request(port, method, url, cookie=None, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Cookie': cookie} if cookie else {}
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    try:
+        connection.request(method, url, body=body, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def login(port, email, password):
+    """Log in through the real form (CSRF on) and return the session cookie."""
+    response, page = _request(port, 'GET', '/auth/login')
+    cookie = cookie_header(response)
+    token = _CSRF.search(page.decode()).group(1)
+    body = urlencode({'email': email, 'password': password, 'csrf_token': token})
+    response, _ = _request(port, 'POST', '/auth/login', cookie, body)
+    assert response.status == 302, f'login as {email} failed ({response.status})'
+    return cookie_header(response)
+
+
+def start_server(mode, workers, threads, port, env):
+    env = dict(env, WEB_WORKER_MODE=mode, GUNICORN_WORKERS=str(workers), WEB_THREADS=str(threads),
+               METRICS_DIR=tempfile.mkdtemp(prefix='bench_workers_metrics'))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'run:app'],
+        cwd=ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            if _request(port, 'GET', '/auth/login')[0].status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not come up within 60s')
+
+
+def drive(port, cookie, paths, concurrency, seconds):
+    """Request ``paths`` round-robin from ``concurrency`` threads for ``seconds``."""
+    samples, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        mine, failed, i = [], 0, offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response, _ = _request(port, 'GET', paths[i % len(paths)], cookie)
+                failed += response.status != 200
+            except OSError:
+                failed += 1
+            mine.append((time.perf_counter() - start) * 1000)
+            i += 1
+        with lock:
+            samples.extend(mine)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / elapsed,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'errors': errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='sync:4,threaded:2x4',
+                        type=lambda value: [parse_mode(spec) for spec in value.split(',')])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--skills', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark the existing data instead of reloading.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Client threads.')
+    parser.add_argument('--seconds', type=float, default=10, help='Measured time per mode.')
+    parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds per mode first.')
+    parser.add_argument('--pages', default=DEFAULT_PAGES, help='Comma-separated pages from bench_endpoints.')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bench_workers')
+    env = dict(os.environ,
+               SQLALCHEMY_DATABASE_URI=args.database_uri or 'sqlite:///' + os.path.join(scratch, 'bench.db'),
+               SCHEMA_CHECK='false',  # scratch schema comes from create_all
+               STATIC_BUILD_DIR=os.path.join(scratch, 'static-build'))
+    os.environ.update(env)
+
+    from app import create_app
+
+    app = create_app()
+    accounts = prepare(app, args)
+    wanted = set(args.pages.split(','))
+    paths = [url for name, url, who in urls(app) if name in wanted and who == 'user']
+    if not paths:
+        parser.error(f'no user pages among {args.pages!r}')
+
+    results = []
+    for mode, workers, threads in args.modes:
+        port = _free_port()
+        server = start_server(mode, workers, threads, port, env)
+        try:
+            cookie = login(port, *accounts['user'])
+            drive(port, cookie, paths, args.concurrency, args.warmup)
+            results.append(((mode, workers, threads), drive(port, cookie, paths, args.concurrency, args.seconds)))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f'{args.users} users, {len(paths)} pages, {args.concurrency} clients, {args.seconds:g}s per mode')
+    print(f"{'mode':<10}{'workers':>8}{'threads':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for (mode, workers, threads), result in results:
+        print(f"{mode:<10}{workers:>8}{threads:>8}{result['rps']:>9.1f}{result['p50']:>9.2f}"
+              f"{result['p95']:>9.2f}{result['p99']:>9.2f}{result['errors']:>8}")
+    if any(result['errors'] for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Write throughput and error rate on SQLite with several processes writing at once.
+
+Usage:
+    python benchmarks/bench_writes.py                              # 4 processes x 2 threads, 10s per mode
+    python benchmarks/bench_writes.py --processes 8 --threads 4 --seconds 20
+    python benchmarks/bench_writes.py --modes journal,wal+lane
+
+Every mode gets a fresh database file with a synthetic community. Then
+``--processes`` forked workers with ``--threads`` threads each act as
+different users for ``--seconds``. Each one sends a swap request through
+``POST /api/v1/requests`` and cancels it again, over and over, so every
+iteration commits twice. Modes:
+
+- ``journal``: the old behaviour. Rollback journal, the driver's own busy
+  timeout, deferred transactions.
+- ``wal``: WAL and the pragmas from app.sqlite_mode, without the write lane.
+- ``wal+lane``: WAL plus the write lane (BEGIN IMMEDIATE with retries).
+
+A 409 (a pending request to that user already exists) is a normal outcome,
+not an error. Errors are 5xx responses, mostly "database is locked".
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+MODES = {
+    'journal': {'SQLITE_WAL': False, 'SQLITE_WRITE_LANE': False},
+    'wal': {'SQLITE_WAL': True, 'SQLITE_WRITE_LANE': False},
+    'wal+lane': {'SQLITE_WAL': True, 'SQLITE_WRITE_LANE': True},
+}
+
+
+def make_app(mode, path):
+    from app import create_app
+    from app.config import Config
+
+    settings = dict(MODES[mode], SQLALCHEMY_DATABASE_URI='sqlite:///' + path,
+                    WTF_CSRF_ENABLED=False, PERF_SAMPLE_RATE=0.0)
+    app = create_app(type('BenchConfig', (Config,), settings))
+    app.logger.setLevel(logging.CRITICAL)  # failed writes are counted, not logged
+    return app
+
+
+def prepare(app, args):
+    """Load the community; returns the ids of users others can send requests to."""
+    from app import db
+    from app.models import User
+    from synthetic import Community
+
+    with app.app_context():
+        db.create_all()
+        Community(users=args.users, seed=args.seed).load(tempfile.mkdtemp(prefix='bench_writes'))
+        receivers = [user_id for (user_id,) in db.session.query(User.id).filter(User.is_public == True)]
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return receivers
+
+
+def _client_loop(app, user_index, receivers, deadline, seed, totals, lock):
+    from werkzeug.test import Client
+    from synthetic import PASSWORD
+
+    client = Client(app)
+    response = client.post('/auth/login', data={'email': f'user{user_index}@example.com', 'password': PASSWORD})
+    assert response.status_code == 302, f'login as user{user_index} failed ({response.status_code})'
+    rng = random.Random(seed)
+    writes = conflicts = errors = 0
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = client.post('/api/v1/requests', json={'receiver_id': rng.choice(receivers)})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code == 201:
+            writes += 1
+            swap_id = response.get_json()['data']['id']
+            start = time.perf_counter()
+            response = client.post(f'/api/v1/requests/{swap_id}/cancel', json={})
+            latencies.append((time.perf_counter() - start) * 1000)
+            writes += response.status_code == 200
+            errors += response.status_code >= 500
+        elif response.status_code in (400, 404, 409):
+            conflicts += 1  # yourself, a private profile or already pending
+        else:
+            errors += 1
+    with lock:
+        totals['writes'] += writes
+        totals['conflicts'] += conflicts
+        totals['errors'] += errors
+        totals['latencies'].extend(latencies)
+
+
+def _worker(app, index, args, receivers, deadline, results):
+    from app import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)  # don't share the parent's connections
+    totals = {'writes': 0, 'conflicts': 0, 'errors': 0, 'latencies': []}
+    lock = threading.Lock()
+    threads = []
+    for thread in range(args.threads):
+        user_index = 1 + index * args.threads + thread  # user0 is the admin
+        threads.append(threading.Thread(target=_client_loop, args=(
+            app, user_index, receivers, deadline, args.seed + user_index, totals, lock)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(totals)
+
+
+def run_mode(mode, args):
+    from bench_endpoints import percentile
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_writes'), 'writes.db')
+    app = make_app(mode, path)
+    receivers = prepare(app, args)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    started = time.perf_counter()
+    deadline = started + args.seconds + 1  # forked workers need a moment to log in
+    workers = [context.Process(target=_worker, args=(app, index, args, receivers, deadline, results))
+               for index in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for total in totals for ms in total['latencies'])
+    writes = sum(total['writes'] for total in totals)
+    errors = sum(total['errors'] for total in totals)
+    attempts = writes + errors
+    return {
+        'writes': writes,
+        'wps': writes / elapsed,
+        'conflicts': sum(total['conflicts'] for total in totals),
+        'errors': errors,
+        'error_rate': errors / attempts if attempts else 0.0,
+        'p50': percentile(latencies, 50) if latencies else 0.0,
+        'p99': percentile(latencies, 99) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=2, help='Writer threads per process.')
+    parser.add_argument('--seconds', type=float, default=10, help='Measured time per mode.')
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s) {', '.join(sorted(unknown))}; choose from {', '.join(MODES)}")
+    if 1 + args.processes * args.threads > args.users:
+        parser.error('need more --users than writers')
+
+    os.environ['SCHEMA_CHECK'] = 'false'  # scratch schema comes from create_all
+    os.environ.setdefault('STATIC_FINGERPRINT', 'false')
+    results = {mode: run_mode(mode, args) for mode in modes}
+
+    print(f'{args.processes} processes x {args.threads} threads, {args.seconds:g}s per mode')
+    print(f"{'mode':<10}{'writes':>8}{'writes/s':>10}{'409s':>7}{'errors':>8}{'error %':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['writes']:>8}{result['wps']:>10.1f}{result['conflicts']:>7}{result['errors']:>8}"
+              f"{result['error_rate']:>9.2%}{result['p50']:>9.2f}{result['p99']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Query-plan regression check: fail if a hot page's SQL scans a whole table.
+
+Usage:
+    python benchmarks/check_plans.py                               # scratch SQLite
+    python benchmarks/check_plans.py --database-uri postgresql://localhost/skillswap_plans
+    python benchmarks/check_plans.py --verbose                     # print every plan
+
+The schema is built with the Alembic migrations (so the indexes checked are
+the ones production gets), filled with a small synthetic community, and the
+hot pages are requested through the test client while every SELECT they run
+is recorded. Each distinct statement is then EXPLAINed with the parameters
+it actually ran with:
+
+- SQLite: ``EXPLAIN QUERY PLAN``; a ``SCAN <table>`` step without an index
+  is a full table scan.
+- PostgreSQL: ``EXPLAIN (FORMAT JSON)`` with ``enable_seqscan`` off, so the
+  planner only picks a ``Seq Scan`` when no index can serve the query at
+  all, however small the tables are.
+
+Scans listed in ``ALLOWED`` are intended and don't count. The script exits
+with status 1 if anything else falls back to a table scan. The target
+database is wiped first, so only point --database-uri at a scratch database.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# (name, endpoint, url values, who); the requests page also covers the
+# dashboard's skill panels and the inbox/outbox queries
+SCENARIOS = [
+    ('dashboard', 'main.index', {}, 'user'),
+    ('browse', 'swaps.browse', {}, 'user'),
+    ('browse_skill', 'swaps.browse', {'skill': 'python'}, 'user'),
+    ('requests', 'swaps.manage_requests', {}, 'user'),
+    ('send_request', 'swaps.send_request', {'user_id': 'partner'}, 'user'),
+    ('profile', 'profile.view', {}, 'user'),
+    ('user_profile', 'main.view_user_profile', {'user_id': 'partner'}, 'user'),
+    ('api_users', 'api.list_users', {}, 'user'),
+    ('api_requests', 'api.list_requests', {}, 'user'),
+    ('api_received_pending', 'api.list_requests', {'box': 'received', 'status': 'pending'}, 'user'),
+    ('api_sent', 'api.list_requests', {'box': 'sent'}, 'user'),
+    ('search', 'main.search', {'q': 'user1'}, 'user'),
+    ('admin', 'admin.dashboard', {}, 'admin'),
+    ('admin_users', 'admin.manage_users', {}, 'admin'),
+    ('admin_swaps', 'admin.manage_swaps', {}, 'admin'),
+]
+
+# Scenarios that may answer with a redirect: the partner already has a
+# pending request from the user, so the form sends them back to browse.
+# Every other page must render (200).
+REDIRECTS = {'send_request'}
+
+# (scenario, table): why a full scan is expected there. An index scan that
+# only supplies the ORDER BY (``SCAN user USING INDEX ...``) already passes.
+ALLOWED = {}
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def sqlite_scans(connection, statement, parameters):
+    """``(tables scanned without an index, plan lines)`` on SQLite."""
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    lines = [row[3] for row in rows]
+    scans = [match.group(1) for match in map(_SQLITE_SCAN.match, lines) if match]
+    return scans, lines
+
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _walk(child)
+
+
+def postgresql_scans(connection, statement, parameters):
+    """``(tables scanned sequentially, plan lines)`` on PostgreSQL."""
+    connection.exec_driver_sql('SET enable_seqscan = off')
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(_walk(plan[0]['Plan']))
+    scans = [node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan']
+    lines = [' '.join(filter(None, (node['Node Type'], node.get('Relation Name'), node.get('Index Name'))))
+             for node in nodes]
+    return scans, lines
+
+
+EXPLAINERS = {'sqlite': sqlite_scans, 'postgresql': postgresql_scans}
+
+
+def build(app, args):
+    """Migrate a fresh schema and fill it; returns ``{who: (email, password)}`` and the partner id."""
+    from flask_migrate import upgrade
+    from app import db
+    from app.models import SwapRequest, User
+    from synthetic import PASSWORD, Community
+
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+        upgrade()
+        Community(users=args.users, seed=args.seed).load(tempfile.mkdtemp(prefix='check_plans'))
+        # Someone with requests in both directions, and a partner they've written to
+        swap = SwapRequest.query.join(User, User.id == SwapRequest.sender_id).filter(
+            User.is_admin == False).order_by(SwapRequest.id).first()
+        user, partner = db.session.get(User, swap.sender_id), swap.receiver_id
+        admin = User.query.filter_by(is_admin=True).first()
+        accounts = {'user': (user.email, PASSWORD), 'admin': (admin.email, PASSWORD)}
+        db.session.remove()
+    return accounts, partner
+
+
+def capture(app, accounts, partner, scenarios):
+    """Request each scenario and return ``{statement: (parameters, scenario names)}``."""
+    from flask import has_request_context, message_flashed, url_for
+    from sqlalchemy import event
+    from werkzeug.test import Client
+    from app import db
+
+    current = [None]
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current[0] and has_request_context() and not executemany \
+                and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.setdefault(statement, (parameters, set()))[1].add(current[0])
+
+    errors = []
+
+    def flashed(sender, message, category):
+        if current[0] and category == 'danger':
+            errors.append(message)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+    message_flashed.connect(flashed, app)
+
+    clients = {}
+    for who, (email, password) in accounts.items():
+        clients[who] = Client(app)
+        response = clients[who].post('/auth/login', data={'email': email, 'password': password})
+        assert response.status_code == 302, f'login as {email} failed ({response.status_code})'
+
+    try:
+        for name, endpoint, values, who in scenarios:
+            values = {key: partner if value == 'partner' else value for key, value in values.items()}
+            with app.test_request_context():
+                url = url_for(endpoint, **values)
+            current[0] = name
+            response = clients[who].get(url)
+            current[0] = None
+            # A page that failed and redirected with an error says nothing about its plans
+            expected = (200, 302) if name in REDIRECTS else (200,)
+            assert response.status_code in expected, f'{name}: {url} returned {response.status_code}'
+            assert not errors, f'{name}: {url} flashed {errors[0]!r}'
+    finally:
+        message_flashed.disconnect(flashed, app)
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def check(app, statements, verbose=False):
+    """EXPLAIN every statement; returns the unexpected ``(scenario, table, statement)`` scans."""
+    from app import db
+
+    with app.app_context():
+        explain = EXPLAINERS.get(db.engine.dialect.name)
+        if explain is None:
+            sys.exit(f'No plan check for {db.engine.dialect.name}; use SQLite or PostgreSQL.')
+        failures = []
+        with db.engine.connect() as connection:
+            for statement, (parameters, names) in statements.items():
+                scans, lines = explain(connection, statement, parameters)
+                unexpected = [(name, table) for name in sorted(names) for table in scans
+                              if (name, table) not in ALLOWED]
+                failures.extend((name, table, statement) for name, table in unexpected)
+                if verbose or unexpected:
+                    print(f"{'FAIL' if unexpected else 'ok'}  [{', '.join(sorted(names))}] "
+                          f"{' '.join(statement.split())[:200]}")
+                    for line in lines:
+                        print(f'        {line}')
+            connection.rollback()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--only', help='Comma-separated scenario names to check.')
+    parser.add_argument('--verbose', action='store_true', help='Print the plan of every statement.')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='check_plans')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri or 'sqlite:///' + os.path.join(scratch, 'plans.db')
+    os.environ['SCHEMA_CHECK'] = 'false'  # the schema is migrated below
+    os.environ['PERF_SAMPLE_RATE'] = '0'
+    os.environ.setdefault('STATIC_BUILD_DIR', os.path.join(scratch, 'static-build'))
+
+    from app import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False  # the login POST has no form token
+    scenarios = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(','))
+        scenarios = [scenario for scenario in scenarios if scenario[0] in wanted]
+
+    accounts, partner = build(app, args)
+    statements = capture(app, accounts, partner, scenarios)
+    failures = check(app, statements, args.verbose)
+
+    per_scenario = defaultdict(set)
+    for name, table, _ in failures:
+        per_scenario[name].add(table)
+    print(f'{len(statements)} distinct statements from {len(scenarios)} pages explained')
+    for name, tables in sorted(per_scenario.items()):
+        print(f"  {name}: full scan of {', '.join(sorted(tables))}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Deterministic synthetic community: users, their skills and a swap history.
+
+Usage:
+    python benchmarks/synthetic.py --users 10000 --out /tmp/community
+    flask data import users /tmp/community/users.jsonl    # then skills, swaps
+
+The same ``--seed`` always produces the same files. Skill names, locations
+and swap partners are drawn from Zipf-like distributions, so a few skills
+and cities dominate and a few users attract most requests, much as they
+do on a real site. Every user's password is ``password`` and ``user0`` is
+an admin. Timestamps count back from ``--anchor``, not from today, so the
+output doesn't drift from one day to the next.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+PASSWORD = 'password'
+ANCHOR = datetime(2025, 1, 1)
+
+SUBJECTS = [
+    'python', 'guitar', 'cooking', 'photography', 'spanish', 'french', 'piano', 'yoga',
+    'drawing', 'painting', 'javascript', 'marketing', 'design', 'writing', 'chess', 'baking',
+    'gardening', 'running', 'swimming', 'singing', 'dancing', 'knitting', 'pottery', 'welding',
+    'german', 'japanese', 'excel', 'sql', 'rust', 'violin', 'drums', 'calligraphy', 'sewing',
+    'woodworking', 'climbing', 'surfing', 'public speaking', 'video editing', 'accounting', 'react',
+]
+LEVELS = ['', 'beginner ', 'advanced ', 'conversational ', 'jazz ', 'classical ', 'street ', 'vegan ']
+CITIES = [
+    'London', 'New York', 'Berlin', 'Mumbai', 'Toronto', 'Sydney', 'Paris', 'Madrid', 'Lagos',
+    'Sao Paulo', 'Tokyo', 'Seoul', 'Chicago', 'Dublin', 'Austin', 'Lisbon', 'Nairobi', 'Pune',
+    'Amsterdam', 'Vancouver', 'Cape Town', 'Manila', 'Warsaw', 'Boston', 'Mexico City',
+]
+AVAILABILITY = ['Weekends', 'Evenings', 'Weekday mornings', 'Flexible', 'Weekends, Evenings', None]
+# pending, accepted, rejected, completed
+STATUS_WEIGHTS = [0.35, 0.2, 0.15, 0.3]
+
+
+def password_hash(password, salt):
+    """A werkzeug-compatible hash with a fixed salt, so output is reproducible."""
+    iterations = 1000  # fake accounts; keeps logins cheap in benchmarks
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f'pbkdf2:sha256:{iterations}${salt}${digest}'
+
+
+def zipf_weights(n, skew=1.1):
+    """Cumulative Zipf weights, for ``random.choices(cum_weights=...)``."""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def skill_names(count, seed=0):
+    """``count`` distinct skill names, most popular first."""
+    rng = random.Random(seed)
+    names = [f'{level}{subject}'.strip() for subject in SUBJECTS for level in LEVELS]
+    rng.shuffle(names)
+    extra = 0
+    while len(names) < count:
+        extra += 1
+        names.append(f'{rng.choice(SUBJECTS)} {extra}')
+    return [name.title() for name in names[:count]]
+
+
+class Community:
+    """Generated records in the ``flask data import`` formats, as generators.
+
+    ``users()``, ``skills()`` and ``swaps()`` each start from their own seed,
+    so any one of them can be regenerated alone.
+    """
+
+    def __init__(self, users=1000, skills=500, per_user=3, swaps_per_user=2, skew=1.1, seed=42,
+                 anchor=ANCHOR, days=365):
+        self.count = users
+        self.names = skill_names(skills, seed)
+        self.skill_weights = zipf_weights(skills, skew)
+        self.per_user = per_user
+        self.swaps_per_user = swaps_per_user
+        self.skew = skew
+        self.seed = seed
+        self.anchor = anchor
+        self.days = days
+
+    def username(self, i):
+        return f'user{i}'
+
+    def _created(self, rng, after=None):
+        start = after or self.anchor - timedelta(days=self.days)
+        span = max((self.anchor - start).total_seconds(), 1)
+        return start + timedelta(seconds=int(rng.random() * span))
+
+    def _joined(self, i):
+        # Ids grow with sign-up time, as they would on a real site
+        return self.anchor - timedelta(days=self.days) + timedelta(
+            seconds=int(i * self.days * 86400 / max(self.count, 1)))
+
+    def users(self):
+        # One hash for everyone: hashing per user would dominate generation time
+        hashed = password_hash(PASSWORD, f'synthetic{self.seed}')
+        rng = random.Random(self.seed)
+        city_weights = zipf_weights(len(CITIES))
+        for i in range(self.count):
+            yield {
+                'username': self.username(i),
+                'email': f'user{i}@example.com',
+                'password_hash': hashed,
+                'is_public': i == 0 or rng.random() < 0.9,
+                'is_admin': i == 0,
+                'location': rng.choices(CITIES, cum_weights=city_weights)[0],
+                'bio': f'Hi, I am user {i}.' if rng.random() < 0.6 else None,
+                'availability': rng.choice(AVAILABILITY),
+                'created_at': self._joined(i).isoformat(),
+            }
+
+    def skills(self):
+        rng = random.Random(self.seed + 1)
+        for i in range(self.count):
+            joined = self._joined(i)
+            for role in ('offered', 'wanted'):
+                count = max(1, int(rng.expovariate(1 / self.per_user)))
+                for name in sorted(set(rng.choices(self.names, cum_weights=self.skill_weights, k=count))):
+                    yield {
+                        'user': self.username(i),
+                        'skill': name,
+                        'role': role,
+                        'availability': rng.choice(AVAILABILITY),
+                        'created_at': self._created(rng, after=joined).isoformat(),
+                    }
+
+    def swaps(self):
+        rng = random.Random(self.seed + 2)
+        # Popular receivers: a user's appeal is Zipf-distributed over a shuffled order
+        popular = list(range(self.count))
+        rng.shuffle(popular)
+        appeal = zipf_weights(self.count, self.skew)
+        statuses = ['pending', 'accepted', 'rejected', 'completed']
+        for _ in range(self.count * self.swaps_per_user):
+            sender = rng.randrange(self.count)
+            receiver = rng.choices(popular, cum_weights=appeal)[0]
+            if receiver == sender:
+                continue
+            created = self._created(rng, after=max(self._joined(sender), self._joined(receiver)))
+            status = rng.choices(statuses, weights=STATUS_WEIGHTS)[0]
+            yield {
+                'sender': self.username(sender),
+                'receiver': self.username(receiver),
+                'message': f'Hi {self.username(receiver)}, want to swap skills?',
+                'status': status,
+                'created_at': created.isoformat(),
+                'feedback': 'Great session!' if status == 'completed' and rng.random() < 0.5 else None,
+            }
+
+    def write(self, directory):
+        """Write ``users.jsonl``, ``skills.jsonl`` and ``swaps.jsonl``; returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        paths = {}
+        for kind in ('users', 'skills', 'swaps'):
+            paths[kind] = os.path.join(directory, f'{kind}.jsonl')
+            with open(paths[kind], 'w', encoding='utf-8') as out:
+                for record in getattr(self, kind)():
+                    out.write(json.dumps(record) + '\n')
+        return paths
+
+    def load(self, directory, batch_size=2000):
+        """Write the files and import them into the current app's database."""
+        from app.transfer import import_records
+
+        paths = self.write(directory)
+        return {kind: import_records(kind, path, batch_size=batch_size, restart=True)
+                for kind, path in paths.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--skills', type=int, default=500, help='Distinct skill names in the catalog.')
+    parser.add_argument('--per-user', type=int, default=3, help='Mean skills offered and wanted per user.')
+    parser.add_argument('--swaps-per-user', type=int, default=2)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for skills, cities and partners.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', type=datetime.fromisoformat, default=ANCHOR,
+                        help='Newest timestamp in the data (default 2025-01-01).')
+    parser.add_argument('--out', required=True, help='Directory for the JSONL files.')
+    args = parser.parse_args()
+
+    community = Community(users=args.users, skills=args.skills, per_user=args.per_user,
+                          swaps_per_user=args.swaps_per_user, skew=args.skew, seed=args.seed,
+                          anchor=args.anchor)
+    for kind, path in community.write(args.out).items():
+        print(f'{kind:<7} {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -33,5 +33,13 @@ echo "=> Running DB migrations (flask db upgrade)"
 export FLASK_APP=${FLASK_APP:-run.py}
 flask db upgrade
 
+echo "=> Resetting metrics directory"
+# Workers share /metrics through per-process files here; start from empty
+export METRICS_DIR=${METRICS_DIR:-/tmp/skillswap-metrics}
+rm -rf "$METRICS_DIR"
+mkdir -p "$METRICS_DIR"
+
 echo "=> Starting Gunicorn"
-exec gunicorn -w ${GUNICORN_WORKERS:-4} -b 0.0.0.0:${PORT:-5000} run:app
+# Workers, threads, preload and recycling are set in gunicorn.conf.py
+# (WEB_WORKER_MODE=sync|threaded, GUNICORN_WORKERS, WEB_THREADS, PORT)
+exec gunicorn -c gunicorn.conf.py run:app
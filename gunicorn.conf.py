@@ -0,0 +1,65 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py run:app``.
+
+WEB_WORKER_MODE picks how requests are spread:
+
+- ``sync`` (default): one request at a time per process, with
+  GUNICORN_WORKERS processes (2 x CPUs + 1).
+- ``threaded``: gthread workers, GUNICORN_WORKERS processes (CPUs + 1) with
+  WEB_THREADS threads (4) each. Pages spend most of their time waiting on the
+  database, so threads serve about as many requests as processes do, with less
+  memory and fewer connections.
+
+The worker and thread counts are exported before the app is loaded, so
+ProductionConfig can size each worker's connection pool to match.
+
+The app is loaded once in the master (``preload_app``). Workers share its
+memory copy-on-write, and a broken deploy fails before any worker starts.
+Each worker restarts after MAX_REQUESTS requests, plus a random jitter so
+they don't all restart together. That bounds slow leaks. On a restart or
+reload, a worker gets GRACEFUL_TIMEOUT seconds to finish its in-flight
+requests.
+"""
+import multiprocessing
+import os
+
+mode = os.getenv('WEB_WORKER_MODE', 'sync')
+cpus = multiprocessing.cpu_count()
+
+if mode == 'threaded':
+    worker_class = 'gthread'
+    workers = int(os.getenv('GUNICORN_WORKERS', cpus + 1))
+    threads = int(os.getenv('WEB_THREADS', 4))
+elif mode == 'sync':
+    worker_class = 'sync'
+    workers = int(os.getenv('GUNICORN_WORKERS', cpus * 2 + 1))
+    threads = 1
+else:
+    raise RuntimeError(f"Unknown WEB_WORKER_MODE {mode!r}; expected 'sync' or 'threaded'")
+
+os.environ['WEB_WORKERS'] = str(workers)
+os.environ['WEB_THREADS'] = str(threads)
+os.environ.setdefault('APP_ENV', 'production')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+preload_app = True
+max_requests = int(os.getenv('MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading (the schema check) belong to the
+    # master; drop this worker's references so it opens its own
+    from app import db
+
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from app.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -0,0 +1,209 @@
+"""normalize skill catalog into skill + user_skill
+
+Revision ID: 4c7d2a91e5f3
+Revises: b2e0e561ad0b
+Create Date: 2026-10-18 19:10:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7d2a91e5f3'
+down_revision = 'b2e0e561ad0b'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+legacy_skill = sa.table(
+    'skill_legacy',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('offered_by_id', sa.Integer),
+    sa.column('wanted_by_id', sa.Integer),
+    sa.column('availability', sa.String),
+)
+skill = sa.table(
+    'skill',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('normalized_name', sa.String),
+    sa.column('slug', sa.String),
+)
+user_skill = sa.table(
+    'user_skill',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('skill_id', sa.Integer),
+    sa.column('role', sa.String),
+    sa.column('availability', sa.String),
+)
+
+
+# Frozen copies of Skill.normalize/slugify so later model changes can't alter this migration
+def _normalize(name):
+    return ' '.join((name or '').split()).casefold()
+
+
+def _slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', _normalize(name)).strip('-') or 'skill'
+
+
+def _rename_pg_serial(bind, old_table, new_table):
+    # Postgres keeps the old pkey index and id sequence names on rename, which
+    # would clash with the ones created for the new table of the same name
+    if bind.dialect.name == 'postgresql':
+        op.execute(f'ALTER INDEX {old_table}_pkey RENAME TO {new_table}_pkey')
+        op.execute(f'ALTER SEQUENCE {old_table}_id_seq RENAME TO {new_table}_id_seq')
+
+
+def _reset_pg_sequence(bind, table):
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        )
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.rename_table('skill', 'skill_legacy')
+    _rename_pg_serial(bind, 'skill', 'skill_legacy')
+
+    op.create_table('skill',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('normalized_name', sa.String(length=100), nullable=False),
+    sa.Column('slug', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('skill', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_skill_normalized_name'), ['normalized_name'], unique=True)
+        batch_op.create_index(batch_op.f('ix_skill_slug'), ['slug'], unique=True)
+
+    op.create_table('user_skill',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('skill_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(length=10), nullable=False),
+    sa.Column('availability', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['skill_id'], ['skill.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'role', 'skill_id', name='uq_user_skill_user_role_skill')
+    )
+    with op.batch_alter_table('user_skill', schema=None) as batch_op:
+        batch_op.create_index('ix_user_skill_skill_role_user', ['skill_id', 'role', 'user_id'], unique=False)
+
+    # Backfill in id-ordered batches. Each legacy row keeps its id as the
+    # user_skill id so existing /profile/skill/<id> links stay valid.
+    catalog = {}
+    slugs = set()
+    seen = set()
+    next_skill_id = 1
+    next_extra_id = (bind.execute(sa.select(sa.func.max(legacy_skill.c.id))).scalar() or 0) + 1
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(legacy_skill)
+            .where(legacy_skill.c.id > last_id)
+            .order_by(legacy_skill.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        new_skills = []
+        entries = []
+        for row in rows:
+            normalized = _normalize(row.name)
+            if not normalized:
+                continue
+            if normalized not in catalog:
+                base = slug = _slugify(row.name)
+                suffix = 2
+                while slug in slugs:
+                    slug = f'{base}-{suffix}'
+                    suffix += 1
+                slugs.add(slug)
+                catalog[normalized] = next_skill_id
+                new_skills.append({
+                    'id': next_skill_id,
+                    'name': ' '.join(row.name.split()),
+                    'normalized_name': normalized,
+                    'slug': slug,
+                })
+                next_skill_id += 1
+
+            entry_id = row.id
+            for role, user_id in (('offered', row.offered_by_id), ('wanted', row.wanted_by_id)):
+                key = (user_id, role, catalog[normalized])
+                if user_id is None or key in seen:
+                    continue
+                seen.add(key)
+                if entry_id is None:
+                    entry_id, next_extra_id = next_extra_id, next_extra_id + 1
+                entries.append({
+                    'id': entry_id,
+                    'user_id': user_id,
+                    'skill_id': catalog[normalized],
+                    'role': role,
+                    'availability': row.availability,
+                })
+                entry_id = None
+
+        if new_skills:
+            op.bulk_insert(skill, new_skills)
+        if entries:
+            op.bulk_insert(user_skill, entries)
+
+    _reset_pg_sequence(bind, 'skill')
+    _reset_pg_sequence(bind, 'user_skill')
+
+    op.drop_table('skill_legacy')
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    op.create_table('skill_legacy',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('offered_by_id', sa.Integer(), nullable=True),
+    sa.Column('wanted_by_id', sa.Integer(), nullable=True),
+    sa.Column('availability', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['offered_by_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['wanted_by_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        sa.insert(legacy_skill).from_select(
+            ['id', 'name', 'offered_by_id', 'wanted_by_id', 'availability'],
+            sa.select(
+                user_skill.c.id,
+                skill.c.name,
+                sa.case((user_skill.c.role == 'offered', user_skill.c.user_id)),
+                sa.case((user_skill.c.role == 'wanted', user_skill.c.user_id)),
+                user_skill.c.availability,
+            ).select_from(user_skill.join(skill, user_skill.c.skill_id == skill.c.id))
+        )
+    )
+
+    with op.batch_alter_table('user_skill', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_skill_skill_role_user')
+    op.drop_table('user_skill')
+    with op.batch_alter_table('skill', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_skill_slug'))
+        batch_op.drop_index(batch_op.f('ix_skill_normalized_name'))
+    op.drop_table('skill')
+
+    op.rename_table('skill_legacy', 'skill')
+    _rename_pg_serial(bind, 'skill_legacy', 'skill')
+    _reset_pg_sequence(bind, 'skill')
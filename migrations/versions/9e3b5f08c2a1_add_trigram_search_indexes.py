@@ -0,0 +1,37 @@
+"""add trigram search indexes
+
+Revision ID: 9e3b5f08c2a1
+Revises: 4c7d2a91e5f3
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b5f08c2a1'
+down_revision = '4c7d2a91e5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm GIN indexes serve both LIKE '%q%' and the similarity operator.
+    # Other databases search through app.search's in-process index instead.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_skill_normalized_name_trgm', 'skill', ['normalized_name'],
+                    postgresql_using='gin', postgresql_ops={'normalized_name': 'gin_trgm_ops'})
+    op.create_index('ix_user_username_trgm', 'user', ['username'],
+                    postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_user_username_trgm', table_name='user')
+    op.drop_index('ix_skill_normalized_name_trgm', table_name='skill')
@@ -4,7 +4,7 @@ from os.path import abspath, dirname
 sys.path.insert(0, dirname(abspath(__file__)))
 
 from app import create_app, db
-from app.models import User, Skill, SwapRequest
+from app.models import User, Skill, UserSkill, SwapRequest
 
 app = create_app()
 
@@ -22,9 +22,10 @@ with app.app_context():
     db.session.commit()
     
     # Create test skill
-    test_skill = Skill(
-        name='Python Programming',
-        offered_by_id=test_user.id
+    test_skill = UserSkill(
+        user_id=test_user.id,
+        skill=Skill.get_or_create('Python Programming'),
+        role='offered'
     )
     
     db.session.add(test_skill)
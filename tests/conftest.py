@@ -0,0 +1,87 @@
+import os
+import sys
+from os.path import abspath, dirname
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+PASSWORD = 'password'
+
+
+def make_app(tmp_path, **overrides):
+    """An app on ``tmp_path``'s database; call again for a second worker on the same data."""
+    from app import create_app
+    from app.config import Config
+
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp_path, 'test.db'),
+        'WTF_CSRF_ENABLED': False,
+        'SCHEMA_CHECK': False,
+        'STATIC_FINGERPRINT': False,
+        'PERF_SAMPLE_RATE': 0.0,
+        'PHOTO_EXECUTOR': 'inline',
+        'STORAGE_LOCAL_ROOT': str(tmp_path / 'uploads'),
+        **overrides,
+    }
+    return create_app(type('TestConfig', (Config,), settings))
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import db
+
+    app = make_app(tmp_path)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    # Flask 2.3's test_client trips over Werkzeug 3's missing __version__
+    from werkzeug.test import Client
+
+    return Client(app)
+
+
+def make_user(username, **fields):
+    from app import db
+    from app.models import User
+
+    user = User(username=username, email=f'{username}@example.com',
+                password_hash=generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000'), **fields)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username):
+    response = client.post('/auth/login', data={'email': f'{username}@example.com', 'password': PASSWORD})
+    assert response.status_code == 302
+
+
+def count_statements(app, client, path):
+    """How many SQL statements a GET of ``path`` runs."""
+    from app import db
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements)
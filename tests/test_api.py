@@ -0,0 +1,45 @@
+from app import db
+from app.models import SwapRequest, User
+from conftest import login, make_user
+
+
+def test_swap_actions_refuse_form_posts(app, client):
+    with app.app_context():
+        make_user('alice'), make_user('bob')
+        db.session.add(SwapRequest(sender_id=1, receiver_id=2))
+        db.session.commit()
+    login(client, 'bob')
+
+    # What a cross-site <form method=post> can send
+    response = client.post('/api/v1/requests/1/accept', data={'x': '1'})
+    assert response.status_code == 415
+    with app.app_context():
+        assert db.session.get(SwapRequest, 1).status == 'pending'
+
+    response = client.post('/api/v1/requests/1/accept', json={})
+    assert response.status_code == 200
+    assert response.get_json()['data']['status'] == 'accepted'
+
+
+def test_bulk_delete_users_takes_their_swaps(app, client):
+    with app.app_context():
+        make_user('admin', is_admin=True), make_user('alice'), make_user('bob')
+        db.session.add_all([SwapRequest(sender_id=2, receiver_id=3), SwapRequest(sender_id=3, receiver_id=1)])
+        db.session.commit()
+    login(client, 'admin')
+
+    response = client.post('/api/v1/admin/bulk-action', json={'action': 'delete', 'ids': [3]})
+    assert response.status_code == 200
+    with app.app_context():
+        assert SwapRequest.query.count() == 0
+        assert db.session.get(User, 1).pending_received_count == 0
+        assert db.session.get(User, 2).pending_sent_count == 0
+
+
+def test_bulk_actions_leave_the_skill_catalog_alone(app, client):
+    with app.app_context():
+        make_user('admin', is_admin=True)
+    login(client, 'admin')
+
+    response = client.post('/api/v1/admin/bulk-action', json={'model': 'skills', 'action': 'delete', 'ids': [1]})
+    assert response.status_code == 400
@@ -0,0 +1,27 @@
+from app import db
+from app.models import Skill, UserSkill
+from conftest import count_statements, login, make_user
+
+
+def add_users(count, start=0):
+    python, design = Skill.get_or_create('Python'), Skill.get_or_create('Design')
+    for i in range(start, start + count):
+        user = make_user(f'member{i}')
+        db.session.add_all([UserSkill(user_id=user.id, skill_id=python.id, role='offered'),
+                            UserSkill(user_id=user.id, skill_id=design.id, role='wanted')])
+    db.session.commit()
+
+
+def test_browse_statement_count_does_not_grow_with_page_size(app, client):
+    app.config.update(FRAGMENT_CACHE='none', USER_CACHE_TTL=0, ITEMS_PER_PAGE=50)
+    with app.app_context():
+        make_user('viewer')
+        add_users(1)
+    login(client, 'viewer')
+    client.get('/swaps/browse')  # warm up one-off lookups
+    one = count_statements(app, client, '/swaps/browse')
+
+    with app.app_context():
+        add_users(20, start=1)
+    many = count_statements(app, client, '/swaps/browse')
+    assert many == one
@@ -0,0 +1,51 @@
+from app import db
+from app.models import Skill, SwapRequest, User, UserSkill
+from conftest import login, make_app, make_user
+
+
+def test_dashboard_body_and_etag_come_from_the_same_user_row(app, client, tmp_path):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    first = client.get('/')
+    assert b'Add Your First Skill' in first.data
+
+    # Another worker adds a skill; this worker still has alice cached
+    other = make_app(tmp_path)
+    with other.app_context():
+        db.session.add(UserSkill(user_id=1, skill_id=Skill.get_or_create('Pottery').id, role='offered'))
+        db.session.commit()
+
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert b'Pottery' in second.data
+    assert client.get('/', headers={'If-None-Match': second.headers['ETag']}).status_code == 304
+
+
+def test_user_state_refreshes_the_loaded_user(app):
+    from app.conditional import user_state
+
+    with app.app_context():
+        user = make_user('alice')
+        assert user.version == 1  # loaded
+        db.session.execute(User.__table__.update().values(version=7, offered_count=3))
+        token, _ = user_state(user.id)
+        assert token == '1:7'
+        assert (user.version, user.offered_count) == (7, 3)
+
+
+def test_dashboard_shows_the_counterparts_current_name(app, client):
+    with app.app_context():
+        make_user('alice'), make_user('bob')
+        db.session.add(SwapRequest(sender_id=1, receiver_id=2))
+        db.session.commit()
+    login(client, 'bob')
+    first = client.get('/')
+    assert b'Request from alice' in first.data
+
+    with app.app_context():
+        db.session.get(User, 1).username = 'alicia'
+        db.session.commit()
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert b'Request from alicia' in second.data
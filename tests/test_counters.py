@@ -0,0 +1,17 @@
+from app import db
+from app.models import SwapRequest, User
+from conftest import make_user
+
+
+def test_deleting_a_user_with_swaps(app):
+    with app.app_context():
+        alice, bob = make_user('alice'), make_user('bob')
+        db.session.add(SwapRequest(sender_id=alice.id, receiver_id=bob.id))
+        db.session.commit()
+        assert bob.pending_received_count == 1
+
+        # The swap stays behind with sender_id NULL, counted for nobody
+        db.session.delete(alice)
+        db.session.commit()
+        assert SwapRequest.query.one().sender_id is None
+        assert db.session.get(User, bob.id).pending_received_count == 1
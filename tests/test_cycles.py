@@ -0,0 +1,22 @@
+from app import db
+from app.cycles import propose_cycle
+from app.models import Skill, SwapRequest, User, UserSkill
+from conftest import make_user
+
+
+def test_proposing_a_circle_only_sends_the_proposers_request(app):
+    with app.app_context():
+        users = [make_user(name) for name in ('ann', 'ben', 'cat')]
+        skills = [Skill.get_or_create(name) for name in ('Guitar', 'Cooking', 'Python')]
+        # ann wants Guitar from ben, ben wants Cooking from cat, cat wants Python from ann
+        for i, user in enumerate(users):
+            db.session.add_all([UserSkill(user_id=user.id, skill_id=skills[i].id, role='wanted'),
+                                UserSkill(user_id=user.id, skill_id=skills[i - 1].id, role='offered')])
+        db.session.commit()
+
+        swap = propose_cycle(db.session.get(User, 1), [1, 2, 3])
+        db.session.commit()
+        assert [(s.sender_id, s.receiver_id) for s in SwapRequest.query] == [(1, 2)]
+        assert 'ben learns Cooking from cat' in swap.message
+
+        assert propose_cycle(db.session.get(User, 1), [1, 2, 3]) is None
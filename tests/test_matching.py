@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.matching import SYNC_LOOKBACK, get_match_index, prune_change_log
+from app.models import Skill, UserSkill, UserSkillChange
+from conftest import make_user
+
+
+def test_prune_change_log_keeps_recent_entries_and_the_index_current(app):
+    with app.test_request_context():
+        alice, bob = make_user('alice'), make_user('bob')
+        skills = [Skill.get_or_create(f'skill {i}') for i in range(SYNC_LOOKBACK + 10)]
+        db.session.add_all(UserSkill(user_id=alice.id, skill_id=skill.id, role='offered') for skill in skills)
+        db.session.commit()
+        index = get_match_index()
+
+        old = datetime.utcnow() - timedelta(days=30)
+        UserSkillChange.query.update({'created_at': old})
+        db.session.commit()
+        assert prune_change_log(24) == 10
+        newest = db.session.query(db.func.max(UserSkillChange.id)).scalar()
+        assert db.session.query(db.func.min(UserSkillChange.id)).scalar() == newest - SYNC_LOOKBACK + 1
+
+        # New log ids keep rising, so the index still picks them up
+        db.session.add(UserSkill(user_id=bob.id, skill_id=skills[0].id, role='wanted'))
+        db.session.commit()
+        index.sync()
+        assert [match.user_id for match in index.matches_for(alice.id)] == [bob.id]
@@ -0,0 +1,65 @@
+import io
+import os
+
+from PIL import Image
+
+from conftest import login, make_user
+
+
+def image_bytes(size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def upload(client, data):
+    return client.post('/profile/upload_photo', data={'file': (io.BytesIO(data), 'me.png')})
+
+
+def stored_files(app):
+    return sorted(os.listdir(app.config['STORAGE_LOCAL_ROOT']))
+
+
+def work_files(app):
+    return os.listdir(app.extensions['photo_pipeline'].work_dir)
+
+
+def test_only_derivatives_reach_public_storage(app, client):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    assert upload(client, image_bytes()).status_code == 302
+
+    files = stored_files(app)
+    assert len(files) == 6
+    assert all(name.endswith(('.jpg', '.webp')) for name in files)
+    assert work_files(app) == []
+
+
+def test_failed_render_leaves_no_files(app, client):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    data = image_bytes((2000, 2000))
+    assert upload(client, data[:len(data) // 2]).status_code == 302  # header reads, pixels don't
+
+    assert stored_files(app) == []
+    assert work_files(app) == []
+
+
+def test_media_serves_only_finished_derivatives(app, client):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    upload(client, image_bytes())
+    name = stored_files(app)[0]
+    root = app.config['STORAGE_LOCAL_ROOT']
+    for other in ('legacy.png', f'{name}.tmp', 'abc.upload'):
+        with open(os.path.join(root, other), 'wb') as f:
+            f.write(b'x')
+
+    response = client.get(f'/media/{name}')
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    for other in ('legacy.png', f'{name}.tmp', 'abc.upload'):
+        assert client.get(f'/media/{other}').status_code == 404
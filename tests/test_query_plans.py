@@ -0,0 +1,16 @@
+import sys
+from os.path import abspath, dirname, join
+from types import SimpleNamespace
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+
+import check_plans  # noqa: E402
+from conftest import make_app  # noqa: E402
+
+
+def test_hot_pages_use_indexes(tmp_path):
+    # check_plans migrates and fills its own schema, so no `app` fixture here
+    app = make_app(tmp_path)
+    accounts, partner = check_plans.build(app, SimpleNamespace(users=60, seed=42))
+    statements = check_plans.capture(app, accounts, partner, check_plans.SCENARIOS)
+    assert check_plans.check(app, statements) == []
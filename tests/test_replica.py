@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import User
+from conftest import login, make_app, make_user
+
+STICKY = 0.3
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """An app with a read-only SQLite replica, its client and a ``sync()`` that catches it up."""
+    from werkzeug.test import Client
+
+    replica_path = os.path.join(tmp_path, 'replica.db')
+    app = make_app(tmp_path, SQLALCHEMY_BINDS={'replica': f'sqlite:///file:{replica_path}?mode=ro&uri=true'},
+                   REPLICA_STICKY_SECONDS=STICKY, REPLICA_RETRY_SECONDS=60)
+    with app.app_context():
+        db.create_all()
+
+    def sync():
+        # sqlite3's backup API: a plain file copy would miss what's still in the -wal file
+        result = app.test_cli_runner().invoke(args=['replica', 'sync'])
+        assert result.exit_code == 0, result.output
+
+    yield app, Client(app), sync, replica_path
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def get(app, client, path):
+    """GET ``path``; returns the response and the binds its statements ran on."""
+    binds = set()
+    with app.app_context():
+        engines = dict(db.engines)
+    listeners = {key: (lambda *args, key=key: binds.add(key or 'primary')) for key in engines}
+    for key, engine in engines.items():
+        event.listen(engine, 'before_cursor_execute', listeners[key])
+    try:
+        response = client.get(path)
+    finally:
+        for key, engine in engines.items():
+            event.remove(engine, 'before_cursor_execute', listeners[key])
+    assert response.status_code == 200
+    return response, binds
+
+
+def test_read_only_views_read_the_replica_until_the_user_writes(replicated):
+    app, client, sync, _ = replicated
+    with app.app_context():
+        make_user('reader'), make_user('writer')
+        sync()
+        make_user('latecomer')  # on the primary only: the replica lags
+    login(client, 'reader')
+    time.sleep(STICKY + 0.05)  # logging in is a write too
+
+    response, binds = get(app, client, '/search?q=latecomer')
+    assert 'replica' in binds
+    assert b'latecomer@' not in response.data and b'>latecomer<' not in response.data
+
+    assert client.post('/api/v1/requests', json={'receiver_id': 2}).status_code == 201
+    response, binds = get(app, client, '/search?q=latecomer')
+    assert binds == {'primary'}
+
+    time.sleep(STICKY + 0.05)
+    _, binds = get(app, client, '/search?q=latecomer')
+    assert 'replica' in binds
+
+
+def test_reads_fall_back_to_the_primary_when_the_replica_is_down(replicated):
+    app, client, sync, replica_path = replicated
+    with app.app_context():
+        make_user('reader')
+        sync()
+    login(client, 'reader')
+    time.sleep(STICKY + 0.05)
+
+    os.rename(replica_path, replica_path + '.gone')
+    with app.app_context():
+        db.engines['replica'].dispose()
+    _, binds = get(app, client, '/search?q=reader')
+    assert binds == {'primary'}
+    assert not app.extensions['replica'].available()
+
+
+def test_page_validators_reload_the_viewer_from_the_primary(replicated):
+    app, client, sync, _ = replicated
+    with app.app_context():
+        make_user('reader')
+        sync()
+    login(client, 'reader')
+    time.sleep(STICKY + 0.05)
+
+    # Changed on the primary behind this client's back; the replica hasn't seen it
+    with app.app_context():
+        db.session.get(User, 1).location = 'Lisbon'
+        db.session.commit()
+    response, _ = get(app, client, '/user/1')
+    assert b'Lisbon' in response.data
@@ -0,0 +1,35 @@
+from app import db
+from app.models import SwapRequest
+from conftest import count_statements, login, make_user
+
+
+def add_swaps(viewer_id, count, start=0):
+    for i in range(start, start + count):
+        other = make_user(f'member{i}')
+        db.session.add_all([SwapRequest(sender_id=other.id, receiver_id=viewer_id),
+                            SwapRequest(sender_id=viewer_id, receiver_id=other.id)])
+    db.session.commit()
+
+
+def statement_counts(app, client, path, username, **fields):
+    app.config.update(FRAGMENT_CACHE='none', USER_CACHE_TTL=0, ITEMS_PER_PAGE=50)
+    with app.app_context():
+        viewer_id = make_user(username, **fields).id
+        add_swaps(viewer_id, 1)
+    login(client, username)
+    client.get(path)  # warm up one-off lookups
+    one = count_statements(app, client, path)
+
+    with app.app_context():
+        add_swaps(viewer_id, 20, start=1)
+    return one, count_statements(app, client, path)
+
+
+def test_requests_statement_count_does_not_grow_with_page_size(app, client):
+    one, many = statement_counts(app, client, '/swaps/requests', 'viewer')
+    assert many == one
+
+
+def test_admin_swaps_statement_count_does_not_grow_with_page_size(app, client):
+    one, many = statement_counts(app, client, '/admin/swaps', 'boss', is_admin=True)
+    assert many == one
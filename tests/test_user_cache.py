@@ -0,0 +1,43 @@
+from sqlalchemy import event
+
+from app import db
+from app.fragments import get_fragment_cache
+from app.models import User
+from app.user_cache import load_user
+from conftest import login, make_app, make_user
+
+
+def test_cache_hit_runs_no_sql(app):
+    with app.app_context():
+        make_user('alice')
+        db.session.remove()
+        load_user('1')
+        db.session.remove()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert load_user('1').username == 'alice'
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        assert statements == []
+
+
+def test_cached_admin_flag_is_rechecked_after_another_worker_demotes(app, client, tmp_path):
+    with app.app_context():
+        make_user('boss', is_admin=True)
+        shared = get_fragment_cache()
+    login(client, 'boss')
+    assert client.get('/admin/').status_code == 200  # now cached in this worker
+
+    # A second worker sharing the fragment backend, as with FRAGMENT_CACHE=redis
+    other = make_app(tmp_path)
+    other.extensions['fragment_cache'] = shared
+    with other.app_context():
+        db.session.get(User, 1).is_admin = False
+        db.session.commit()
+
+    response = client.get('/admin/')
+    assert response.status_code == 302
+    assert '/auth/login' in response.headers['Location']